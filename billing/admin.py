@@ -4,7 +4,7 @@ from .models import Bill, Payment, ServiceType, BillItem, Expense
 
 @admin.register(ServiceType)
 class ServiceTypeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'base_price', 'is_active', 'created_at']
+    list_display = ['name', 'base_price', 'slot_capacity', 'is_active', 'created_at']
     readonly_fields = ['image_preview']
 
     def image_preview(self, obj):
@@ -18,10 +18,10 @@ class ServiceTypeAdmin(admin.ModelAdmin):
 
 @admin.register(Bill)
 class BillAdmin(admin.ModelAdmin):
-    list_display = ['bill_number', 'patient', 'bill_date', 'total_amount', 'status', 'created_at']
+    list_display = ['bill_number', 'patient', 'bill_date', 'total_amount', 'amount_paid', 'status', 'created_at']
     list_filter = ['status', 'bill_date', 'created_at']
     search_fields = ['bill_number', 'patient__first_name', 'patient__last_name']
-    readonly_fields = ['bill_number', 'created_at', 'updated_at']
+    readonly_fields = ['bill_number', 'amount_paid', 'change_given', 'created_at', 'updated_at']
     ordering = ['-created_at']
     
     fieldsets = (
@@ -29,7 +29,7 @@ class BillAdmin(admin.ModelAdmin):
             'fields': ('patient', 'bill_date', 'status', 'notes')
         }),
         ('Financial Details', {
-            'fields': ('subtotal', 'discount', 'tax', 'total_amount')
+            'fields': ('subtotal', 'discount', 'tax', 'total_amount', 'amount_paid', 'change_given')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
@@ -6,6 +6,7 @@ import random
 from decimal import Decimal
 
 from billing.models import ServiceType, Bill, BillItem, Payment
+from billing.services import create_bill_for_exams
 from patients.models import Patient, UltrasoundExam, FamilyGroup
 
 class Command(BaseCommand):
@@ -213,18 +214,22 @@ class Command(BaseCommand):
         
         bills_created = 0
         payments_created = 0
+
+        # Reserve all bill numbers in one round trip instead of one per bill
+        bill_numbers = iter(Bill.allocate_bill_numbers(len(exams))) if exams else iter(())
         
         for exam in exams:
-            # Create bill
-            bill = Bill.objects.create(
-                patient=exam.patient,
+            # Create bill together with its single item
+            bill = create_bill_for_exams(
+                exam.patient,
+                [exam],
+                bill_number=next(bill_numbers),
                 bill_date=exam.exam_date,
-                subtotal=exam.procedure_type.base_price,
                 discount=Decimal('0.00'),  # No discount as requested
                 tax=Decimal('0.00'),  # No tax for simplicity
-                total_amount=exam.procedure_type.base_price,
                 status='PAID',  # All bills are paid as requested
                 notes=f'Payment for {exam.procedure_type.name} examination',
+                item_notes=lambda exam: f'Service for {exam.exam_date}',
             )
             
             bills_created += 1
@@ -242,14 +247,5 @@ class Command(BaseCommand):
             )
             
             payments_created += 1
-            
-            # Create bill item
-            BillItem.objects.create(
-                bill=bill,
-                exam=exam,
-                service=exam.procedure_type,
-                amount=exam.procedure_type.base_price,
-                notes=f'Service for {exam.exam_date}',
-            )
         
         self.stdout.write(f'Created {bills_created} bills and {payments_created} payments')
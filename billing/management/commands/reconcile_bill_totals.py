@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from billing.models import Bill
+
+
+class Command(BaseCommand):
+    help = 'Verify the stored amount_paid/change_given/status of every bill against its payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help='Rewrite drifted bills from their payment rows (default: report only)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Bills written per UPDATE batch when fixing (default: 500)'
+        )
+
+    def handle(self, *args, **options):
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        bills = (
+            Bill.objects.annotate(
+                payments_total=Coalesce(Sum('payments__amount'), Value(0), output_field=money),
+                change_total=Coalesce(Sum('payments__change'), Value(0), output_field=money),
+            )
+            .only('id', 'bill_number', 'total_amount', 'amount_paid', 'change_given', 'status')
+            .order_by('id')
+        )
+
+        checked = 0
+        drifted = []
+        for bill in bills.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            # Cancelled bills keep their status; only their totals are checked
+            status = bill.status if bill.status == 'CANCELLED' else Bill.derive_status(bill.payments_total, bill.total_amount)
+            if (bill.amount_paid == bill.payments_total
+                    and bill.change_given == bill.change_total
+                    and bill.status == status):
+                continue
+            self.stdout.write(
+                f"{bill.bill_number}: paid {bill.amount_paid} -> {bill.payments_total}, "
+                f"change {bill.change_given} -> {bill.change_total}, status {bill.status} -> {status}"
+            )
+            bill.amount_paid = bill.payments_total
+            bill.change_given = bill.change_total
+            bill.status = status
+            bill.updated_at = timezone.now()
+            drifted.append(bill)
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS(f"Checked {checked} bill(s); all payment totals match."))
+            return
+
+        if not options['fix']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Checked {checked} bill(s); {len(drifted)} have drifted. Run with --fix to repair them."
+                )
+            )
+            return
+
+        with transaction.atomic():
+            Bill.objects.bulk_update(
+                drifted,
+                ['amount_paid', 'change_given', 'status', 'updated_at'],
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} bill(s); repaired {len(drifted)} drifted bill(s).")
+        )
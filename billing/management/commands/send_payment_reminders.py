@@ -1,28 +1,53 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from billing.models import Bill
+from billing.reminders import get_bills_due_for_reminder, run_payment_reminders
 
 class Command(BaseCommand):
     help = 'Send payment reminders for pending bills'
 
-    def handle(self, *args, **kwargs):
-        # Get all pending bills that haven't been paid
-        pending_bills = Bill.objects.filter(
-            status__in=['PENDING', 'PARTIAL']
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the bills that would be reminded without sending anything'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=None,
+            help='Maximum number of bills to remind in this run'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of worker threads used to render reminder emails (default: 4)'
+        )
+
+    def handle(self, *args, **options):
+        stats = run_payment_reminders(
+            limit=options['limit'],
+            concurrency=options['concurrency'],
+            dry_run=options['dry_run'],
         )
 
-        reminders_sent = 0
-        for bill in pending_bills:
-            if bill.send_payment_reminder():
-                reminders_sent += 1
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f'Successfully sent reminder for Bill #{bill.bill_number}'
-                    )
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"DRY RUN: Would send {stats['bills']} payment reminder(s)."
                 )
-            
-        self.stdout.write(
-            self.style.SUCCESS(
-                f'Successfully sent {reminders_sent} payment reminders'
             )
-        ) 
\ No newline at end of file
+            bills = get_bills_due_for_reminder()
+            if options['limit']:
+                bills = bills[:options['limit']]
+            for bill in bills:
+                self.stdout.write(f'  - Bill #{bill.bill_number}: {bill.patient.email}')
+        else:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Successfully queued {stats['queued']} payment reminders "
+                    f"({stats['sent']} delivered, {stats['retried']} to retry, {stats['failed']} failed)"
+                )
+            )
+
+        timings = ', '.join(f'{stage}: {seconds}s' for stage, seconds in stats['timings'].items())
+        self.stdout.write(f'Timings - {timings}')
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:22
+
+from django.db import migrations, models
+
+
+def seed_bill_number_sequence(apps, schema_editor):
+    """Start the bill number sequence after the highest existing bill number."""
+    Bill = apps.get_model('billing', 'Bill')
+    NumberSequence = apps.get_model('billing', 'NumberSequence')
+    highest = 0
+    for bill_number in Bill.objects.filter(bill_number__startswith='BILL').values_list('bill_number', flat=True):
+        suffix = bill_number[4:]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    NumberSequence.objects.update_or_create(name='bill_number', defaults={'last_value': highest})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0013_expense'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_value', models.PositiveBigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_bill_number_sequence, migrations.RunPython.noop),
+    ]
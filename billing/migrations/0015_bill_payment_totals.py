@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:26
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_payment_totals(apps, schema_editor):
+    """Fill the new columns from the existing payment rows."""
+    Bill = apps.get_model('billing', 'Bill')
+    Payment = apps.get_model('billing', 'Payment')
+    totals = (
+        Payment.objects.values('bill_id')
+        .annotate(paid=Sum('amount'), change=Sum('change'))
+        .order_by()
+    )
+    bills = []
+    for row in totals:
+        bills.append(Bill(id=row['bill_id'], amount_paid=row['paid'] or 0, change_given=row['change'] or 0))
+    Bill.objects.bulk_update(bills, ['amount_paid', 'change_given'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0014_numbersequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bill',
+            name='amount_paid',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='bill',
+            name='change_given',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_payment_totals, migrations.RunPython.noop),
+    ]
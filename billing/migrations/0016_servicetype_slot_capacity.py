@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0015_bill_payment_totals'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='servicetype',
+            name='slot_capacity',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Appointments that can be booked per time slot'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0016_servicetype_slot_capacity'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['created_at', 'id'], name='bill_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bill',
+            index=models.Index(fields=['bill_date', 'id'], name='bill_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date', 'created_at', 'id'], name='expense_date_created_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+def clear_default_capacity(apps, schema_editor):
+    """0016 gave every service a limit of 1 that nobody chose; start them unlimited instead."""
+    ServiceType = apps.get_model('billing', 'ServiceType')
+    ServiceType.objects.filter(slot_capacity=1).update(slot_capacity=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('billing', '0017_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='servicetype',
+            name='slot_capacity',
+            field=models.PositiveSmallIntegerField(blank=True, help_text='Appointments that can be booked per time slot (leave blank for no limit)', null=True),
+        ),
+        migrations.RunPython(clear_default_capacity, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThan, GreaterThanOrEqual
 from django.utils import timezone
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
-from django.conf import settings
 from patients.models import Patient, UltrasoundExam, Appointment
+from patients.tracking import FieldTrackingMixin
+from patients.calendar_counts import update_loaded_status
+from patients.email_outbox import queue_email
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,13 +17,47 @@ class ServiceType(models.Model):
     base_price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to='service_images/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
+    slot_capacity = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Appointments that can be booked per time slot (leave blank for no limit)")
     created_at = models.DateTimeField(auto_now_add=True, null=True)
     updated_at = models.DateTimeField(auto_now=True, null=True)
 
     def __str__(self):
         return f"{self.name} - ₱{self.base_price}"
 
-class Bill(models.Model):
+class NumberSequence(models.Model):
+    """Named counter used to hand out document numbers without reading the last row."""
+    name = models.CharField(max_length=50, unique=True)
+    last_value = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_value}"
+
+    @classmethod
+    def reserve(cls, name, count=1, initial=0):
+        """
+        Atomically reserve `count` consecutive values and return the first one.
+        The counter is bumped with a single UPDATE ... SET last_value = last_value + n
+        before it is read, so concurrent callers always get disjoint ranges (the
+        UPDATE takes the row lock on PostgreSQL and the write lock on SQLite).
+        `initial` (a value or a callable) seeds the counter the first time it is used.
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with transaction.atomic():
+            updated = cls.objects.filter(name=name).update(last_value=F('last_value') + count)
+            if not updated:
+                start = initial() if callable(initial) else initial
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, last_value=start + count)
+                except IntegrityError:
+                    # Another worker created the sequence first; take the next range from it
+                    cls.objects.filter(name=name).update(last_value=F('last_value') + count)
+            last_value = cls.objects.filter(name=name).values_list('last_value', flat=True).get()
+        return last_value - count + 1
+
+class Bill(FieldTrackingMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('PARTIAL', 'Partially Paid'),
@@ -50,86 +87,219 @@ class Bill(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     last_reminder_sent = models.DateTimeField(null=True, blank=True)
 
+    # Running payment totals, only written by Payment.save/delete and
+    # refresh_payment_totals (see the reconcile_bill_totals command)
+    amount_paid = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    change_given = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    PAYMENT_TOTAL_FIELDS = ('amount_paid', 'change_given')
+    tracked_fields = ('status',)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the bill list and billing report (patients/pagination.py)
+            models.Index(fields=['created_at', 'id'], name='bill_created_id_idx'),
+            models.Index(fields=['bill_date', 'id'], name='bill_date_id_idx'),
+        ]
+
     def __str__(self):
         return f"Bill #{self.bill_number} - {self.patient}"
 
+    BILL_NUMBER_SEQUENCE = 'bill_number'
+    BILL_NUMBER_PREFIX = 'BILL'
+
+    @classmethod
+    def format_bill_number(cls, value):
+        return f'{cls.BILL_NUMBER_PREFIX}{str(value).zfill(6)}'
+
+    @classmethod
+    def get_highest_bill_number(cls):
+        """Largest numeric suffix among existing bill numbers (used to seed the sequence)."""
+        highest = 0
+        for bill_number in cls.objects.filter(bill_number__startswith=cls.BILL_NUMBER_PREFIX).values_list('bill_number', flat=True):
+            suffix = bill_number[len(cls.BILL_NUMBER_PREFIX):]
+            if suffix.isdigit():
+                highest = max(highest, int(suffix))
+        return highest
+
+    @classmethod
+    def allocate_bill_numbers(cls, count=1):
+        """Reserve `count` consecutive bill numbers in one round trip (for bulk creation)."""
+        first = NumberSequence.reserve(cls.BILL_NUMBER_SEQUENCE, count, initial=cls.get_highest_bill_number)
+        return [cls.format_bill_number(value) for value in range(first, first + count)]
+
     def save(self, *args, **kwargs):
         if not self.bill_number:
-            last_bill = Bill.objects.order_by('-id').first()
-            if last_bill:
-                last_number = int(last_bill.bill_number[4:])
-                self.bill_number = f'BILL{str(last_number + 1).zfill(6)}'
-            else:
-                self.bill_number = 'BILL000001'
+            self.bill_number = self.allocate_bill_numbers(1)[0]
             
         self.total_amount = self.subtotal - self.discount + self.tax
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # A full save from a stale instance must not overwrite payment totals
+            # that were incremented in the database since it was loaded, nor the
+            # payment-derived status unless this instance changed it
+            skipped = set(self.PAYMENT_TOTAL_FIELDS)
+            if not self.has_field_changed('status'):
+                skipped.add('status')
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in skipped
+            ]
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def derive_status(amount_paid, total_amount):
+        if amount_paid >= total_amount:
+            return 'PAID'
+        if amount_paid > 0:
+            return 'PARTIAL'
+        return 'PENDING'
+
+    @staticmethod
+    def status_expression(amount_paid):
+        """SQL equivalent of derive_status for use in UPDATE statements (CANCELLED bills stay cancelled)."""
+        return Case(
+            When(status='CANCELLED', then=Value('CANCELLED')),
+            When(GreaterThanOrEqual(amount_paid, F('total_amount')), then=Value('PAID')),
+            When(GreaterThan(amount_paid, 0), then=Value('PARTIAL')),
+            default=Value('PENDING'),
+        )
+
     def calculate_totals(self):
-        """Calculate totals based on bill items"""
-        self.subtotal = sum(item.amount for item in self.items.all())
+        """Calculate totals based on bill items and re-derive the status against the stored amount paid"""
+        self.subtotal = self.items.aggregate(total=models.Sum('amount'))['total'] or 0
         self.total_amount = self.subtotal - self.discount + self.tax
-        self.save()
+        update_fields = ['subtotal', 'total_amount', 'updated_at']
+        if self.status != 'CANCELLED':
+            status = self.derive_status(self.amount_paid, self.total_amount)
+            if status != self.status:
+                self.status = status
+                update_fields.append('status')
+        self.save(update_fields=update_fields)
 
     def send_payment_reminder(self):
+        from .reminders import REMINDER_INTERVAL, render_payment_reminder
+
         if (self.last_reminder_sent and 
-            timezone.now() - self.last_reminder_sent < timezone.timedelta(days=7)):
+            timezone.now() - self.last_reminder_sent < REMINDER_INTERVAL):
             return False  # Don't send reminders more often than weekly
 
-        context = {
-            'bill': self,
-            'patient': self.patient,
-            'clinic_name': 'Ultrasound Clinic',
-            'clinic_phone': settings.CLINIC_PHONE,
-            'clinic_email': settings.DEFAULT_FROM_EMAIL,
-        }
-
-        subject = f'Payment Reminder - Bill #{self.bill_number}'
-        html_message = render_to_string('billing/email/payment_reminder.html', context)
-        plain_message = render_to_string('billing/email/payment_reminder_plain.txt', context)
+        subject, plain_message, html_message = render_payment_reminder(self)
 
         try:
-            send_mail(
+            queue_email(
                 subject=subject,
-                message=plain_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[self.patient.email],
-                html_message=html_message
+                body=plain_message,
+                recipients=[self.patient.email],
+                html_body=html_message
             )
             self.last_reminder_sent = timezone.now()
             self.save(update_fields=['last_reminder_sent'])
             return True
-        except Exception as e:
-            print(f"Failed to send payment reminder: {str(e)}")
+        except Exception:
+            logger.exception(f"Failed to queue payment reminder for bill {self.bill_number}")
             return False
 
     def update_status(self):
-        """Update bill status based on payments."""
-        total_paid = sum(payment.amount for payment in self.payments.all())
-        
-        if total_paid >= self.total_amount:
-            self.status = 'PAID'
-        elif total_paid > 0:
-            self.status = 'PARTIAL'
-        else:
-            self.status = 'PENDING'
-        
-        self.save()
+        """Update bill status based on the stored payment totals (a CANCELLED bill stays cancelled)."""
+        if self.status != 'CANCELLED':
+            self.status = self.derive_status(self.amount_paid, self.total_amount)
+        self.save(update_fields=['status', 'updated_at'])
+
+    @property
+    def balance_due(self):
+        return max(self.total_amount - self.amount_paid, 0)
 
     def is_fully_paid(self):
         """Check if the bill is fully paid."""
-        total_paid = sum(payment.amount for payment in self.payments.all())
-        return total_paid >= self.total_amount
+        return self.amount_paid >= self.total_amount
 
     def get_total_paid_before_payment(self, exclude_payment=None):
         """Get total amount paid excluding a specific payment (useful for change calculation)"""
-        if exclude_payment:
-            return sum(payment.amount for payment in self.payments.all() if payment != exclude_payment)
-        return sum(payment.amount for payment in self.payments.all())
+        if exclude_payment and exclude_payment.pk:
+            return self.payments.exclude(pk=exclude_payment.pk).aggregate(
+                total=Coalesce(Sum('amount'), Value(0), output_field=models.DecimalField())
+            )['total']
+        return self.amount_paid
 
     def get_total_change_given(self):
         """Get total change given to patient across all payments"""
-        return sum(payment.change for payment in self.payments.all())
+        return self.change_given
+
+    def complete_appointments(self):
+        """
+        Mark the appointments behind this bill's exams as COMPLETED.
+
+        An appointment matches an exam on patient, date, time and procedure name
+        (Appointment.procedure_type is free text, compared case-insensitively).
+        All matches are found with one query and completed with one UPDATE;
+        returns the number of appointments updated.
+        """
+        exams = list(self.items.values_list(
+            'exam_id', 'exam__patient_id', 'exam__exam_date', 'exam__exam_time', 'exam__procedure_type__name'
+        ))
+        if not exams:
+            return 0
+
+        matches = Q()
+        exam_keys = {}
+        for exam_id, patient_id, exam_date, exam_time, procedure_name in exams:
+            matches |= Q(
+                patient_id=patient_id,
+                appointment_date=exam_date,
+                appointment_time=exam_time,
+                procedure_type__iexact=procedure_name,
+            )
+            exam_keys.setdefault((patient_id, exam_date, exam_time, procedure_name.lower()), exam_id)
+
+        # Only update if not already completed/cancelled
+        open_statuses = ['PENDING', 'CONFIRMED']
+        with transaction.atomic():
+            appointments = list(
+                Appointment.objects.select_for_update(of=('self',))
+                .filter(matches, status__in=open_statuses).select_related('patient').order_by('id')
+            )
+            if not appointments:
+                return 0
+            appointments = update_loaded_status(
+                appointments, 'COMPLETED', open_statuses, completed_on=timezone.now()
+            )
+
+        for appointment in appointments:
+            exam_id = exam_keys.get((
+                appointment.patient_id,
+                appointment.appointment_date,
+                appointment.appointment_time,
+                appointment.procedure_type.lower(),
+            ))
+            logger.info(
+                f"Marked appointment {appointment.id} as COMPLETED after payment for bill {self.bill_number} "
+                f"(Patient: {appointment.patient}, Exam: {exam_id})"
+            )
+        return len(appointments)
+
+    def refresh_payment_totals(self, save=True):
+        """
+        Recompute amount_paid, change_given and status (unless CANCELLED) from the payment rows.
+        Used after payment edits/deletes and to repair drift; returns True if
+        anything changed.
+        """
+        totals = self.payments.aggregate(
+            paid=Coalesce(Sum('amount'), Value(0), output_field=models.DecimalField()),
+            change=Coalesce(Sum('change'), Value(0), output_field=models.DecimalField()),
+        )
+        # Cancelled bills keep their status, as in the reconcile_bill_totals command
+        status = self.status if self.status == 'CANCELLED' else self.derive_status(totals['paid'], self.total_amount)
+        changed = (
+            self.amount_paid != totals['paid']
+            or self.change_given != totals['change']
+            or self.status != status
+        )
+        self.amount_paid = totals['paid']
+        self.change_given = totals['change']
+        self.status = status
+        if save and changed:
+            self.save(update_fields=['amount_paid', 'change_given', 'status', 'updated_at'])
+        return changed
 
 class BillItem(models.Model):
     bill = models.ForeignKey(Bill, on_delete=models.CASCADE, related_name='items')
@@ -142,6 +312,8 @@ class BillItem(models.Model):
         return f"{self.service.name} - {self.exam.exam_date}"
 
     def save(self, *args, **kwargs):
+        # Single-item adds/edits keep the bill in sync; use
+        # billing.services.create_bill_for_exams to create many items at once.
         if not self.amount:
             self.amount = self.service.base_price
         super().save(*args, **kwargs)
@@ -184,54 +356,43 @@ class Payment(models.Model):
         return self.change
 
     def save(self, *args, **kwargs):
-        # Calculate change before saving
-        self.calculate_change()
-        super().save(*args, **kwargs)
-        
-        # Update bill status based on total payments
-        bill = self.bill
-        # Refresh bill from database to get current status
-        bill.refresh_from_db()
-        was_paid_before = bill.status == 'PAID'
-        
-        total_paid = sum(payment.amount for payment in bill.payments.all())
-        
-        if total_paid >= bill.total_amount:
-            bill.status = 'PAID'
-        elif total_paid > 0:
-            bill.status = 'PARTIAL'
-        else:
-            bill.status = 'PENDING'
-        
-        bill.save()
+        adding = self._state.adding
+        with transaction.atomic():
+            # Lock the bill row and work from its stored totals so concurrent
+            # payments on the same bill can't both compute change from stale sums
+            bill = self.bill
+            locked = (
+                Bill.objects.select_for_update()
+                .filter(pk=bill.pk)
+                .values('total_amount', 'amount_paid', 'change_given', 'status')
+                .get()
+            )
+            for field, value in locked.items():
+                setattr(bill, field, value)
+            bill._snapshot_tracked_fields(['status'])
+            was_paid_before = bill.status == 'PAID'
+
+            # Calculate change before saving
+            self.calculate_change()
+            super().save(*args, **kwargs)
+
+            if adding:
+                amount_paid = F('amount_paid') + self.amount
+                Bill.objects.filter(pk=bill.pk).update(
+                    amount_paid=amount_paid,
+                    change_given=F('change_given') + self.change,
+                    status=Bill.status_expression(amount_paid),
+                    updated_at=timezone.now(),
+                )
+                bill.refresh_from_db(fields=['amount_paid', 'change_given', 'status', 'updated_at'])
+            else:
+                # Edited payment: rebuild the totals from the payment rows
+                bill.refresh_payment_totals()
         
         # Automatically mark appointments as completed when bill becomes fully paid
         if bill.status == 'PAID' and not was_paid_before:
             try:
-                # Get all exams from bill items
-                bill_items = bill.items.select_related('exam', 'exam__patient', 'exam__procedure_type').all()
-                
-                for bill_item in bill_items:
-                    exam = bill_item.exam
-                    
-                    # Find matching appointment by patient, date, time, and procedure type name
-                    # Match appointment.procedure_type (TextField) with exam.procedure_type.name
-                    matching_appointments = Appointment.objects.filter(
-                        patient=exam.patient,
-                        appointment_date=exam.exam_date,
-                        appointment_time=exam.exam_time,
-                        procedure_type__iexact=exam.procedure_type.name,
-                        status__in=['PENDING', 'CONFIRMED']  # Only update if not already completed/cancelled
-                    )
-                    
-                    for appointment in matching_appointments:
-                        appointment.status = 'COMPLETED'
-                        appointment.save()
-                        logger.info(
-                            f"Marked appointment {appointment.id} as COMPLETED after payment for bill {bill.bill_number} "
-                            f"(Patient: {appointment.patient}, Exam: {exam.id})"
-                        )
-            
+                bill.complete_appointments()
             except Exception as e:
                 # Log error but don't prevent payment processing
                 logger.error(
@@ -239,6 +400,13 @@ class Payment(models.Model):
                     exc_info=True
                 )
 
+    def delete(self, *args, **kwargs):
+        bill = self.bill
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            bill.refresh_payment_totals()
+        return result
+
 
 class Expense(models.Model):
     """Model for tracking other business expenses"""
@@ -264,6 +432,9 @@ class Expense(models.Model):
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            models.Index(fields=['date', 'created_at', 'id'], name='expense_date_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - ₱{self.amount} ({self.date})"
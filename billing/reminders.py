@@ -0,0 +1,113 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.template.loader import get_template
+from django.utils import timezone
+
+from patients.email_outbox import build_email, send_queued_emails
+from patients.models import OutboundEmail
+from .models import Bill
+
+logger = logging.getLogger(__name__)
+
+# Don't send reminders for the same bill more often than weekly
+REMINDER_INTERVAL = timedelta(days=7)
+
+HTML_TEMPLATE = 'billing/email/payment_reminder.html'
+PLAIN_TEMPLATE = 'billing/email/payment_reminder_plain.txt'
+
+
+def get_bills_due_for_reminder(now=None):
+    """Unpaid bills with a patient email that haven't been reminded in the last week."""
+    now = now or timezone.now()
+    return (
+        Bill.objects.filter(status__in=['PENDING', 'PARTIAL'])
+        .filter(Q(last_reminder_sent__isnull=True) | Q(last_reminder_sent__lt=now - REMINDER_INTERVAL))
+        .exclude(patient__email__isnull=True)
+        .exclude(patient__email='')
+        .select_related('patient')
+        .order_by('id')
+    )
+
+
+def get_reminder_templates():
+    """Load and compile both reminder templates once per run."""
+    return get_template(HTML_TEMPLATE), get_template(PLAIN_TEMPLATE)
+
+
+def render_payment_reminder(bill, templates=None):
+    """Return (subject, plain_message, html_message) for a bill's reminder."""
+    html_template, plain_template = templates or get_reminder_templates()
+    context = {
+        'bill': bill,
+        'patient': bill.patient,
+        'clinic_name': 'Ultrasound Clinic',
+        'clinic_phone': settings.CLINIC_PHONE,
+        'clinic_email': settings.DEFAULT_FROM_EMAIL,
+    }
+    subject = f'Payment Reminder - Bill #{bill.bill_number}'
+    return subject, plain_template.render(context), html_template.render(context)
+
+
+def run_payment_reminders(limit=None, concurrency=4, dry_run=False, now=None):
+    """
+    Reminder pipeline: one query for the due bills (patients joined), render
+    every reminder in a thread pool with pre-compiled templates, queue them
+    with a single bulk insert, stamp `last_reminder_sent` with a single
+    UPDATE, then deliver the reminders this run queued (and nothing else
+    in the outbox) over one SMTP connection per batch.
+
+    Returns a dict with counts and per-stage timings (seconds).
+    """
+    now = now or timezone.now()
+    stats = {'bills': 0, 'queued': 0, 'sent': 0, 'retried': 0, 'failed': 0, 'timings': {}}
+
+    def timed(stage, started):
+        stats['timings'][stage] = round(time.monotonic() - started, 3)
+
+    started = time.monotonic()
+    bills = get_bills_due_for_reminder(now)
+    if limit:
+        bills = bills[:limit]
+    bills = list(bills)
+    stats['bills'] = len(bills)
+    timed('load', started)
+
+    if dry_run or not bills:
+        return stats
+
+    started = time.monotonic()
+    templates = get_reminder_templates()
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        rendered = list(pool.map(lambda bill: render_payment_reminder(bill, templates), bills))
+    timed('render', started)
+
+    started = time.monotonic()
+    emails = [
+        build_email(subject, plain_message, [bill.patient.email], html_body=html_message)
+        for bill, (subject, plain_message, html_message) in zip(bills, rendered)
+    ]
+    queued = OutboundEmail.objects.bulk_create(emails)
+    stats['queued'] = len(queued)
+    Bill.objects.filter(id__in=[bill.id for bill in bills]).update(last_reminder_sent=now)
+    timed('queue', started)
+
+    started = time.monotonic()
+    batch_size = settings.EMAIL_OUTBOX_BATCH_SIZE
+    queued_ids = [email.id for email in queued]
+    for offset in range(0, len(queued_ids), batch_size):
+        chunk = queued_ids[offset:offset + batch_size]
+        result = send_queued_emails(batch_size=batch_size, ids=chunk)
+        for key in ('sent', 'retried', 'failed'):
+            stats[key] += result[key]
+    timed('send', started)
+
+    logger.info(
+        f"Payment reminders: {stats['queued']} queued, {stats['sent']} sent, "
+        f"{stats['retried']} to retry, {stats['failed']} failed ({stats['timings']})"
+    )
+    return stats
@@ -0,0 +1,46 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Bill, BillItem
+
+
+def create_bill_for_exams(patient, exams, bill=None, item_notes=None, **bill_fields):
+    """
+    Create a bill with one item per exam.
+
+    The subtotal is summed from the new items before the bill is inserted, so
+    the bill is saved exactly once and all items go in with a single
+    bulk_create (BillItem.save, which recalculates the bill after every
+    single-item edit, is bypassed on purpose). `exams` should have
+    `procedure_type` selected; `item_notes` may be a callable taking an exam.
+    Extra keyword arguments are set on the bill (discount, tax, status, ...).
+    """
+    exams = list(exams)
+    bill = bill or Bill()
+    bill.patient = patient
+    for field, value in bill_fields.items():
+        setattr(bill, field, value)
+    if not bill.bill_date:
+        bill.bill_date = timezone.now().date()
+
+    items = [
+        BillItem(
+            exam=exam,
+            service=exam.procedure_type,
+            amount=exam.procedure_type.base_price,
+            notes=item_notes(exam) if item_notes else None,
+        )
+        for exam in exams
+    ]
+
+    with transaction.atomic():
+        bill.subtotal = sum((item.amount for item in items), Decimal('0'))
+        # Bill.save derives total_amount from subtotal, discount and tax
+        bill.save()
+        for item in items:
+            item.bill = bill
+        BillItem.objects.bulk_create(items)
+
+    return bill
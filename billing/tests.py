@@ -1,3 +1,120 @@
-from django.test import TestCase
+import datetime
+from decimal import Decimal
 
-# Create your tests here.
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from patients.email_outbox import queue_email
+from patients.models import OutboundEmail, Patient, UltrasoundExam
+
+from .models import Bill, BillItem, ServiceType
+from .reminders import get_bills_due_for_reminder, run_payment_reminders
+
+
+def make_patient(number, **fields):
+    values = {
+        'first_name': f'Patient{number}',
+        'last_name': 'Test',
+        'sex': 'F',
+        'region': '01',
+        'province': '0128',
+        'city': '012801',
+        'barangay': '1',
+        'street_address': 'Street',
+        'contact_number': '09170000000',
+        'email': f'patient{number}@example.com',
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+def make_bill(patient, status='PENDING', total=Decimal('1000.00'), **fields):
+    bill = Bill.objects.create(patient=patient, bill_date=datetime.date(2026, 1, 5), subtotal=total, **fields)
+    Bill.objects.filter(pk=bill.pk).update(status=status)
+    return bill
+
+
+@override_settings(EMAIL_OUTBOX_FLUSH_ON_COMMIT=False)
+class PaymentReminderTests(TestCase):
+    """Reminders go to unpaid bills with an email, at most weekly, and only they are delivered."""
+
+    NOW = timezone.make_aware(datetime.datetime(2026, 2, 1, 9, 0))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pending = make_bill(make_patient(1))
+        cls.partial = make_bill(make_patient(2), status='PARTIAL')
+        cls.reminded_long_ago = make_bill(make_patient(3), last_reminder_sent=cls.NOW - datetime.timedelta(days=8))
+        # Not due
+        make_bill(make_patient(4), status='PAID')
+        make_bill(make_patient(5), status='CANCELLED')
+        make_bill(make_patient(6, email=''))
+        make_bill(make_patient(7, email=None))
+        make_bill(make_patient(8), last_reminder_sent=cls.NOW - datetime.timedelta(days=2))
+
+    def test_selects_unpaid_bills_not_reminded_this_week(self):
+        self.assertEqual(
+            list(get_bills_due_for_reminder(self.NOW)),
+            [self.pending, self.partial, self.reminded_long_ago],
+        )
+
+    def test_queues_delivers_and_stamps_only_its_own_reminders(self):
+        other = queue_email('Unrelated', 'Body', ['someone@example.com'])
+
+        stats = run_payment_reminders(now=self.NOW)
+        self.assertEqual((stats['bills'], stats['queued'], stats['sent']), (3, 3, 3))
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['patient1@example.com', 'patient2@example.com', 'patient3@example.com'],
+        )
+        self.assertEqual(Bill.objects.filter(last_reminder_sent=self.NOW).count(), 3)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'PENDING')
+
+        # Everyone was just reminded
+        self.assertEqual(run_payment_reminders(now=self.NOW + datetime.timedelta(days=1))['bills'], 0)
+
+    def test_dry_run_queues_nothing(self):
+        stats = run_payment_reminders(dry_run=True, now=self.NOW)
+
+        self.assertEqual(stats['bills'], 3)
+        self.assertFalse(OutboundEmail.objects.exists())
+        self.assertFalse(Bill.objects.filter(last_reminder_sent=self.NOW).exists())
+
+    def test_single_bill_reminder_is_weekly(self):
+        self.assertTrue(self.pending.send_payment_reminder())
+        self.assertFalse(self.pending.send_payment_reminder())
+        self.assertEqual(OutboundEmail.objects.filter(recipients=['patient1@example.com']).count(), 1)
+
+
+class BillTotalsTests(TestCase):
+    """Recalculating a bill's totals keeps its status in line with what was paid."""
+
+    def setUp(self):
+        self.service = ServiceType.objects.create(name='Pelvic Ultrasound', base_price=Decimal('1000.00'))
+        self.patient = make_patient(1)
+        self.bill = make_bill(self.patient, total=Decimal('0'))
+
+    def add_item(self, amount):
+        exam = UltrasoundExam.objects.create(
+            patient=self.patient, procedure_type=self.service, exam_date=self.bill.bill_date,
+            exam_time=datetime.time(9, 0), referring_physician='Dr. Test',
+        )
+        BillItem.objects.create(bill=self.bill, exam=exam, service=self.service, amount=Decimal(amount))
+        self.bill.refresh_from_db()
+        self.bill.calculate_totals()
+        self.bill.refresh_from_db()
+
+    def test_status_follows_total(self):
+        Bill.objects.filter(pk=self.bill.pk).update(amount_paid=Decimal('1000.00'))
+        self.add_item('1000.00')
+        self.assertEqual(self.bill.status, 'PAID')
+
+        self.add_item('500.00')
+        self.assertEqual((self.bill.total_amount, self.bill.status), (Decimal('1500.00'), 'PARTIAL'))
+
+    def test_cancelled_bill_stays_cancelled(self):
+        Bill.objects.filter(pk=self.bill.pk).update(status='CANCELLED', amount_paid=Decimal('1000.00'))
+        self.add_item('1000.00')
+        self.assertEqual(self.bill.status, 'CANCELLED')
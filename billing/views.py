@@ -7,12 +7,16 @@ from django.db.models import Sum
 from django.contrib.auth.models import User
 from .models import Bill, Payment, ServiceType, BillItem
 from .forms import BillForm, PaymentForm
+from .services import create_bill_for_exams
 from patients.models import Patient, UltrasoundExam
 from patients.utils import generate_username, generate_password
+import logging
+
+logger = logging.getLogger(__name__)
 
 @login_required
 def bill_list(request):
-    bills = Bill.objects.all().order_by('-created_at').select_related(
+    bills = Bill.objects.all().select_related(
         'patient'
     ).prefetch_related(
         'items',
@@ -20,10 +24,11 @@ def bill_list(request):
         'items__exam'
     )
 
-    from django.core.paginator import Paginator
-    paginator = Paginator(bills, 10)  # Show 10 bills per page
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    from django.conf import settings
+    from patients.pagination import KeysetPaginator
+    paginator = KeysetPaginator(bills, ordering=('-created_at', '-id'), per_page=10,
+                                count_limit=settings.PAGINATION_COUNT_LIMIT)  # Show 10 bills per page
+    page_obj = paginator.get_page(request.GET)
 
     return render(request, 'billing/bill_list.html', {
         'bills': page_obj,
@@ -37,8 +42,8 @@ def bill_detail(request, bill_number):
     bill = get_object_or_404(Bill, bill_number=bill_number)
     bill_items = bill.items.all().select_related('exam', 'service')
     payments = bill.payments.all().order_by('-payment_date')
-    total_paid = sum(payment.amount for payment in payments)
-    total_change = bill.get_total_change_given()
+    total_paid = bill.amount_paid
+    total_change = bill.change_given
     
     if request.method == 'POST':
         payment_form = PaymentForm(request.POST)
@@ -51,9 +56,8 @@ def bill_detail(request, bill_number):
                     payment.created_by = request.user.get_full_name()
                     payment.save()
 
-                    # Check if bill is fully paid
-                    new_total_paid = total_paid + payment.amount
-                    if new_total_paid >= bill.total_amount and not bill.patient.user:
+                    # Check if bill is fully paid (payment.save refreshed the stored totals)
+                    if bill.is_fully_paid() and not bill.patient.user:
                         # Create user account for patient
                         patient = bill.patient
                         username = generate_username(patient.first_name, patient.last_name)
@@ -130,7 +134,7 @@ def create_bill(request, exam_id):
         patient=patient,
         exam_date=exam_date,
         bill_item__isnull=True  # Only get unbilled exams
-    ).order_by('exam_time')  # Order by time of procedure
+    ).select_related('procedure_type').order_by('exam_time')  # Order by time of procedure
     
     if not exams.exists():
         messages.warning(request, 'No unbilled procedures found for this date.')
@@ -157,40 +161,23 @@ def create_bill(request, exam_id):
             
         try:
             with transaction.atomic():
-                # Create the bill
-                bill = form.save(commit=False)
-                bill.patient = patient
-                bill.bill_date = timezone.now().date()
-                bill.subtotal = total_amount
-                
-                # Calculate final amount with discount and tax
+                # Create the bill and all of its items in one pass
                 discount = form.cleaned_data.get('discount', 0)
                 tax = form.cleaned_data.get('tax', 0)
-                bill.total_amount = total_amount - discount + tax
-                
-                bill.save()
-                print(f"DEBUG: Bill created with ID={bill.id}, bill_number={bill.bill_number}")  # Debug line
-                
-                # Create bill items for all unbilled exams on this date
-                for exam in exams:
-                    BillItem.objects.create(
-                        bill=bill,
-                        exam=exam,
-                        service=exam.procedure_type,
-                        amount=exam.procedure_type.base_price,
-                        notes=None  # Explicitly set notes to None
-                    )
-                
+                bill = create_bill_for_exams(
+                    patient,
+                    exams,
+                    bill=form.save(commit=False),
+                    bill_date=timezone.now().date(),
+                    discount=discount,
+                    tax=tax,
+                )
+
                 messages.success(request, f'Bill created successfully with {exams.count()} procedures.')
-                print(f"DEBUG: Redirecting to bill_detail with bill_number={bill.bill_number}")  # Debug line
-                response = redirect('billing:bill_detail', bill_number=bill.bill_number)
-                print(f"DEBUG: Redirect URL = {response['Location']}")  # Debug line
-                return response
+                return redirect('billing:bill_detail', bill_number=bill.bill_number)
         except Exception as e:
             messages.error(request, f'Error creating bill: {str(e)}')
-            # Print the full error for debugging
-            import traceback
-            print(f"Error creating bill: {traceback.format_exc()}")
+            logger.exception("Error creating bill for exam %s", exam_id)
             return redirect('billing:create_bill', exam_id=exam_id)
     else:
         # Pre-fill form with default values
@@ -53,4 +53,16 @@ class UltrasoundExamAdmin(admin.ModelAdmin):
     date_hierarchy = 'exam_date' 
 
 admin.site.register(Appointment)
-admin.site.register(UltrasoundImage)
\ No newline at end of file
+admin.site.register(UltrasoundImage)
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'sent_at', 'created_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+    readonly_fields = ('attempts', 'last_error', 'claim_token', 'sent_at', 'created_at', 'updated_at')
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_started_at', 'last_duration', 'last_succeeded', 'run_count')
+    readonly_fields = ('last_started_at', 'last_finished_at', 'last_duration', 'last_succeeded', 'last_error', 'run_count')
@@ -10,291 +10,142 @@ from django.views.decorators.http import require_POST
 from decimal import Decimal
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.conf import settings
 from .forms import StaffUserForm, StaffPasswordChangeForm, ServiceForm, StaffUserCreationForm
 from .views import require_valid_navigation, custom_staff_member_required, custom_admin_required
+from .routers import replica_reads, use_replica
+from .pagination import KeysetPaginator
+from .kpis import get_kpis, month_starts
+from .analytics_snapshot import analytics_snapshot
+from .geography import revenue_by_geography
 import json
 
+@use_replica()
 def get_analytics_context(start_date=None, end_date=None):
     """Helper function to generate analytics context data with optional date filtering"""
     today = timezone.now().date()
-    
-    # Base queryset filters
-    exam_filter = {}
-    bill_filter = {}
-    
-    if start_date:
-        exam_filter['exam_date__gte'] = start_date
-        bill_filter['bill_date__gte'] = start_date
-    
-    if end_date:
-        exam_filter['exam_date__lte'] = end_date
-        bill_filter['bill_date__lte'] = end_date
-
-    # Weekly revenue (always use week_start, not affected by global filter for this metric)
     week_start = today - timedelta(days=today.weekday())
-    weekly_bills = Bill.objects.filter(
-        bill_date__gte=week_start,
-        status__in=['PAID', 'PARTIAL']
-    )
-    weekly_total = weekly_bills.aggregate(Sum('total_amount'))['total_amount__sum']
-    weekly_revenue = "{:,.2f}".format(weekly_total if weekly_total else 0)
 
-    # Active patients in last 90 days (or filtered range)
-    if start_date and end_date:
-        active_patients_qs = UltrasoundExam.objects.filter(**exam_filter).values('patient').distinct()
-    else:
-        ninety_days_ago = today - timedelta(days=90)
-        active_patients_qs = UltrasoundExam.objects.filter(
-            exam_date__gte=ninety_days_ago
-        ).values('patient').distinct()
-    active_patients_90d = active_patients_qs.count()
-
-    # New patients this month (or filtered range)
-    if start_date and end_date:
-        new_patients_month = Patient.objects.filter(
-            created_at__date__gte=start_date,
-            created_at__date__lte=end_date
-        ).count()
-    else:
-        month_start = today.replace(day=1)
-        new_patients_month = Patient.objects.filter(created_at__date__gte=month_start).count()
-
-    # Average procedures per patient (apply filter)
-    exam_qs = UltrasoundExam.objects.filter(**exam_filter) if exam_filter else UltrasoundExam.objects.all()
-    distinct_patients_with_exam = exam_qs.values('patient').distinct().count()
-    total_exams = exam_qs.count()
-    avg_procs = (total_exams / distinct_patients_with_exam) if distinct_patients_with_exam else 0
-    avg_procedures_per_patient = f"{avg_procs:.2f}"
-
-    # Procedure distribution (apply filter)
-    procedures = exam_qs.values('procedure_type__name').annotate(count=Count('id'))
-    procedure_distribution_data = json.dumps([p['count'] for p in procedures])
-    procedure_distribution_labels = json.dumps([p['procedure_type__name'] for p in procedures])
-
-    # Findings distribution (apply filter)
-    findings = exam_qs.values('recommendations').annotate(count=Count('id'))
-    recommendation_map = dict(UltrasoundExam.RECOMMENDATION_CHOICES)
-    findings_distribution_data = json.dumps([f['count'] for f in findings])
-    findings_distribution_labels = json.dumps([recommendation_map.get(f['recommendations'], f['recommendations']) for f in findings])
-
-    # Daily revenue for current month navigation (NOT affected by filters)
-    daily_revenue_dates = []
-    daily_revenue_values = []
-
-    # Get data for last 12 months, organized by day
-    from datetime import datetime
-    for i in range(365):  # Get last year of data
-        date = today - timedelta(days=i)
-        daily_total = Bill.objects.filter(
-            bill_date=date,
-            status__in=['PAID', 'PARTIAL']
-        ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        daily_revenue_dates.append(date.strftime('%Y-%m-%d'))
-        daily_revenue_values.append(float(daily_total))
-
-    daily_revenue_dates.reverse()
-    daily_revenue_values.reverse()
-
-    daily_revenue_dates_json = json.dumps(daily_revenue_dates)
-    daily_revenue_values_json = json.dumps(daily_revenue_values)
-
-    # Daily procedures with procedure type breakdown (last 90 days for navigation)
-    daily_procedures = []
-    for i in range(90):  # Get last 90 days of data
-        date = today - timedelta(days=i)
-        day_exams = exam_qs.filter(exam_date=date)
-        
-        # Get procedure type breakdown for this day
-        procedure_breakdown = day_exams.values('procedure_type__name').annotate(count=Count('id'))
-        
-        daily_procedures.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'procedures': list(procedure_breakdown)
-        })
-
-    daily_procedures.reverse()
-    daily_procedures_json = json.dumps(daily_procedures)
-
-    # Demographics (not filtered by date - lifetime stats)
-    gender_counts = Patient.objects.values('sex').annotate(count=Count('id'))
-    gender_label_map = dict(Patient.GENDER_CHOICES)
-    gender_distribution_labels = [gender_label_map.get(g['sex'], g['sex']) for g in gender_counts]
-    gender_distribution_values = [g['count'] for g in gender_counts]
+    # Everything but the geography charts is answered from the in-memory snapshot
+    with analytics_snapshot() as snapshot:
+        # Weekly revenue (always use week_start, not affected by global filter for this metric)
+        weekly_revenue = "{:,.2f}".format(snapshot.revenue(week_start))
 
-    type_counts = Patient.objects.values('patient_type').annotate(count=Count('id'))
-    type_label_map = dict(Patient.PATIENT_TYPE_CHOICES)
-    patient_type_labels = [type_label_map.get(t['patient_type'], t['patient_type']) for t in type_counts]
-    patient_type_values = [t['count'] for t in type_counts]
-
-    # Age buckets (lifetime)
-    age_buckets = {'0-17': 0, '18-29': 0, '30-44': 0, '45-59': 0, '60+': 0}
-    for p in Patient.objects.exclude(birthday__isnull=True).only('birthday'):
-        try:
-            age = today.year - p.birthday.year - ((today.month, today.day) < (p.birthday.month, p.birthday.day))
-            if age < 18:
-                age_buckets['0-17'] += 1
-            elif age < 30:
-                age_buckets['18-29'] += 1
-            elif age < 45:
-                age_buckets['30-44'] += 1
-            elif age < 60:
-                age_buckets['45-59'] += 1
-            else:
-                age_buckets['60+'] += 1
-        except Exception:
-            continue
-    age_bucket_labels = list(age_buckets.keys())
-    age_bucket_values = list(age_buckets.values())
-
-    # Top patients by revenue (apply filter)
-    bill_qs = Bill.objects.filter(**bill_filter, status__in=['PAID', 'PARTIAL']) if bill_filter else Bill.objects.filter(status__in=['PAID', 'PARTIAL'])
-    
-    top_revenue = (
-        bill_qs.values('patient__first_name', 'patient__last_name')
-        .annotate(total=Sum('total_amount'))
-        .order_by('-total')[:10]
-    )
-    top_patients_labels = [f"{t['patient__first_name']} {t['patient__last_name']}".strip() for t in top_revenue]
-    top_patients_revenue = [float(t['total']) if t['total'] else 0 for t in top_revenue]
-
-    # Revenue by Procedure Type (apply filter)
-    from billing.models import BillItem
-    procedure_revenue = (
-        BillItem.objects.filter(bill__in=bill_qs, bill__status__in=['PAID', 'PARTIAL'])
-        .values('service__name')
-        .annotate(total_revenue=Sum('amount'), procedure_count=Count('id'))
-        .order_by('-total_revenue')
-    )[:10]
-    procedure_revenue_labels = [p['service__name'] for p in procedure_revenue]
-    procedure_revenue_values = [float(p['total_revenue']) if p['total_revenue'] else 0 for p in procedure_revenue]
-    procedure_revenue_counts = [p['procedure_count'] for p in procedure_revenue]
-
-    # Load region and city JSON data for decoding
-    import json as json_module
-    import os
-    from django.conf import settings
-    
-    def load_json_data(filename):
-        """Load JSON data from static files"""
-        try:
-            file_path = os.path.join(settings.BASE_DIR, 'static', 'philippine-addresses', filename)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json_module.load(f)
-        except:
-            return []
-    
-    regions_data = load_json_data('region.json')
-    cities_data = load_json_data('city.json')
-    
-    # Create mapping dictionaries
-    region_code_to_name = {r['region_code']: r['region_name'] for r in regions_data}
-    city_code_to_name = {c['city_code']: c['city_name'] for c in cities_data}
-
-    # Revenue by Region (apply filter and decode region codes to names)
-    location_revenue = (
-        bill_qs.exclude(patient__region__isnull=True)
-        .exclude(patient__region='')
-        .values('patient__region')
-        .annotate(total_revenue=Sum('total_amount'), patient_count=Count('patient', distinct=True))
-        .order_by('-total_revenue')
-    )
-    location_revenue_filtered = []
-    for l in location_revenue:
-        region_code = l['patient__region']
-        region_name = region_code_to_name.get(region_code, region_code)
-        # Include all entries with their decoded names
-        location_revenue_filtered.append({
-            'patient__region': region_name,
-            'total_revenue': l['total_revenue']
-        })
-    location_revenue_labels = [l['patient__region'] for l in location_revenue_filtered]
-    location_revenue_values = [float(l['total_revenue']) if l['total_revenue'] else 0 for l in location_revenue_filtered]
-
-    # Revenue by City (apply filter and decode city codes to names)
-    city_revenue = (
-        bill_qs.exclude(patient__city__isnull=True)
-        .exclude(patient__city='')
-        .values('patient__city')
-        .annotate(total_revenue=Sum('total_amount'), patient_count=Count('patient', distinct=True))
-        .order_by('-total_revenue')
-    )
-    city_revenue_filtered = []
-    for c in city_revenue:
-        city_code = c['patient__city']
-        # City codes are already in the correct format (6 digits like "012801")
-        city_name = city_code_to_name.get(city_code, city_code)
-        # Include all entries with their decoded names
-        city_revenue_filtered.append({
-            'patient__city': city_name,
-            'total_revenue': c['total_revenue']
-        })
-    city_revenue_filtered = city_revenue_filtered[:10]
-    city_revenue_labels = [c['patient__city'] for c in city_revenue_filtered]
-    city_revenue_values = [float(c['total_revenue']) if c['total_revenue'] else 0 for c in city_revenue_filtered]
-
-    # Revenue by Payment Method (apply filter)
-    payment_method_revenue = (
-        bill_qs.values('payments__payment_method')
-        .annotate(total_revenue=Sum('total_amount'), payment_count=Count('payments'))
-        .filter(payments__payment_method__isnull=False)
-        .order_by('-total_revenue')
-    )
-    payment_method_labels = [p['payments__payment_method'] for p in payment_method_revenue]
-    payment_method_values = [float(p['total_revenue']) if p['total_revenue'] else 0 for p in payment_method_revenue]
-
-    # Revenue by Patient Type (apply filter)
-    patient_type_revenue = (
-        bill_qs.values('patient__patient_type')
-        .annotate(total_revenue=Sum('total_amount'), patient_count=Count('patient', distinct=True))
-        .order_by('-total_revenue')
-    )
-    patient_type_map = dict(Patient.PATIENT_TYPE_CHOICES)
-    patient_type_revenue_labels = [patient_type_map.get(p['patient__patient_type'], p['patient__patient_type']) for p in patient_type_revenue]
-    patient_type_revenue_values = [float(p['total_revenue']) if p['total_revenue'] else 0 for p in patient_type_revenue]
-
-    # Monthly Revenue Trends (last 12 months - NOT affected by filters)
-    # Always show last 12 months regardless of filters
-    # Get other expenses from database
-    from billing.models import Expense
-    total_expenses = Expense.objects.aggregate(Sum('amount'))['amount__sum'] or Decimal('0')
-    
-    monthly_trends = []
-    monthly_net_trends = []
-    for i in range(12):
-        month_date = today.replace(day=1) - timedelta(days=30*i)
-        month_revenue = Bill.objects.filter(
-            bill_date__year=month_date.year,
-            bill_date__month=month_date.month,
-            status__in=['PAID', 'PARTIAL']
-        ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        month_expenses = Expense.objects.filter(
-            date__year=month_date.year,
-            date__month=month_date.month
-        ).aggregate(Sum('amount'))['amount__sum'] or 0
-        month_net_revenue = float(month_revenue) - float(month_expenses)
-        monthly_trends.append({'month': month_date.strftime('%b %Y'), 'revenue': float(month_revenue)})
-        monthly_net_trends.append({'month': month_date.strftime('%b %Y'), 'net_revenue': month_net_revenue})
-    monthly_trends.reverse()
-    monthly_net_trends.reverse()
-    
-    monthly_trend_labels = [m['month'] for m in monthly_trends]
-    monthly_trend_values = [m['revenue'] for m in monthly_trends]
-    monthly_net_trend_values = [m['net_revenue'] for m in monthly_net_trends]
-
-    # Insights for banners (apply filter)
-    revenue_total_raw = bill_qs.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    filtered_revenue_total = "{:,.2f}".format(revenue_total_raw)
-
-    top_proc_qs = exam_qs.values('procedure_type__name').annotate(count=Count('id')).order_by('-count')
-    filtered_top_procedure_name = top_proc_qs[0]['procedure_type__name'] if top_proc_qs else None
-    filtered_top_procedure_count = top_proc_qs[0]['count'] if top_proc_qs else 0
-
-    region_qs = bill_qs.values('patient__region').annotate(
-        total=Sum('total_amount')).order_by('-total')
-    if region_qs:
-        region_code = region_qs[0]['patient__region']
-        filtered_top_region_label = region_code_to_name.get(region_code, region_code)
-        filtered_top_region_revenue = "{:,.2f}".format(region_qs[0]['total'])
+        # Active patients in last 90 days and new patients this month (or filtered range)
+        if start_date and end_date:
+            active_patients_90d = snapshot.patients_seen(start_date, end_date)
+            new_patients_month = snapshot.new_patients(start_date, end_date)
+        else:
+            active_patients_90d = snapshot.patients_seen(today - timedelta(days=90))
+            new_patients_month = snapshot.new_patients(today.replace(day=1))
+
+        # Average procedures per patient (apply filter)
+        distinct_patients_with_exam = snapshot.patients_seen(start_date, end_date)
+        total_exams = snapshot.exam_count(start_date, end_date)
+        avg_procs = (total_exams / distinct_patients_with_exam) if distinct_patients_with_exam else 0
+        avg_procedures_per_patient = f"{avg_procs:.2f}"
+
+        # Returning patients and visit frequency (filtered range, else the last 6 months)
+        if start_date or end_date:
+            cohort = snapshot.visit_cohort(start_date, end_date)
+        else:
+            cohort = snapshot.visit_cohort(today - timedelta(days=180))
+        visit_frequency_labels, visit_frequency_values = cohort.frequency_histogram()
+
+        # Procedure distribution (apply filter)
+        procedures = snapshot.exams_by_procedure(start_date, end_date)
+        procedure_distribution_data = json.dumps([count for _, count in procedures])
+        procedure_distribution_labels = json.dumps([name for name, _ in procedures])
+
+        # Findings distribution (apply filter)
+        findings = snapshot.exams_by_finding(start_date, end_date)
+        recommendation_map = dict(UltrasoundExam.RECOMMENDATION_CHOICES)
+        findings_distribution_data = json.dumps([count for _, count in findings])
+        findings_distribution_labels = json.dumps([recommendation_map.get(code, code) for code, _ in findings])
+
+        # Daily revenue for the last year (NOT affected by filters)
+        first_day = today - timedelta(days=364)
+        daily_revenue_dates_json = json.dumps(
+            [(first_day + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(365)]
+        )
+        daily_revenue_values_json = json.dumps([float(total) for total in snapshot.daily_revenue(first_day, today)])
+
+        # Daily procedures with procedure type breakdown (last 90 days, empty outside the filter)
+        daily_procedures = []
+        for date, day_procedures in snapshot.daily_exams_by_procedure(today - timedelta(days=89), today):
+            if (start_date and date < start_date) or (end_date and date > end_date):
+                day_procedures = []
+            daily_procedures.append({
+                'date': date.strftime('%Y-%m-%d'),
+                'procedures': [{'procedure_type__name': name, 'count': count} for name, count in day_procedures],
+            })
+        daily_procedures_json = json.dumps(daily_procedures)
+
+        # Demographics (not filtered by date - lifetime stats)
+        gender_label_map = dict(Patient.GENDER_CHOICES)
+        gender_counts = snapshot.patients_by_sex()
+        gender_distribution_labels = [gender_label_map.get(sex, sex) for sex, _ in gender_counts]
+        gender_distribution_values = [count for _, count in gender_counts]
+
+        type_label_map = dict(Patient.PATIENT_TYPE_CHOICES)
+        type_counts = snapshot.patients_by_type()
+        patient_type_labels = [type_label_map.get(patient_type, patient_type) for patient_type, _ in type_counts]
+        patient_type_values = [count for _, count in type_counts]
+
+        # Age buckets (lifetime)
+        age_buckets = snapshot.age_buckets(today)
+        age_bucket_labels = [label for label, _ in age_buckets]
+        age_bucket_values = [count for _, count in age_buckets]
+
+        # Top patients by revenue (apply filter)
+        top_revenue = snapshot.top_patients(start_date, end_date)
+        top_patients_labels = [name for name, _ in top_revenue]
+        top_patients_revenue = [float(total) for _, total in top_revenue]
+
+        # Revenue by Procedure Type (apply filter)
+        procedure_revenue = snapshot.revenue_by_service(start_date, end_date)[:10]
+        procedure_revenue_labels = [name for name, _, _ in procedure_revenue]
+        procedure_revenue_values = [float(total) for _, total, _ in procedure_revenue]
+        procedure_revenue_counts = [count for _, _, count in procedure_revenue]
+
+        # Revenue by Payment Method (apply filter)
+        payment_method_revenue = snapshot.revenue_by_payment_method(start_date, end_date)
+        payment_method_labels = [method for method, _ in payment_method_revenue]
+        payment_method_values = [float(total) for _, total in payment_method_revenue]
+
+        # Revenue by Patient Type (apply filter)
+        patient_type_revenue = snapshot.revenue_by_patient_type(start_date, end_date)
+        patient_type_revenue_labels = [type_label_map.get(patient_type, patient_type) for patient_type, _ in patient_type_revenue]
+        patient_type_revenue_values = [float(total) for _, total in patient_type_revenue]
+
+        # Monthly Revenue Trends (last 12 calendar months - NOT affected by filters)
+        months = month_starts(today, 12)
+        monthly_trend_labels, monthly_trend_values, monthly_net_trend_values = [], [], []
+        for month_start, next_month in zip(months, months[1:] + [None]):
+            month_end = next_month - timedelta(days=1) if next_month else None
+            month_revenue = snapshot.revenue(month_start, month_end)
+            month_expenses = snapshot.expenses(month_start, month_end)
+            monthly_trend_labels.append(month_start.strftime('%b %Y'))
+            monthly_trend_values.append(float(month_revenue))
+            monthly_net_trend_values.append(float(month_revenue) - float(month_expenses))
+
+        # Insights for banners (apply filter)
+        filtered_revenue_total = "{:,.2f}".format(snapshot.revenue(start_date, end_date))
+        top_procedure = max(procedures, key=lambda procedure: procedure[1], default=(None, 0))
+        filtered_top_procedure_name, filtered_top_procedure_count = top_procedure
+
+    # Geography charts: one grouped query, rolled up region > province > city
+    geography = revenue_by_geography(start_date, end_date)
+    regions = [area for area in geography.regions if area.specified]
+    cities = [area for area in geography.cities() if area.specified][:10]
+    location_revenue_labels = [area.name for area in regions]
+    location_revenue_values = [float(area.revenue) for area in regions]
+    location_revenue_codes = [area.code for area in regions]
+    city_revenue_labels = [area.name for area in cities]
+    city_revenue_values = [float(area.revenue) for area in cities]
+    if regions:
+        filtered_top_region_label = regions[0].name
+        filtered_top_region_revenue = "{:,.2f}".format(regions[0].revenue)
     else:
         filtered_top_region_label = None
         filtered_top_region_revenue = None
@@ -304,6 +155,12 @@ def get_analytics_context(start_date=None, end_date=None):
         'active_patients_90d': active_patients_90d,
         'new_patients_month': new_patients_month,
         'avg_procedures_per_patient': avg_procedures_per_patient,
+        'returning_rate_percent': f"{cohort.returning_rate:.1f}",
+        'visit_frequency_labels': json.dumps(visit_frequency_labels),
+        'visit_frequency_values': json.dumps(visit_frequency_values),
+        'new_vs_returning_values': json.dumps([cohort.new_patients, cohort.repeat_patients]),
+        'visit_cohort_start': cohort.start,
+        'visit_cohort_end': cohort.end,
         'procedure_distribution_data': procedure_distribution_data,
         'procedure_distribution_labels': procedure_distribution_labels,
         'findings_distribution_data': findings_distribution_data,
@@ -324,6 +181,7 @@ def get_analytics_context(start_date=None, end_date=None):
         'procedure_revenue_counts': json.dumps(procedure_revenue_counts),
         'location_revenue_labels': json.dumps(location_revenue_labels),
         'location_revenue_values': json.dumps(location_revenue_values),
+        'location_revenue_codes': json.dumps(location_revenue_codes),
         'city_revenue_labels': json.dumps(city_revenue_labels),
         'city_revenue_values': json.dumps(city_revenue_values),
         'payment_method_labels': json.dumps(payment_method_labels),
@@ -443,18 +301,71 @@ def admin_analytics(request):
     
     return render(request, 'admin/analytics.html', context)
 
+@custom_admin_required
+def admin_analytics_geography(request):
+    """
+    Drill-down data for the Revenue by Region chart: the regions, a region's
+    provinces (?region=) or a province's cities (?region=&province=), for
+    bills dated start_date..end_date.
+    """
+    dates = {}
+    for param in ('start_date', 'end_date'):
+        value = request.GET.get(param)
+        if value:
+            try:
+                dates[param] = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                return JsonResponse({'success': False, 'error': f'Invalid {param}'}, status=400)
+
+    geography = revenue_by_geography(**dates)
+    region_code = request.GET.get('region')
+    province_code = request.GET.get('province')
+    parent = None
+    areas = geography.regions
+    if region_code is not None:
+        parent = geography.region(region_code)
+        if parent and province_code is not None:
+            parent = parent.child(province_code)
+        if parent is None:
+            return JsonResponse({'success': False, 'error': 'Unknown area'}, status=404)
+        areas = parent.children
+
+    return JsonResponse({
+        'success': True,
+        'area': parent.as_dict() if parent else None,
+        'areas': [area.as_dict() for area in areas],
+        'revenue': float(geography.revenue),
+        'patients': geography.patients,
+    })
+
+@custom_admin_required
+def admin_retention(request):
+    from .retention import get_retention_report
+
+    report = get_retention_report(refresh=request.GET.get('refresh') == '1')
+    horizon = range(1, settings.RETENTION_HORIZON_MONTHS + 1)
+    context = {
+        'report': report,
+        'horizon': horizon,
+        'follow_up_grace_days': settings.FOLLOW_UP_GRACE_DAYS,
+        'interval_labels': json.dumps([interval.procedure for interval in report.intervals]),
+        'interval_values': json.dumps([round(interval.average_days, 1) for interval in report.intervals]),
+    }
+    return render(request, 'admin/retention.html', context)
+
 @custom_admin_required
 def admin_dashboard(request):
-    # Get counts and recent data
-    total_patients = Patient.objects.count()
-    total_exams = UltrasoundExam.objects.count()
-    total_revenue = Bill.objects.filter(status='PAID').aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    pending_bills = Bill.objects.filter(status='PENDING').count()
+    # Get counts (shared, briefly cached KPI snapshot) and recent data
+    kpis = get_kpis()
+    total_patients = kpis.all_patients
+    total_exams = kpis.total_procedures
+    total_revenue = kpis.total_revenue
+    pending_bills = kpis.pending_bills
 
     # Billing status counts for chart
-    paid_bills = Bill.objects.filter(status='PAID').count()
-    partial_bills = Bill.objects.filter(status='PARTIAL').count()
-    overdue_bills = Bill.objects.filter(status='PENDING').count()  # Assuming pending are overdue for simplicity
+    paid_bills = kpis.paid_bills
+    partial_bills = kpis.partial_bills
+    overdue_bills = kpis.pending_bills  # Assuming pending are overdue for simplicity
 
     # Get recent patients
     recent_patients = Patient.objects.all().order_by('-created_at')[:5]
@@ -487,9 +398,8 @@ def admin_dashboard(request):
     return render(request, 'admin/dashboard.html', context)
 
 @custom_admin_required
+@replica_reads
 def admin_billing_report(request):
-    from django.core.paginator import Paginator
-
     # Get filter parameters
     date_range = request.GET.get('date_range', '')
     status = request.GET.get('status', '')
@@ -538,10 +448,10 @@ def admin_billing_report(request):
         except ValueError:
             pass
 
-    # Pagination - 10 bills per page
-    paginator = Paginator(bills.order_by('-bill_date'), 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Pagination - 10 bills per page, by cursor
+    paginator = KeysetPaginator(bills, ordering=('-bill_date', '-id'), per_page=10,
+                                count_limit=settings.PAGINATION_COUNT_LIMIT)
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'bills': page_obj,
@@ -580,6 +490,7 @@ def update_expenses(request):
         return JsonResponse({'success': False, 'error': 'Invalid expense value'})
 
 @custom_admin_required
+@replica_reads
 def admin_billing_export(request):
     from django.http import HttpResponse
     import xlsxwriter
@@ -744,14 +655,12 @@ def delete_expense(request):
 def get_expenses(request):
     try:
         from billing.models import Expense
-        from django.core.paginator import Paginator
         
         # Get filter parameters
         date_range = request.GET.get('expense_date_range', '')
-        page = request.GET.get('page', 1)
         
         # Start with all expenses
-        expenses = Expense.objects.all().order_by('-date', '-created_at')
+        expenses = Expense.objects.all()
         
         # Apply date range filter
         if date_range:
@@ -763,9 +672,10 @@ def get_expenses(request):
             except (ValueError, AttributeError):
                 pass
         
-        # Paginate expenses (5 per page)
-        paginator = Paginator(expenses, 5)
-        page_obj = paginator.get_page(page)
+        # Paginate expenses (5 per page) by cursor; ?page=N alone still works
+        paginator = KeysetPaginator(expenses, ordering=('-date', '-created_at', '-id'), per_page=5,
+                                    count_limit=settings.PAGINATION_COUNT_LIMIT)
+        page_obj = paginator.get_page(request.GET)
         
         # Convert to list of dictionaries
         expenses_data = []
@@ -783,12 +693,14 @@ def get_expenses(request):
             'expenses': expenses_data,
             'pagination': {
                 'current_page': page_obj.number,
-                'total_pages': paginator.num_pages,
-                'has_previous': page_obj.has_previous(),
-                'has_next': page_obj.has_next(),
-                'previous_page': page_obj.previous_page_number() if page_obj.has_previous() else None,
-                'next_page': page_obj.next_page_number() if page_obj.has_next() else None,
-                'total_count': paginator.count
+                'has_previous': page_obj.has_previous,
+                'has_next': page_obj.has_next,
+                'previous_page': page_obj.number - 1 if page_obj.has_previous and page_obj.number else None,
+                'next_page': page_obj.number + 1 if page_obj.has_next and page_obj.number else None,
+                'previous_cursor': page_obj.previous_cursor if page_obj.has_previous else None,
+                'next_cursor': page_obj.next_cursor if page_obj.has_next else None,
+                'total_count': page_obj.count,
+                'total_count_is_exact': page_obj.count_is_exact,
             }
         })
     except Exception as e:
@@ -808,8 +720,6 @@ def get_total_expenses(request):
 
 @custom_admin_required
 def admin_patient_list(request):
-    from django.core.paginator import Paginator
-    
     # Get search query
     search_query = request.GET.get('search', '').strip()
     
@@ -832,17 +742,14 @@ def admin_patient_list(request):
     active_patients = Patient.objects.filter(is_archived=False).count()
     today_patients = Patient.objects.filter(created_at__date=timezone.now().date()).count()
     
-    # Pagination - reset to page 1 if search is applied
-    if search_query:
-        page_number = 1  # Reset to first page when search is applied
-    else:
-        page_number = request.GET.get('page')
-    
-    paginator = Paginator(patients.order_by('-created_at'), 10)  # 10 patients per page
-    page_obj = paginator.get_page(page_number)
+    # Pagination - 10 patients per page, by cursor (a new search starts without one)
+    paginator = KeysetPaginator(patients, ordering=('-created_at', '-id'), per_page=10,
+                                count_limit=settings.PAGINATION_COUNT_LIMIT if search_query else None)
+    page_obj = paginator.get_page(request.GET)
     
     context = {
         'patients': page_obj,
+        'page_obj': page_obj,
         'search_query': search_query,
         'total_patients': total_patients,
         'archived_patients': archived_patients,
@@ -1012,9 +919,8 @@ def admin_change_user_password(request, user_id):
     return render(request, 'admin/change_user_password.html', context)
 
 @custom_admin_required
+@replica_reads
 def admin_examinations(request):
-    from django.core.paginator import Paginator
-    
     # Get search query
     search_query = request.GET.get('search', '').strip()
     export = request.GET.get('export', '')
@@ -1043,17 +949,14 @@ def admin_examinations(request):
     if export == 'excel':
         return admin_examinations_export(request, exams)
 
-    # Pagination - reset to page 1 if search is applied
-    if search_query:
-        page_number = 1  # Reset to first page when search is applied
-    else:
-        page_number = request.GET.get('page')
-    
-    paginator = Paginator(exams.order_by('-exam_date'), 10)  # 10 exams per page
-    page_obj = paginator.get_page(page_number)
+    # Pagination - 10 exams per page, by cursor (a new search starts without one)
+    paginator = KeysetPaginator(exams, ordering=('-exam_date', '-id'), per_page=10,
+                                count_limit=settings.PAGINATION_COUNT_LIMIT if search_query else None)
+    page_obj = paginator.get_page(request.GET)
 
     context = {
         'exams': page_obj,
+        'page_obj': page_obj,
         'search_query': search_query,
         'total_exams': total_exams,
         'completed_exams': completed_exams,
@@ -0,0 +1,90 @@
+"""
+Patient cohort metrics computed in the database.
+
+Per-patient visit counts are correlated subqueries on the patient table,
+grouped in SQL, so only a handful of histogram rows reach Python however
+many patients there are. Used by the dashboard KPIs (patients/kpis.py)
+and the admin analytics page.
+"""
+import dataclasses
+import datetime
+
+from django.db.models import BooleanField, Count, Exists, OuterRef, Q, Subquery, Value
+
+# Visit counts at or above this share the last histogram bucket ("5+")
+FREQUENCY_BUCKETS = 5
+
+
+@dataclasses.dataclass(frozen=True)
+class VisitCohort:
+    """Patients with at least one exam between `start` and `end` (inclusive, either open)."""
+    start: datetime.date
+    end: datetime.date
+    frequency: tuple  # ((visits in window, patients), ...) by ascending visits
+    new_patients: int  # first exam ever falls in the window
+    repeat_patients: int  # also had an exam before the window
+
+    @property
+    def patients_seen(self):
+        return sum(patients for _, patients in self.frequency)
+
+    @property
+    def returning_patients(self):
+        """Patients with two or more exams in the window."""
+        return sum(patients for visits, patients in self.frequency if visits >= 2)
+
+    @property
+    def returning_rate(self):
+        return self.returning_patients / self.patients_seen * 100 if self.patients_seen else 0
+
+    def frequency_histogram(self, buckets=FREQUENCY_BUCKETS):
+        """(labels, values) with visit counts of `buckets` or more folded into one bar."""
+        values = [0] * buckets
+        for visits, patients in self.frequency:
+            values[min(visits, buckets) - 1] += patients
+        labels = [str(visits) for visits in range(1, buckets)] + [f'{buckets}+']
+        return labels, values
+
+
+def visit_cohort(start=None, end=None):
+    """VisitCohort for an exam-date window, in one grouped query."""
+    from .models import Patient, UltrasoundExam
+
+    window = Q()
+    if start:
+        window &= Q(exam_date__gte=start)
+    if end:
+        window &= Q(exam_date__lte=end)
+    visits = (
+        UltrasoundExam.objects.filter(window, patient=OuterRef('pk'))
+        .order_by().values('patient').annotate(visits=Count('id')).values('visits')
+    )
+
+    if start:
+        # Anyone seen in the window has a stored last visit on or after its start
+        patients = Patient.objects.filter(last_visit_date__gte=start)
+        seen_before = Exists(UltrasoundExam.objects.filter(patient=OuterRef('pk'), exam_date__lt=start))
+    else:
+        patients = Patient.objects.filter(exam_count__gt=0)
+        seen_before = Value(False, output_field=BooleanField())
+    rows = (
+        patients.annotate(visits=Subquery(visits), seen_before=seen_before)
+        .filter(visits__gte=1)
+        .order_by().values('visits', 'seen_before')
+        .annotate(patients=Count('id'))
+    )
+
+    frequency, new_patients, repeat_patients = {}, 0, 0
+    for row in rows:
+        frequency[row['visits']] = frequency.get(row['visits'], 0) + row['patients']
+        if row['seen_before']:
+            repeat_patients += row['patients']
+        else:
+            new_patients += row['patients']
+    return VisitCohort(
+        start=start,
+        end=end,
+        frequency=tuple(sorted(frequency.items())),
+        new_patients=new_patients,
+        repeat_patients=repeat_patients,
+    )
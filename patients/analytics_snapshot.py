@@ -0,0 +1,830 @@
+"""
+In-memory columnar snapshot behind the admin analytics page.
+
+Patients, exams, bills (with their items and payments) and expenses are
+loaded once per process into compact `array` columns: dates as day
+ordinals, amounts as integer centavos, categories as small integer codes.
+
+- Exams and bills are kept sorted by (date, id), so any date window is one
+  contiguous slice found by bisection. Distinct-patient and per-patient
+  figures are computed over that slice.
+- Additive figures (revenue, exams per procedure, ...) are also kept as
+  per-day totals per category (DailyTotals), so a window costs one slice
+  sum per category however many rows it covers.
+
+Changes are applied incrementally: rows whose updated_at moved since the
+last refresh are re-read and swapped in, and the daily totals adjusted.
+Deletions, large batches of changes and the first use on a new day fall
+back to a full reload. A delete in this process is seen by its post_delete
+signal; one made elsewhere shows up as a row count or highest id that no
+longer matches the database (comparing both catches a delete offset by an
+insert the refresh didn't pick up). A refresh runs at
+most every ANALYTICS_SNAPSHOT_REFRESH_SECONDS, or on the next use after a
+save in this process (patients/signals.py).
+
+The snapshot reads the primary database: change tracking relies on
+updated_at watermarks, which a lagging replica snapshot could skip past.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+from operator import itemgetter, lt
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .analytics import VisitCohort
+from .kpis import REVENUE_STATUSES
+from .routers import use_primary
+
+# Rows saved just before a refresh may commit after it, so each refresh
+# re-reads changes this far back (re-applying a row is harmless)
+CHANGE_OVERLAP = timedelta(minutes=1)
+
+AGE_BUCKETS = (('0-17', 0), ('18-29', 18), ('30-44', 30), ('45-59', 45), ('60+', 60))
+
+
+def to_cents(amount):
+    return int(amount * 100) if amount else 0
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _ordinal(day):
+    return None if day is None else day.toordinal()
+
+
+class Codes:
+    """Small integer codes for the values of a text column."""
+
+    def __init__(self):
+        self.values = []
+        self._codes = {}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class DailyTotals:
+    """Per-day totals for each key: one array('q') per key, indexed by day ordinal - origin."""
+
+    def __init__(self):
+        self.origin = None
+        self.length = 0
+        self.columns = {}
+
+    def add(self, day, key, value=1):
+        if self.origin is None:
+            self.origin = day
+        index = day - self.origin
+        if index < 0:
+            self._prepend(-index)
+            index = 0
+        elif index >= self.length:
+            self._extend(index + 1 - self.length)
+        column = self.columns.get(key)
+        if column is None:
+            column = self.columns[key] = array('q', bytes(8 * self.length))
+        column[index] += value
+
+    def add_all(self, totals):
+        """Add a {(day, key): value} mapping, e.g. a Counter of (day, key) pairs."""
+        for (day, key), value in totals.items():
+            self.add(day, key, value)
+
+    def _extend(self, days):
+        padding = bytes(8 * days)
+        for column in self.columns.values():
+            column.frombytes(padding)
+        self.length += days
+
+    def _prepend(self, days):
+        padding = array('q', bytes(8 * days))
+        for column in self.columns.values():
+            column[0:0] = padding
+        self.origin -= days
+        self.length += days
+
+    def _bounds(self, first, last):
+        """Column slice for days first..last (inclusive ordinals, None leaves that end open)."""
+        if self.origin is None:
+            return 0, 0
+        start = 0 if first is None else min(max(first - self.origin, 0), self.length)
+        stop = self.length if last is None else min(max(last - self.origin + 1, 0), self.length)
+        return start, max(start, stop)
+
+    def totals(self, first=None, last=None):
+        """{key: total} over days first..last; keys that add up to zero are left out."""
+        start, stop = self._bounds(first, last)
+        totals = {}
+        for key, column in self.columns.items():
+            total = sum(column[start:stop])
+            if total:
+                totals[key] = total
+        return totals
+
+    def total(self, first=None, last=None):
+        return sum(self.totals(first, last).values())
+
+    def by_day(self, first, last):
+        """[{key: total}, ...] for every day first..last, including days outside the stored range."""
+        days = [{} for _ in range(last - first + 1)]
+        start, stop = self._bounds(first, last)
+        if start < stop:
+            offset = self.origin + start - first
+            for key, column in self.columns.items():
+                for index, value in enumerate(column[start:stop], offset):
+                    if value:
+                        days[index][key] = value
+        return days
+
+
+class DatedRows:
+    """
+    Rows sorted by (day, id) in parallel arrays, so a date window is one
+    slice. A second pair of arrays sorted by id finds a row's day, and from
+    there its position, by bisection.
+    """
+
+    def __init__(self, **typecodes):
+        self.ids = array('q')
+        self.days = array('i')
+        self.names = tuple(typecodes)
+        for name, typecode in typecodes.items():
+            setattr(self, name, array(typecode))
+        self._sorted_ids = array('q')
+        self._sorted_days = array('i')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def last_id(self):
+        return self._sorted_ids[-1] if self._sorted_ids else None
+
+    def _columns(self):
+        return [self.ids, self.days] + [getattr(self, name) for name in self.names]
+
+    def index(self):
+        """Build the id index after a bulk load, which appends to the columns in (day, id) order."""
+        if all(map(lt, self.ids, islice(self.ids, 1, None))):
+            # Ids that grow with the dates (the usual case) are already sorted
+            self._sorted_ids, self._sorted_days = array('q', self.ids), array('i', self.days)
+            return
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        self._sorted_ids = array('q', map(self.ids.__getitem__, order))
+        self._sorted_days = array('i', map(self.days.__getitem__, order))
+
+    def window(self, first=None, last=None):
+        """(start, stop) of the rows dated first..last (ordinals, None leaves that end open)."""
+        start = 0 if first is None else bisect_left(self.days, first)
+        stop = len(self.days) if last is None else bisect_right(self.days, last)
+        return start, max(start, stop)
+
+    def insert(self, pk, day, values):
+        start, stop = self.window(day, day)
+        position = bisect_left(self.ids, pk, start, stop)
+        for column, value in zip(self._columns(), (pk, day) + tuple(values)):
+            column.insert(position, value)
+        indexed = bisect_left(self._sorted_ids, pk)
+        self._sorted_ids.insert(indexed, pk)
+        self._sorted_days.insert(indexed, day)
+
+    def remove(self, pk):
+        """Drop the row with this id; returns its (day, values), or None if there is none."""
+        indexed = bisect_left(self._sorted_ids, pk)
+        if indexed == len(self._sorted_ids) or self._sorted_ids[indexed] != pk:
+            return None
+        day = self._sorted_days[indexed]
+        del self._sorted_ids[indexed]
+        del self._sorted_days[indexed]
+        start, stop = self.window(day, day)
+        position = bisect_left(self.ids, pk, start, stop)
+        values = tuple(getattr(self, name)[position] for name in self.names)
+        for column in self._columns():
+            del column[position]
+        return day, values
+
+
+class BillParts:
+    """Child rows of bills (items, payments) in parallel arrays sorted by bill id."""
+
+    def __init__(self, **typecodes):
+        self.bills = array('q')
+        self.names = tuple(typecodes)
+        for name, typecode in typecodes.items():
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.bills)
+
+    def insert(self, bill_id, values):
+        position = bisect_right(self.bills, bill_id)
+        self.bills.insert(position, bill_id)
+        for name, value in zip(self.names, values):
+            getattr(self, name).insert(position, value)
+
+    def pop(self, bill_id):
+        """Drop the bill's rows and return their values."""
+        start = bisect_left(self.bills, bill_id)
+        stop = bisect_right(self.bills, bill_id, start)
+        columns = [getattr(self, name) for name in self.names]
+        rows = list(zip(*(column[start:stop] for column in columns)))
+        for column in [self.bills] + columns:
+            del column[start:stop]
+        return rows
+
+
+def _table_signature(model):
+    """(rows, highest id) of a table, to compare with the snapshot's copy."""
+    totals = model.objects.aggregate(rows=Count('id'), last=Max('id'))
+    return totals['rows'], totals['last']
+
+
+def _patient_rows(patients):
+    return patients.order_by('id').values_list(
+        'id', 'created_at', 'sex', 'patient_type', 'birthday', 'first_name', 'last_name'
+    )
+
+
+def _exam_rows(exams):
+    return exams.order_by('exam_date', 'id').values_list(
+        'id', 'exam_date', 'patient_id', 'procedure_type_id', 'recommendations'
+    )
+
+
+def _bill_rows(bills):
+    return bills.order_by('bill_date', 'id').values_list(
+        'id', 'bill_date', 'patient_id', 'status', 'total_amount', 'patient__patient_type'
+    )
+
+
+def _item_rows(items):
+    """Items of bills that count as revenue, with their bill's date."""
+    return items.filter(bill__status__in=REVENUE_STATUSES).order_by('bill_id', 'id').values_list(
+        'bill_id', 'bill__bill_date', 'service_id', 'amount'
+    )
+
+
+def _payment_rows(payments):
+    """Payments on bills that count as revenue, with their bill's date and total."""
+    return payments.filter(bill__status__in=REVENUE_STATUSES).order_by('bill_id', 'id').values_list(
+        'bill_id', 'bill__bill_date', 'bill__total_amount', 'payment_method'
+    )
+
+
+class AnalyticsSnapshot:
+    """
+    Column store for the analytics page. Query methods take dates (None
+    leaves that end of the window open) and are answered from memory.
+    """
+
+    def __init__(self):
+        self.built_on = None
+        self.refreshed_at = None
+        self.refreshed = 0.0  # time.monotonic() of the last load or refresh
+
+        self.sexes = Codes()
+        self.patient_types = Codes()
+        self.findings = Codes()
+        self.payment_methods = Codes()
+        self.service_names = {}
+
+        # Patients, sorted by id
+        self.patient_ids = array('q')
+        self.patient_created = array('i')
+        self.patient_sex = array('b')
+        self.patient_type = array('b')
+        self.patient_birthday = array('i')  # 0 when unknown
+        self.patient_names = []
+        self.birthdays = array('i')  # known birthdays, sorted
+        self.sex_counts = Counter()
+        self.type_counts = Counter()
+        self.new_patients_daily = DailyTotals()
+
+        self.exams = DatedRows(patient='q', procedure='i', finding='b')
+        self.exams_daily = DailyTotals()  # by procedure (ServiceType id)
+        self.findings_daily = DailyTotals()  # by finding code
+        self.first_visits = {}  # patient id -> day of their first exam
+        self._stale_first_visits = set()
+
+        self.bills = DatedRows(patient='q', revenue='q', patient_type='b')  # revenue 0 unless PAID/PARTIAL
+        self.revenue_daily = DailyTotals()  # by patient type code
+        self.patient_revenue = Counter()  # patient id -> all-time revenue
+        self.items = BillParts(service='i', amount='q')  # only for bills that count as revenue
+        self.item_revenue_daily = DailyTotals()  # by ServiceType id
+        self.item_counts_daily = DailyTotals()
+        self.payments = BillParts(method='b')  # likewise
+        self.method_revenue_daily = DailyTotals()  # bill totals by payment method code
+
+        self.expenses_daily = DailyTotals()
+
+    # Loading
+
+    @classmethod
+    def load(cls):
+        """Build a snapshot from the database (one query per table)."""
+        from billing.models import Bill, BillItem, Payment
+        from .models import Patient, UltrasoundExam
+
+        snapshot = cls()
+        started = timezone.now()
+        with transaction.atomic():
+            snapshot._load_reference_data()
+            snapshot.add_patients(_patient_rows(Patient.objects.all()).iterator(chunk_size=5000))
+            snapshot.add_exams(_exam_rows(UltrasoundExam.objects.all()).iterator(chunk_size=5000))
+            snapshot.add_bills(
+                _bill_rows(Bill.objects.all()).iterator(chunk_size=5000),
+                _item_rows(BillItem.objects.all()).iterator(chunk_size=5000),
+                _payment_rows(Payment.objects.all()).iterator(chunk_size=5000),
+            )
+        snapshot._mark_refreshed(started)
+        return snapshot
+
+    def _load_reference_data(self):
+        """Service names and expenses: small tables, re-read in full on every refresh."""
+        from billing.models import Expense, ServiceType
+
+        self.service_names = dict(ServiceType.objects.values_list('id', 'name'))
+        self.expenses_daily = DailyTotals()
+        for day, amount in Expense.objects.values_list('date', 'amount'):
+            self.expenses_daily.add(day.toordinal(), None, to_cents(amount))
+
+    def _mark_refreshed(self, started):
+        self.built_on = self.built_on or started.date()
+        self.refreshed_at = started
+        self.refreshed = time.monotonic()
+
+    def _patient_values(self, row, tz=None):
+        pk, created_at, sex, patient_type, birthday, first_name, last_name = row
+        return (
+            created_at.astimezone(tz or timezone.get_current_timezone()).date().toordinal() if created_at else 0,
+            self.sexes.code(sex),
+            self.patient_types.code(patient_type),
+            birthday.toordinal() if birthday else 0,
+            f"{first_name} {last_name}".strip(),
+        )
+
+    def add_patients(self, rows):
+        """Bulk-load patient rows in id order (see _patient_rows)."""
+        tz = timezone.get_current_timezone()
+        for row in rows:
+            created, sex, patient_type, birthday, name = self._patient_values(row, tz)
+            self.patient_ids.append(row[0])
+            self.patient_created.append(created)
+            self.patient_sex.append(sex)
+            self.patient_type.append(patient_type)
+            self.patient_birthday.append(birthday)
+            self.patient_names.append(name)
+        self.birthdays = array('i', sorted(day for day in self.patient_birthday if day))
+        self.sex_counts = Counter(self.patient_sex)
+        self.type_counts = Counter(self.patient_type)
+        for day, count in Counter(self.patient_created).items():
+            if day:
+                self.new_patients_daily.add(day, None, count)
+
+    def _exam_values(self, row):
+        pk, exam_date, patient_id, procedure_id, finding = row
+        return pk, exam_date.toordinal(), (patient_id, procedure_id, self.findings.code(finding))
+
+    def add_exams(self, rows):
+        """Bulk-load exam rows in (date, id) order (see _exam_rows)."""
+        exams = self.exams
+        # Bound methods: this loop runs once per exam
+        add_id, add_day, add_patient = exams.ids.append, exams.days.append, exams.patient.append
+        add_procedure, add_finding, finding_code = exams.procedure.append, exams.finding.append, self.findings.code
+        for pk, exam_date, patient_id, procedure_id, finding in rows:
+            add_id(pk)
+            add_day(exam_date.toordinal())
+            add_patient(patient_id)
+            add_procedure(procedure_id)
+            add_finding(finding_code(finding))
+        exams.index()
+        self.exams_daily.add_all(Counter(zip(exams.days, exams.procedure)))
+        self.findings_daily.add_all(Counter(zip(exams.days, exams.finding)))
+        # Rows are in date order, so the last assignment (walking backwards) is the first visit
+        self.first_visits = dict(zip(reversed(exams.patient), reversed(exams.days)))
+
+    def _bill_values(self, row):
+        pk, bill_date, patient_id, status, total_amount, patient_type = row
+        revenue = to_cents(total_amount) if status in REVENUE_STATUSES else 0
+        return pk, bill_date.toordinal(), (patient_id, revenue, self.patient_types.code(patient_type))
+
+    def add_bills(self, bill_rows, item_rows, payment_rows):
+        """Bulk-load bills in (date, id) order and their items/payments in bill id order."""
+        bills = self.bills
+        add_id, add_day, add_patient = bills.ids.append, bills.days.append, bills.patient.append
+        add_revenue, add_type, type_code = bills.revenue.append, bills.patient_type.append, self.patient_types.code
+        # Plain dicts with get(): noticeably faster than Counter over a million rows
+        revenue, patient_revenue = {}, {}
+        revenue_get, patient_get = revenue.get, patient_revenue.get
+        for pk, bill_date, patient_id, status, total_amount, patient_type in bill_rows:
+            day, code = bill_date.toordinal(), type_code(patient_type)
+            cents = int(total_amount * 100) if status in REVENUE_STATUSES and total_amount else 0
+            add_id(pk)
+            add_day(day)
+            add_patient(patient_id)
+            add_revenue(cents)
+            add_type(code)
+            if cents:
+                key = (day, code)
+                revenue[key] = revenue_get(key, 0) + cents
+                patient_revenue[patient_id] = patient_get(patient_id, 0) + cents
+        bills.index()
+        self.revenue_daily.add_all(revenue)
+        self.patient_revenue = Counter(patient_revenue)
+
+        items = self.items
+        add_bill, add_service, add_amount = items.bills.append, items.service.append, items.amount.append
+        item_revenue, item_counts = {}, {}
+        revenue_get, count_get = item_revenue.get, item_counts.get
+        for bill_id, bill_date, service_id, amount in item_rows:
+            cents = int(amount * 100) if amount else 0
+            add_bill(bill_id)
+            add_service(service_id)
+            add_amount(cents)
+            key = (bill_date.toordinal(), service_id)
+            item_revenue[key] = revenue_get(key, 0) + cents
+            item_counts[key] = count_get(key, 0) + 1
+        self.item_revenue_daily.add_all(item_revenue)
+        self.item_counts_daily.add_all(item_counts)
+
+        payments = self.payments
+        add_bill, add_method, method_code = payments.bills.append, payments.method.append, self.payment_methods.code
+        method_revenue = {}
+        revenue_get = method_revenue.get
+        for bill_id, bill_date, total_amount, method in payment_rows:
+            code = method_code(method)
+            add_bill(bill_id)
+            add_method(code)
+            key = (bill_date.toordinal(), code)
+            method_revenue[key] = revenue_get(key, 0) + (int(total_amount * 100) if total_amount else 0)
+        self.method_revenue_daily.add_all(method_revenue)
+
+    # Incremental refresh
+
+    def age(self):
+        return time.monotonic() - self.refreshed
+
+    def refresh(self):
+        """
+        Apply rows changed since the last refresh. Returns False, leaving the
+        snapshot partly updated, when a full reload is needed instead.
+        """
+        from billing.models import Bill, BillItem, Payment
+        from .models import Patient, UltrasoundExam
+
+        started = timezone.now()
+        since = self.refreshed_at - CHANGE_OVERLAP
+        limit = settings.ANALYTICS_SNAPSHOT_MAX_CHANGES
+        with transaction.atomic():
+            # One read transaction, so the changes and the counts agree
+            patients = list(_patient_rows(Patient.objects.filter(updated_at__gte=since))[:limit + 1])
+            exams = list(_exam_rows(UltrasoundExam.objects.filter(updated_at__gte=since))[:limit + 1])
+            bills = list(_bill_rows(Bill.objects.filter(updated_at__gte=since))[:limit + 1])
+            if max(len(patients), len(exams), len(bills)) > limit:
+                return False
+            bill_ids = [row[0] for row in bills]
+            items = list(_item_rows(BillItem.objects.filter(bill_id__in=bill_ids))) if bill_ids else []
+            payments = list(_payment_rows(Payment.objects.filter(bill_id__in=bill_ids))) if bill_ids else []
+            signature = tuple(_table_signature(model) for model in (Patient, UltrasoundExam, Bill))
+            self._load_reference_data()
+
+        self.apply_patients(patients)
+        self.apply_exams(exams)
+        self.apply_bills(bills, items, payments)
+        if signature != self._signature():
+            # Something was deleted (or inserted without being picked up)
+            return False
+        self._mark_refreshed(started)
+        return True
+
+    def _signature(self):
+        """(rows, highest id) of the patients, exams and bills held, like _table_signature."""
+        last_patient = self.patient_ids[-1] if self.patient_ids else None
+        return (
+            (len(self.patient_ids), last_patient),
+            (len(self.exams), self.exams.last_id()),
+            (len(self.bills), self.bills.last_id()),
+        )
+
+    def apply_patients(self, rows):
+        """Insert or update patient rows (see _patient_rows)."""
+        for row in rows:
+            pk = row[0]
+            created, sex, patient_type, birthday, name = self._patient_values(row)
+            position = bisect_left(self.patient_ids, pk)
+            if position < len(self.patient_ids) and self.patient_ids[position] == pk:
+                old_created = self.patient_created[position]
+                old_sex = self.patient_sex[position]
+                old_type = self.patient_type[position]
+                old_birthday = self.patient_birthday[position]
+                self.patient_created[position] = created
+                self.patient_sex[position] = sex
+                self.patient_type[position] = patient_type
+                self.patient_birthday[position] = birthday
+                self.patient_names[position] = name
+            else:
+                old_created = old_sex = old_type = old_birthday = None
+                self.patient_ids.insert(position, pk)
+                self.patient_created.insert(position, created)
+                self.patient_sex.insert(position, sex)
+                self.patient_type.insert(position, patient_type)
+                self.patient_birthday.insert(position, birthday)
+                self.patient_names.insert(position, name)
+
+            if old_created != created:
+                if old_created:
+                    self.new_patients_daily.add(old_created, None, -1)
+                if created:
+                    self.new_patients_daily.add(created, None, 1)
+            if old_sex != sex:
+                if old_sex is not None:
+                    self.sex_counts[old_sex] -= 1
+                self.sex_counts[sex] += 1
+            if old_type != patient_type:
+                if old_type is not None:
+                    self.type_counts[old_type] -= 1
+                    self._move_revenue_to_type(pk, patient_type)
+                self.type_counts[patient_type] += 1
+            if old_birthday != birthday:
+                if old_birthday:
+                    del self.birthdays[bisect_left(self.birthdays, old_birthday)]
+                if birthday:
+                    insort(self.birthdays, birthday)
+
+    def _move_revenue_to_type(self, patient_id, patient_type):
+        bills = self.bills
+        for position, bill_patient in enumerate(bills.patient):
+            if bill_patient != patient_id:
+                continue
+            old_type = bills.patient_type[position]
+            if old_type != patient_type:
+                day, cents = bills.days[position], bills.revenue[position]
+                self.revenue_daily.add(day, old_type, -cents)
+                self.revenue_daily.add(day, patient_type, cents)
+                bills.patient_type[position] = patient_type
+
+    def apply_exams(self, rows):
+        """Insert or replace exam rows (see _exam_rows)."""
+        for row in rows:
+            pk, day, values = self._exam_values(row)
+            self._remove_exam(pk)
+            self.exams.insert(pk, day, values)
+            patient_id, procedure_id, finding = values
+            self.exams_daily.add(day, procedure_id)
+            self.findings_daily.add(day, finding)
+            if day < self.first_visits.get(patient_id, day + 1):
+                self.first_visits[patient_id] = day
+        self._resolve_first_visits()
+
+    def _remove_exam(self, pk):
+        removed = self.exams.remove(pk)
+        if removed:
+            day, (patient_id, procedure_id, finding) = removed
+            self.exams_daily.add(day, procedure_id, -1)
+            self.findings_daily.add(day, finding, -1)
+            if self.first_visits.get(patient_id) == day:
+                self._stale_first_visits.add(patient_id)
+
+    def _resolve_first_visits(self):
+        exams = self.exams
+        for patient_id in self._stale_first_visits:
+            day = self.first_visits[patient_id]
+            start, stop = exams.window(day, day)
+            if patient_id in exams.patient[start:stop]:
+                continue
+            try:
+                # Exams are in date order, so the first match is the first visit
+                self.first_visits[patient_id] = exams.days[exams.patient.index(patient_id)]
+            except ValueError:
+                self.first_visits.pop(patient_id, None)
+        self._stale_first_visits.clear()
+
+    def apply_bills(self, bill_rows, item_rows, payment_rows):
+        """Replace the given bills, with all of their items and payments (see _bill_rows etc.)."""
+        for row in bill_rows:
+            self._remove_bill(row[0])
+        for row in bill_rows:
+            pk, day, values = self._bill_values(row)
+            self.bills.insert(pk, day, values)
+            patient_id, cents, patient_type = values
+            if cents:
+                self.revenue_daily.add(day, patient_type, cents)
+                self.patient_revenue[patient_id] += cents
+        for bill_id, bill_date, service_id, amount in item_rows:
+            cents = to_cents(amount)
+            self.items.insert(bill_id, (service_id, cents))
+            self.item_revenue_daily.add(bill_date.toordinal(), service_id, cents)
+            self.item_counts_daily.add(bill_date.toordinal(), service_id)
+        for bill_id, bill_date, total_amount, method in payment_rows:
+            code = self.payment_methods.code(method)
+            self.payments.insert(bill_id, (code,))
+            self.method_revenue_daily.add(bill_date.toordinal(), code, to_cents(total_amount))
+
+    def _remove_bill(self, pk):
+        removed = self.bills.remove(pk)
+        if not removed:
+            return
+        day, (patient_id, cents, patient_type) = removed
+        if cents:
+            self.revenue_daily.add(day, patient_type, -cents)
+            self.patient_revenue[patient_id] -= cents
+        for service_id, amount in self.items.pop(pk):
+            self.item_revenue_daily.add(day, service_id, -amount)
+            self.item_counts_daily.add(day, service_id, -1)
+        for method, in self.payments.pop(pk):
+            self.method_revenue_daily.add(day, method, -cents)
+
+    # Queries
+
+    def revenue(self, first=None, last=None):
+        """PAID/PARTIAL bill totals dated first..last."""
+        return from_cents(self.revenue_daily.total(_ordinal(first), _ordinal(last)))
+
+    def daily_revenue(self, first, last):
+        """Revenue for every day first..last."""
+        days = self.revenue_daily.by_day(first.toordinal(), last.toordinal())
+        return [from_cents(sum(day.values())) for day in days]
+
+    def revenue_by_patient_type(self, first=None, last=None):
+        """[(patient_type, revenue)], highest first."""
+        totals = self.revenue_daily.totals(_ordinal(first), _ordinal(last))
+        return sorted(
+            ((self.patient_types.values[code], from_cents(cents)) for code, cents in totals.items()),
+            key=itemgetter(1), reverse=True,
+        )
+
+    def revenue_by_service(self, first=None, last=None):
+        """[(service name, item revenue, items)] for revenue bills, highest revenue first."""
+        first, last = _ordinal(first), _ordinal(last)
+        counts = self.item_counts_daily.totals(first, last)
+        revenue = self.item_revenue_daily.totals(first, last)
+        by_name = {}
+        for service_id, count in counts.items():
+            name = self.service_names.get(service_id)
+            cents, items = by_name.get(name, (0, 0))
+            by_name[name] = (cents + revenue.get(service_id, 0), items + count)
+        return sorted(
+            ((name, from_cents(cents), items) for name, (cents, items) in by_name.items()),
+            key=itemgetter(1), reverse=True,
+        )
+
+    def revenue_by_payment_method(self, first=None, last=None):
+        """[(method, total of the revenue bills paid that way)], highest first; counted once per payment."""
+        totals = self.method_revenue_daily.totals(_ordinal(first), _ordinal(last))
+        return sorted(
+            ((self.payment_methods.values[code], from_cents(cents)) for code, cents in totals.items()),
+            key=itemgetter(1), reverse=True,
+        )
+
+    def top_patients(self, first=None, last=None, limit=10):
+        """[(patient name, revenue)] for the `limit` patients with the most revenue."""
+        if first is None and last is None:
+            totals = self.patient_revenue
+        else:
+            start, stop = self.bills.window(_ordinal(first), _ordinal(last))
+            totals = {}
+            get = totals.get
+            for patient_id, cents in zip(self.bills.patient[start:stop], self.bills.revenue[start:stop]):
+                if cents:
+                    totals[patient_id] = get(patient_id, 0) + cents
+        top = heapq.nlargest(limit, ((pk, cents) for pk, cents in totals.items() if cents), key=itemgetter(1))
+        return [(self._patient_name(pk), from_cents(cents)) for pk, cents in top]
+
+    def _patient_name(self, pk):
+        position = bisect_left(self.patient_ids, pk)
+        if position < len(self.patient_ids) and self.patient_ids[position] == pk:
+            return self.patient_names[position]
+        return ''
+
+    def exam_count(self, first=None, last=None):
+        start, stop = self.exams.window(_ordinal(first), _ordinal(last))
+        return stop - start
+
+    def patients_seen(self, first=None, last=None):
+        """Distinct patients with an exam dated first..last."""
+        if first is None and last is None:
+            return len(self.first_visits)
+        start, stop = self.exams.window(_ordinal(first), _ordinal(last))
+        return len(set(self.exams.patient[start:stop]))
+
+    def exams_by_procedure(self, first=None, last=None):
+        """[(procedure name, exams)], by name."""
+        totals = self.exams_daily.totals(_ordinal(first), _ordinal(last))
+        return self._by_service_name(totals)
+
+    def _by_service_name(self, totals):
+        by_name = Counter()
+        for service_id, count in totals.items():
+            by_name[self.service_names.get(service_id)] += count
+        return sorted(by_name.items(), key=lambda item: (item[0] is None, item[0] or ''))
+
+    def exams_by_finding(self, first=None, last=None):
+        """[(recommendation code, exams)], by code."""
+        totals = self.findings_daily.totals(_ordinal(first), _ordinal(last))
+        return sorted((self.findings.values[code], count) for code, count in totals.items())
+
+    def daily_exams_by_procedure(self, first, last):
+        """[(date, [(procedure name, exams)])] for every day first..last."""
+        days = self.exams_daily.by_day(first.toordinal(), last.toordinal())
+        return [(first + timedelta(days=offset), self._by_service_name(totals)) for offset, totals in enumerate(days)]
+
+    def visit_cohort(self, first=None, last=None):
+        """The VisitCohort (patients/analytics.py) for exams dated first..last."""
+        start, stop = self.exams.window(_ordinal(first), _ordinal(last))
+        visits = Counter(self.exams.patient[start:stop])
+        frequency = Counter(visits.values())
+        repeat_patients = 0
+        if first is not None:
+            first_day = first.toordinal()
+            first_visits = self.first_visits
+            repeat_patients = sum(1 for patient_id in visits if first_visits[patient_id] < first_day)
+        return VisitCohort(
+            start=first,
+            end=last,
+            frequency=tuple(sorted(frequency.items())),
+            new_patients=len(visits) - repeat_patients,
+            repeat_patients=repeat_patients,
+        )
+
+    def new_patients(self, first=None, last=None):
+        """Patients (archived included) created first..last."""
+        return self.new_patients_daily.total(_ordinal(first), _ordinal(last))
+
+    def patients_by_sex(self):
+        return sorted((self.sexes.values[code], count) for code, count in self.sex_counts.items() if count)
+
+    def patients_by_type(self):
+        return sorted((self.patient_types.values[code], count) for code, count in self.type_counts.items() if count)
+
+    def age_buckets(self, today):
+        """[(label, patients)] by age today, for patients with a birthday on file."""
+        def born_by(years):
+            # Latest birthday of someone who is at least `years` old today
+            try:
+                return today.replace(year=today.year - years).toordinal()
+            except ValueError:  # today is Feb 29
+                return today.replace(year=today.year - years, day=28).toordinal()
+
+        # at_least[i]: patients at least AGE_BUCKETS[i] years old (the first bucket also takes
+        # birthdays in the future)
+        at_least = [len(self.birthdays)] + [
+            bisect_right(self.birthdays, born_by(years)) for _, years in AGE_BUCKETS[1:]
+        ] + [0]
+        return [(label, at_least[index] - at_least[index + 1]) for index, (label, _) in enumerate(AGE_BUCKETS)]
+
+    def expenses(self, first=None, last=None):
+        return from_cents(self.expenses_daily.total(_ordinal(first), _ordinal(last)))
+
+
+_lock = threading.Lock()
+_snapshot = None
+_changed = False
+_deleted = False
+
+
+def mark_changed(signal=None, **kwargs):
+    """Signal receiver: refresh the snapshot on its next use, or reload it after a delete."""
+    global _changed, _deleted
+    _changed = True
+    if signal is post_delete:
+        _deleted = True
+
+
+@contextmanager
+def analytics_snapshot():
+    """
+    The process-wide AnalyticsSnapshot, loaded or refreshed if due, and
+    locked for the duration of the block.
+    """
+    global _snapshot, _changed, _deleted
+    with _lock, use_primary():
+        today = timezone.now().date()
+        if _deleted:
+            _snapshot = None
+        if _snapshot is not None and _snapshot.built_on == today and (
+            _changed or _snapshot.age() >= settings.ANALYTICS_SNAPSHOT_REFRESH_SECONDS
+        ):
+            _changed = False
+            if not _snapshot.refresh():
+                _snapshot = None
+        if _snapshot is None or _snapshot.built_on != today:
+            _changed = _deleted = False
+            _snapshot = AnalyticsSnapshot.load()
+        yield _snapshot
@@ -1,5 +1,6 @@
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
+from django.utils.cache import patch_cache_control
 from django.shortcuts import get_object_or_404
 from django.db import transaction, models
 from django.core.exceptions import ValidationError
@@ -19,7 +20,6 @@ import base64
 from django.core.files.base import ContentFile
 from datetime import datetime, date
 from django.utils.dateparse import parse_date
-from django.db.models import Count
 
 logger = logging.getLogger(__name__)
 
@@ -176,9 +176,41 @@ def save_annotation_preview(request, exam_id):
             'message': 'Error saving annotation preview'
         }, status=500)
 
+# Longest range the calendar counts endpoint serves in one request
+CALENDAR_COUNTS_MAX_DAYS = 400
+
+
+def _parse_calendar_range(request):
+    """(start_date, end_date) from the query string, or None if missing/invalid."""
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
+    if not start_date or not end_date or end_date < start_date:
+        return None
+    if (end_date - start_date).days > CALENDAR_COUNTS_MAX_DAYS:
+        return None
+    return start_date, end_date
+
+
+def _calendar_counts_etag(request):
+    if not request.user.is_authenticated or not request.user.is_staff:
+        return None
+    date_range = _parse_calendar_range(request)
+    if date_range is None:
+        return None
+    from .calendar_counts import get_counts_etag
+    return get_counts_etag(*date_range)
+
+
 @require_http_methods(["GET"])
+@condition(etag_func=_calendar_counts_etag)
 def appointment_calendar_counts(request):
-    """API endpoint to get appointment counts for a date range."""
+    """
+    API endpoint to get appointment counts for a date range.
+
+    Counts come from the per-day counter table (patients/calendar_counts.py)
+    rather than a grouped COUNT over appointments. Responses carry an ETag,
+    so the calendar's repeat requests for an unchanged month get a 304.
+    """
     # Check authentication and staff status
     if not request.user.is_authenticated or not request.user.is_staff:
         return JsonResponse({
@@ -187,46 +219,95 @@ def appointment_calendar_counts(request):
         }, status=403)
     
     try:
-        start_date_str = request.GET.get('start_date')
-        end_date_str = request.GET.get('end_date')
-        
-        if not start_date_str or not end_date_str:
+        if not request.GET.get('start_date') or not request.GET.get('end_date'):
             return JsonResponse({
                 'status': 'error',
                 'message': 'start_date and end_date parameters are required'
             }, status=400)
-        
-        start_date = parse_date(start_date_str)
-        end_date = parse_date(end_date_str)
-        
-        if not start_date or not end_date:
+
+        date_range = _parse_calendar_range(request)
+        if date_range is None:
             return JsonResponse({
                 'status': 'error',
-                'message': 'Invalid date format. Use YYYY-MM-DD'
+                'message': f'Invalid date range. Use YYYY-MM-DD, at most {CALENDAR_COUNTS_MAX_DAYS} days'
             }, status=400)
-        
-        # Get appointment counts grouped by date
-        appointments = Appointment.objects.filter(
-            appointment_date__gte=start_date,
-            appointment_date__lte=end_date
-        ).values('appointment_date').annotate(
-            count=Count('id')
-        ).order_by('appointment_date')
-        
-        # Convert to dictionary with date strings as keys
+
+        from .calendar_counts import get_day_counts
+
+        # Totals per day (all statuses) plus the per-status breakdown
         counts = {}
-        for item in appointments:
-            date_str = item['appointment_date'].strftime('%Y-%m-%d')
-            counts[date_str] = item['count']
+        status_counts = {}
+        for day, by_status in sorted(get_day_counts(*date_range).items()):
+            date_str = day.strftime('%Y-%m-%d')
+            counts[date_str] = sum(by_status.values())
+            status_counts[date_str] = by_status
         
-        return JsonResponse({
+        response = JsonResponse({
             'status': 'success',
-            'counts': counts
+            'counts': counts,
+            'status_counts': status_counts
         })
+        # Let the browser keep the response but revalidate it with If-None-Match
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
         
     except Exception as e:
         logger.error(f'Error fetching calendar counts: {str(e)}')
         return JsonResponse({
             'status': 'error',
             'message': 'Error fetching appointment counts'
-        }, status=500)
\ No newline at end of file
+        }, status=500)
+
+
+@require_http_methods(["GET"])
+def appointment_availability(request):
+    """
+    API endpoint for bookable slots of a procedure.
+    With `date`, returns every slot of that day and its remaining capacity;
+    otherwise returns the next `next` (default 5) free slots.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Authentication required'
+        }, status=403)
+
+    from .availability import get_day_slots, next_free_slots
+
+    procedure = request.GET.get('procedure', '').strip()
+    if not procedure:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'procedure parameter is required'
+        }, status=400)
+
+    date_str = request.GET.get('date')
+    if date_str:
+        day = parse_date(date_str)
+        if not day:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Invalid date format. Use YYYY-MM-DD'
+            }, status=400)
+        slots = [
+            {'date': day.isoformat(), 'time': slot_time.strftime('%H:%M'), 'remaining': remaining}
+            for slot_time, remaining in get_day_slots(procedure, day)
+        ]
+    else:
+        try:
+            count = min(max(int(request.GET.get('next', 5)), 1), 50)
+        except ValueError:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'next must be a number'
+            }, status=400)
+        slots = [
+            {'date': slot.date().isoformat(), 'time': slot.strftime('%H:%M')}
+            for slot in next_free_slots(procedure, count=count)
+        ]
+
+    return JsonResponse({
+        'status': 'success',
+        'procedure': procedure,
+        'slots': slots
+    })
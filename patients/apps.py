@@ -0,0 +1,18 @@
+from django.apps import AppConfig
+
+
+class PatientsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'patients'
+
+    def ready(self):
+        from django.core import checks
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import configure_sqlite_connection
+        from .sessions import check_session_cache
+
+        checks.register(check_session_cache, checks.Tags.caches)
+
+        connection_created.connect(configure_sqlite_connection, dispatch_uid='patients.configure_sqlite')
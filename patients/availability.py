@@ -0,0 +1,279 @@
+"""
+Appointment availability: opening hours, per-slot capacity and booking.
+
+The day is split into fixed slots from the clinic's opening time. For every
+(procedure, day, slot) that has bookings, AppointmentSlot keeps a `booked`
+counter, so answering "what's free" never scans the appointments table: a
+day's availability is built as a bytearray of remaining capacity per slot
+from at most one counter row per booked slot.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AppointmentSlot
+
+# Statuses that occupy a slot
+ACTIVE_STATUSES = ('PENDING', 'CONFIRMED', 'COMPLETED')
+
+# Remaining-capacity value for slots of procedures without a limit
+UNLIMITED = 255
+
+
+class SlotUnavailable(Exception):
+    """The requested slot is outside opening hours or already full."""
+
+
+def normalize_procedure(name):
+    return (name or '').strip().lower()
+
+
+@lru_cache(maxsize=None)
+def _slot_times(opening, closing, slot_minutes):
+    # Closing time is the last time an appointment may start, so it gets a slot of its own
+    start = datetime.combine(datetime.min.date(), time.fromisoformat(opening))
+    end = datetime.combine(datetime.min.date(), time.fromisoformat(closing))
+    step = timedelta(minutes=slot_minutes)
+    times = []
+    while start <= end:
+        times.append(start.time())
+        start += step
+    return tuple(times)
+
+
+def get_slot_times(day):
+    """Start times of the bookable slots on `day` (empty when closed)."""
+    hours = settings.CLINIC_OPENING_HOURS.get(day.weekday())
+    if not hours:
+        return ()
+    return _slot_times(hours[0], hours[1], settings.APPOINTMENT_SLOT_MINUTES)
+
+
+def get_slot_index(day, at_time):
+    """Index of the slot containing `at_time` on `day`, or None outside opening hours."""
+    slot_times = get_slot_times(day)
+    if not slot_times or at_time < slot_times[0]:
+        return None
+    if at_time > time.fromisoformat(settings.CLINIC_OPENING_HOURS[day.weekday()][1]):
+        return None
+    elapsed = (
+        datetime.combine(day, at_time) - datetime.combine(day, slot_times[0])
+    ).total_seconds() // 60
+    index = int(elapsed // settings.APPOINTMENT_SLOT_MINUTES)
+    return index if index < len(slot_times) else None
+
+
+def get_slot_capacity(procedure):
+    """
+    Slot capacity of the ServiceType matching `procedure` (by name), else
+    APPOINTMENT_SLOT_CAPACITY. None means no limit.
+    """
+    from billing.models import ServiceType
+
+    capacity = (
+        ServiceType.objects.filter(name__iexact=normalize_procedure(procedure))
+        .values_list('slot_capacity', flat=True)
+        .first()
+    )
+    return capacity if capacity is not None else settings.APPOINTMENT_SLOT_CAPACITY
+
+
+def get_availability(procedure, start_date, end_date, now=None, capacity=None):
+    """
+    Remaining capacity per slot for every day in [start_date, end_date], as
+    {day: bytearray}. Slots that already started are reported as full; free
+    slots of procedures without a limit hold UNLIMITED. One query reads the
+    counters for the whole range.
+    """
+    now = timezone.localtime(now or timezone.now())
+    if capacity is None:
+        capacity = get_slot_capacity(procedure)
+    capacity = UNLIMITED if capacity is None else min(capacity, UNLIMITED)
+
+    days = {}
+    day = start_date
+    while day <= end_date:
+        slot_times = get_slot_times(day)
+        remaining = bytearray([capacity]) * len(slot_times)
+        if day < now.date():
+            remaining = bytearray(len(slot_times))
+        elif day == now.date():
+            for index, slot_time in enumerate(slot_times):
+                if slot_time <= now.time():
+                    remaining[index] = 0
+        days[day] = remaining
+        day += timedelta(days=1)
+
+    if capacity == UNLIMITED:
+        return days
+    booked = AppointmentSlot.objects.filter(
+        procedure=normalize_procedure(procedure),
+        slot_date__range=(start_date, end_date),
+        booked__gt=0,
+    ).values_list('slot_date', 'slot_index', 'booked')
+    for slot_date, slot_index, count in booked:
+        remaining = days[slot_date]
+        if slot_index < len(remaining):
+            remaining[slot_index] = max(min(remaining[slot_index], capacity - count), 0)
+    return days
+
+
+def get_day_slots(procedure, day, now=None):
+    """[(slot start time, remaining capacity)] for one day; remaining is None for an unlimited free slot."""
+    remaining = get_availability(procedure, day, day, now=now)[day]
+    return [
+        (slot_time, None if free == UNLIMITED else free)
+        for slot_time, free in zip(get_slot_times(day), remaining)
+    ]
+
+
+def next_free_slots(procedure, count=5, after=None, horizon_days=None):
+    """
+    The next `count` slot start datetimes with room for `procedure`, searching
+    up to `horizon_days` ahead one week of counters at a time.
+    """
+    after = timezone.localtime(after or timezone.now())
+    horizon_days = horizon_days or settings.APPOINTMENT_BOOKING_HORIZON_DAYS
+    capacity = get_slot_capacity(procedure)
+    if capacity is None:
+        capacity = UNLIMITED
+    last_day = after.date() + timedelta(days=horizon_days)
+
+    found = []
+    window_start = after.date()
+    while window_start <= last_day and len(found) < count:
+        window_end = min(window_start + timedelta(days=6), last_day)
+        days = get_availability(procedure, window_start, window_end, now=after, capacity=capacity)
+        for day, remaining in days.items():
+            slot_times = get_slot_times(day)
+            for index, free in enumerate(remaining):
+                if free:
+                    found.append(datetime.combine(day, slot_times[index]))
+                    if len(found) == count:
+                        return found
+        window_start = window_end + timedelta(days=1)
+    return found
+
+
+def _slot_key(status, procedure, day, at_time):
+    """(procedure, day, slot index) held by an appointment in this state, or None."""
+    if status not in ACTIVE_STATUSES or not day or not at_time:
+        return None
+    index = get_slot_index(day, at_time)
+    if index is None:
+        return None
+    return (normalize_procedure(procedure), day, index)
+
+
+def _take_slot(key, capacity=None):
+    """
+    Increment a slot counter, only while it is below `capacity` (if given).
+    Writes come first so an SQLite transaction takes the write lock up front
+    instead of failing to upgrade a read lock under contention.
+    """
+    procedure, day, index = key
+    slot = AppointmentSlot.objects.filter(procedure=procedure, slot_date=day, slot_index=index)
+    if capacity is not None:
+        if capacity < 1:
+            return False
+        slot = slot.filter(booked__lt=capacity)
+    if slot.update(booked=F('booked') + 1):
+        return True
+    try:
+        with transaction.atomic():
+            AppointmentSlot.objects.create(procedure=procedure, slot_date=day, slot_index=index, booked=1)
+        return True
+    except IntegrityError:
+        # The counter exists; it is either full or was created concurrently
+        return bool(slot.update(booked=F('booked') + 1))
+
+
+def _release_slot_keys(keys):
+    for (procedure, day, index), count in Counter(keys).items():
+        AppointmentSlot.objects.filter(
+            procedure=procedure, slot_date=day, slot_index=index, booked__gte=count
+        ).update(booked=F('booked') - count)
+
+
+def release_appointment_slots(appointments):
+    """Release the slots held by (loaded) active appointments that are being cancelled or deleted."""
+    _release_slot_keys(
+        key for key in (
+            _slot_key(appointment.status, appointment.procedure_type,
+                      appointment.appointment_date, appointment.appointment_time)
+            for appointment in appointments
+        )
+        if key is not None
+    )
+
+
+def get_slot_change(appointment, enforce=False):
+    """
+    Work out how saving `appointment` moves its slot booking, comparing its
+    current values with the ones it was loaded with (no extra read). Returns
+    (old_key, new_key, capacity) or None when the booking doesn't change.
+    Raises SlotUnavailable for enforced bookings outside opening hours.
+    Reads (the capacity lookup) happen here, before the saving transaction.
+    """
+    fields = ('status', 'procedure_type', 'appointment_date', 'appointment_time')
+    new_key = _slot_key(*(getattr(appointment, field) for field in fields))
+    old_key = None
+    if not appointment._state.adding:
+        old_key = _slot_key(*(appointment.get_original_value(field) for field in fields))
+
+    if enforce and new_key is None and appointment.status in ACTIVE_STATUSES:
+        raise SlotUnavailable("Appointments are only available during clinic hours.")
+    if old_key == new_key:
+        return None
+    capacity = get_slot_capacity(appointment.procedure_type) if enforce and new_key else None
+    return old_key, new_key, capacity
+
+
+def apply_slot_change(change):
+    """
+    Apply a change from get_slot_change inside the saving transaction. The
+    new slot is taken before the old one is released, so a full slot raises
+    SlotUnavailable and the transaction rolls back with nothing changed.
+    """
+    if change is None:
+        return
+    old_key, new_key, capacity = change
+    if new_key and not _take_slot(new_key, capacity):
+        raise SlotUnavailable("This time slot is fully booked. Please choose another time.")
+    if old_key:
+        _release_slot_keys([old_key])
+
+
+def rebuild_slot_counts(since=None):
+    """
+    Recompute the slot counters from the appointments (initial fill and drift
+    repair). Only days from `since` on are rebuilt. Returns the number of
+    counter rows written.
+    """
+    from .models import Appointment
+
+    since = since or timezone.localdate()
+    counts = Counter()
+    appointments = Appointment.objects.filter(
+        appointment_date__gte=since, status__in=ACTIVE_STATUSES
+    ).values_list('status', 'procedure_type', 'appointment_date', 'appointment_time')
+    for row in appointments.iterator():
+        key = _slot_key(*row)
+        if key is not None:
+            counts[key] += 1
+
+    with transaction.atomic():
+        AppointmentSlot.objects.filter(slot_date__gte=since).delete()
+        AppointmentSlot.objects.bulk_create(
+            [
+                AppointmentSlot(procedure=procedure, slot_date=day, slot_index=index, booked=booked)
+                for (procedure, day, index), booked in counts.items()
+            ],
+            batch_size=500,
+        )
+    return len(counts)
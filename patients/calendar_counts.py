@@ -0,0 +1,101 @@
+import hashlib
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from .models import Appointment, AppointmentDayCount
+
+
+def apply_deltas(deltas):
+    """
+    Add `deltas` ({(day, status): change}) to the per-day counters. Each
+    counter is bumped with an UPDATE ... SET count = count + n, creating the
+    row on first use, so concurrent writers never lose an increment.
+    """
+    now = timezone.now()
+    for (day, status), delta in deltas.items():
+        if not delta or day is None:
+            continue
+        counter = AppointmentDayCount.objects.filter(day=day, status=status)
+        if counter.update(count=F('count') + delta, updated_at=now):
+            continue
+        try:
+            with transaction.atomic():
+                AppointmentDayCount.objects.create(day=day, status=status, count=delta, updated_at=now)
+        except IntegrityError:
+            counter.update(count=F('count') + delta, updated_at=now)
+
+
+def record_status_change(appointments, new_status):
+    """Counter bookkeeping for a bulk UPDATE that set `new_status` on loaded appointments."""
+    deltas = Counter()
+    for appointment in appointments:
+        if appointment.status != new_status:
+            deltas[(appointment.appointment_date, appointment.status)] -= 1
+            deltas[(appointment.appointment_date, new_status)] += 1
+    apply_deltas(deltas)
+
+
+def update_loaded_status(appointments, new_status, from_statuses, **values):
+    """
+    Bulk UPDATE loaded appointments still in `from_statuses` to `new_status`
+    and do the counter bookkeeping for the rows it actually changed (a row
+    moved on concurrently is skipped). Call inside transaction.atomic(), with
+    the rows loaded through select_for_update(); returns the changed rows.
+    """
+    now = timezone.now()
+    ids = [appointment.id for appointment in appointments]
+    Appointment.objects.filter(id__in=ids, status__in=from_statuses).update(
+        status=new_status, updated_at=now, **values
+    )
+    changed_ids = set(
+        Appointment.objects.filter(id__in=ids, status=new_status, updated_at=now).values_list('id', flat=True)
+    )
+    changed = [appointment for appointment in appointments if appointment.id in changed_ids]
+    record_status_change(changed, new_status)
+    return changed
+
+
+def get_day_counts(start_date, end_date):
+    """{day: {status: count}} for the days in range that have appointments."""
+    counts = defaultdict(dict)
+    rows = AppointmentDayCount.objects.filter(
+        day__range=(start_date, end_date), count__gt=0
+    ).values_list('day', 'status', 'count')
+    for day, status, count in rows:
+        counts[day][status] = count
+    return counts
+
+
+def get_counts_etag(start_date, end_date):
+    """
+    ETag for a range: changes whenever any counter in it is written. Costs one
+    aggregate over the (small, indexed) counter table.
+    """
+    state = AppointmentDayCount.objects.filter(day__range=(start_date, end_date)).aggregate(
+        rows=Count('id'), last_change=Max('updated_at')
+    )
+    raw = f"{start_date}:{end_date}:{state['rows']}:{state['last_change']}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def rebuild_day_counts():
+    """Recompute every counter from the appointments table (initial fill / drift repair)."""
+    rows = (
+        Appointment.objects.values('appointment_date', 'status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        AppointmentDayCount.objects.all().delete()
+        AppointmentDayCount.objects.bulk_create(
+            [
+                AppointmentDayCount(day=row['appointment_date'], status=row['status'], count=row['total'], updated_at=now)
+                for row in rows
+            ],
+            batch_size=500,
+        )
+    return len(rows)
@@ -0,0 +1,79 @@
+"""
+SQLite connection tuning.
+
+Every new SQLite connection gets settings.SQLITE_PRAGMAS applied through the
+connection_created signal (connected in PatientsConfig.ready). With WAL
+journaling readers no longer block the writer, and the busy timeout makes
+concurrent writers queue for the lock instead of failing immediately with
+"database is locked".
+
+The journal mode is different: it is stored in the database file itself, so
+it is only switched by server processes (wsgi.py/asgi.py call
+enable_journal_mode_switch()). Management commands such as check,
+makemigrations or test leave the file's mode alone, and the -wal/-shm
+files (git-ignored) only appear next to a database a server has run on.
+"""
+import os
+import sqlite3
+
+from django.conf import settings
+from django.db import connections
+
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    """Run `PRAGMA name = value` for each pragma (works on Django and sqlite3 cursors)."""
+    pragmas = settings.SQLITE_PRAGMAS if pragmas is None else pragmas
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+# Set by the server entry points; see the module docstring
+_switch_journal_mode = False
+
+
+def enable_journal_mode_switch():
+    """Let new connections switch the database to settings.SQLITE_PRAGMAS['journal_mode']."""
+    global _switch_journal_mode
+    _switch_journal_mode = True
+
+
+def is_read_only(connection):
+    return 'mode=ro' in str(connection.settings_dict['NAME'])
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = dict(settings.SQLITE_PRAGMAS)
+    journal_mode = pragmas.pop('journal_mode', None)
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor, pragmas)
+        # Changing the journal mode is a write, so read-only connections never do
+        if journal_mode and _switch_journal_mode and not is_read_only(connection):
+            cursor.execute("PRAGMA journal_mode")
+            if cursor.fetchone()[0].lower() != journal_mode.lower():
+                cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+
+
+def refresh_replica_snapshot():
+    """
+    Copy the primary SQLite database to settings.DB_REPLICA_SNAPSHOT with the
+    online backup API, then swap it in with an atomic rename. Returns False
+    when no snapshot replica is configured.
+    """
+    target = settings.DB_REPLICA_SNAPSHOT
+    if not target:
+        return False
+    staging = f"{target}.tmp"
+    source = sqlite3.connect(str(connections['default'].settings_dict['NAME']))
+    try:
+        destination = sqlite3.connect(staging)
+        try:
+            source.backup(destination)
+            destination.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            destination.close()
+    finally:
+        source.close()
+    os.replace(staging, target)
+    return True
@@ -0,0 +1,180 @@
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+# Background delivery (EMAIL_OUTBOX_FLUSH_ON_COMMIT): one worker thread per
+# process, woken after commits; commits made while it is busy coalesce into
+# a single extra pass.
+_flush_wakeup = threading.Event()
+_flush_worker = None
+_flush_worker_lock = threading.Lock()
+
+
+def build_email(subject, body, recipients, html_body=None, from_email=None):
+    """Build an unsaved OutboundEmail (for bulk_create)."""
+    return OutboundEmail(
+        subject=subject,
+        body=body,
+        html_body=html_body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipients),
+    )
+
+
+def queue_email(subject, body, recipients, html_body=None, from_email=None):
+    """
+    Queue an email for delivery instead of sending it inside the request.
+    The message is delivered by the scheduler's send_queued_emails job (or
+    `manage.py send_queued_emails`) and, when EMAIL_OUTBOX_FLUSH_ON_COMMIT
+    is enabled, by the background worker once the surrounding transaction
+    commits.
+    """
+    email = build_email(subject, body, recipients, html_body=html_body, from_email=from_email)
+    email.save()
+    schedule_flush()
+    return email
+
+
+def schedule_flush():
+    """Wake the background delivery worker after the current transaction commits."""
+    if getattr(settings, 'EMAIL_OUTBOX_FLUSH_ON_COMMIT', False):
+        transaction.on_commit(_wake_flush_worker)
+
+
+def _wake_flush_worker():
+    global _flush_worker
+    with _flush_worker_lock:
+        if _flush_worker is None or not _flush_worker.is_alive():
+            _flush_worker = threading.Thread(target=_flush_loop, name='email-outbox', daemon=True)
+            _flush_worker.start()
+    _flush_wakeup.set()
+
+
+def _flush_loop():
+    while True:
+        _flush_wakeup.wait()
+        _flush_wakeup.clear()
+        try:
+            # Bounded: anything left over is picked up by the scheduler's send_queued_emails job
+            for _ in range(settings.EMAIL_OUTBOX_FLUSH_MAX_BATCHES):
+                if send_queued_emails()['claimed'] < settings.EMAIL_OUTBOX_BATCH_SIZE:
+                    break
+        except Exception as e:
+            logger.error(f"Background email flush failed: {str(e)}", exc_info=True)
+        finally:
+            db_connection.close()
+
+
+def get_retry_delay(attempts):
+    """Exponential backoff: base * 2^(attempts - 1), capped."""
+    base = settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS
+    delay = base * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS))
+
+
+def _claim_batch(batch_size, now, ids=None):
+    """
+    Mark up to `batch_size` due messages (only those in `ids`, if given) as
+    owned by this worker and return them. Claimed rows are pushed forward by
+    EMAIL_OUTBOX_CLAIM_SECONDS so a crashed worker's batch becomes due again
+    instead of being lost.
+    """
+    due = OutboundEmail.objects.filter(status='PENDING', next_attempt_at__lte=now)
+    if ids is not None:
+        due = due.filter(id__in=ids)
+    due_ids = list(
+        due.order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not due_ids:
+        return []
+    token = uuid.uuid4().hex
+    OutboundEmail.objects.filter(
+        id__in=due_ids, status='PENDING', next_attempt_at__lte=now
+    ).update(
+        claim_token=token,
+        next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_CLAIM_SECONDS),
+    )
+    return list(OutboundEmail.objects.filter(claim_token=token).order_by('id'))
+
+
+def send_queued_emails(batch_size=None, max_attempts=None, ids=None):
+    """
+    Deliver one batch of due messages over a single SMTP connection,
+    restricted to the OutboundEmail ids in `ids` if given.
+    Returns a dict with claimed/sent/retried/failed counts.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    now = timezone.now()
+    stats = {'claimed': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+    emails = _claim_batch(batch_size, now, ids=ids)
+    stats['claimed'] = len(emails)
+    if not emails:
+        return stats
+
+    def record_failure(email, error):
+        email.attempts += 1
+        email.last_error = error
+        email.claim_token = ''
+        if email.attempts >= max_attempts:
+            email.status = 'FAILED'
+            stats['failed'] += 1
+            logger.error(f"Giving up on email {email.id} after {email.attempts} attempt(s): {error}")
+        else:
+            email.next_attempt_at = timezone.now() + get_retry_delay(email.attempts)
+            stats['retried'] += 1
+
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            record_failure(email, f"Could not open connection: {str(e)}")
+    else:
+        try:
+            for email in emails:
+                message = EmailMultiAlternatives(
+                    email.subject,
+                    email.body,
+                    email.from_email or settings.DEFAULT_FROM_EMAIL,
+                    email.recipients,
+                    connection=connection,
+                )
+                if email.html_body:
+                    message.attach_alternative(email.html_body, "text/html")
+                try:
+                    message.send()
+                except Exception as e:
+                    record_failure(email, str(e))
+                    continue
+                email.attempts += 1
+                email.status = 'SENT'
+                email.sent_at = timezone.now()
+                email.last_error = None
+                email.claim_token = ''
+                stats['sent'] += 1
+        finally:
+            connection.close()
+
+    for email in emails:
+        email.updated_at = timezone.now()
+    OutboundEmail.objects.bulk_update(
+        emails,
+        ['status', 'attempts', 'last_error', 'next_attempt_at', 'claim_token', 'sent_at', 'updated_at'],
+    )
+    logger.info(
+        f"Email outbox: {stats['sent']} sent, {stats['retried']} to retry, {stats['failed']} failed"
+    )
+    return stats
@@ -1,12 +1,14 @@
 from django import forms
 from .models import Patient, UltrasoundExam, Appointment
+from .availability import get_day_slots, get_slot_index, next_free_slots
 from billing.models import ServiceType
 from django.contrib.auth.forms import PasswordChangeForm, UserChangeForm, UserChangeForm, UserCreationForm
 from django.contrib.auth.models import User
-from datetime import date, timedelta
+from datetime import date, datetime, timedelta
 import json
 import os
 from django.conf import settings
+from django.utils import timezone
 
 class PatientForm(forms.ModelForm):
     # Add help text for address fields
@@ -224,6 +226,36 @@ class UltrasoundExamForm(forms.ModelForm):
         self.fields['procedure_type'].queryset = ServiceType.objects.filter(is_active=True)
         self.fields['procedure_type'].empty_label = "Select a procedure type..." 
 
+def check_slot_available(form, procedure, appointment_date, appointment_time, current=None):
+    """
+    Early, non-locking capacity check for the booking forms; suggests the next
+    free slots when the chosen one is full. The booking itself is still
+    enforced atomically by Appointment.save(enforce_capacity=True).
+    `current` is the appointment being rescheduled, whose own slot is skipped.
+    """
+    if not (procedure and appointment_date and appointment_time):
+        return
+    index = get_slot_index(appointment_date, appointment_time)
+    if index is None:
+        return
+    if current is not None and current.pk and (
+        current.get_original_value('appointment_date') == appointment_date
+        and get_slot_index(appointment_date, current.get_original_value('appointment_time')) == index
+    ):
+        return
+    remaining = get_day_slots(procedure, appointment_date)[index][1]
+    if remaining is None or remaining > 0:
+        return
+    requested = timezone.make_aware(datetime.combine(appointment_date, appointment_time))
+    suggestions = ', '.join(
+        slot.strftime('%b %d, %I:%M %p')
+        for slot in next_free_slots(procedure, count=3, after=max(requested, timezone.now()))
+    )
+    message = "This time slot is fully booked."
+    if suggestions:
+        message += f" Next available: {suggestions}."
+    form.add_error('appointment_time', message)
+
 class AppointmentForm(forms.ModelForm):
     """Form for patients to book appointments."""
 
@@ -301,12 +333,22 @@ class AppointmentForm(forms.ModelForm):
         appointment_date = self.cleaned_data.get('appointment_date')
         
         if appointment_date and appointment_time:
-            # Check if appointment is within clinic hours (8 AM to 5 PM)
-            if appointment_time < appointment_time.replace(hour=8, minute=0) or appointment_time > appointment_time.replace(hour=17, minute=0):
-                raise forms.ValidationError("Appointments are only available between 8:00 AM and 5:00 PM.")
+            # Check if appointment is within clinic hours (settings.CLINIC_OPENING_HOURS)
+            if get_slot_index(appointment_date, appointment_time) is None:
+                raise forms.ValidationError("Appointments are only available during clinic hours.")
         
         return appointment_time
 
+    def clean(self):
+        cleaned_data = super().clean()
+        check_slot_available(
+            self,
+            cleaned_data.get('procedure_type'),
+            cleaned_data.get('appointment_date'),
+            cleaned_data.get('appointment_time'),
+        )
+        return cleaned_data
+
 class AppointmentUpdateForm(forms.ModelForm):
     """Form for patients to update their appointments."""
     
@@ -340,6 +382,24 @@ class AppointmentUpdateForm(forms.ModelForm):
             raise forms.ValidationError("Appointment date cannot be in the past.")
         return appointment_date
 
+    def clean_appointment_time(self):
+        appointment_time = self.cleaned_data.get('appointment_time')
+        appointment_date = self.cleaned_data.get('appointment_date')
+        if appointment_date and appointment_time and get_slot_index(appointment_date, appointment_time) is None:
+            raise forms.ValidationError("Appointments are only available during clinic hours.")
+        return appointment_time
+
+    def clean(self):
+        cleaned_data = super().clean()
+        check_slot_available(
+            self,
+            self.instance.procedure_type,
+            cleaned_data.get('appointment_date'),
+            cleaned_data.get('appointment_time'),
+            current=self.instance,
+        )
+        return cleaned_data
+
 class StaffUserForm(forms.ModelForm):
     """Form for editing staff user information."""
     
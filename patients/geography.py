@@ -0,0 +1,179 @@
+"""
+Revenue and patient counts by patient address (region > province > city).
+
+One grouped query sums PAID/PARTIAL bills per stored (region, province,
+city) triple; the region and province subtotals and the grand total are
+rolled up in Python, like SQL's ROLLUP. Each patient has a single address,
+so the distinct-patient counts of the groups never overlap and add up
+exactly.
+
+Stored codes are resolved against the PSGC files in
+static/philippine-addresses, read once per process (the Gazetteer):
+numeric codes are padded to the width the files use (older rows saved them
+without the leading zero), and a blank region or province is filled in
+from the city or province code it contains. Values that are not codes at
+all (free text from before the address pickers) are kept as their own
+areas, named as entered.
+"""
+import dataclasses
+import json
+import os
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .kpis import REVENUE_STATUSES
+from .routers import use_replica
+
+UNSPECIFIED = 'Unspecified'
+LEVELS = ('region', 'province', 'city')
+
+# Width of each level's PSGC code in the address files
+CODE_WIDTHS = {'region': 2, 'province': 4, 'city': 6}
+
+
+class Gazetteer:
+    """PSGC names and parents, keyed by zero-padded code."""
+
+    def __init__(self, regions, provinces, cities):
+        self.region_names = {r['region_code']: r['region_name'] for r in regions}
+        self.province_names = {p['province_code']: p['province_name'] for p in provinces}
+        self.province_regions = {p['province_code']: p['region_code'] for p in provinces}
+        self.city_names = {c['city_code']: c['city_name'] for c in cities}
+        self.city_provinces = {c['city_code']: c['province_code'] for c in cities}
+        self.names = {'region': self.region_names, 'province': self.province_names, 'city': self.city_names}
+
+    @classmethod
+    def load(cls, directory=None):
+        directory = directory or os.path.join(settings.BASE_DIR, 'static', 'philippine-addresses')
+
+        def read(filename):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as file:
+                return json.load(file)
+
+        return cls(read('region.json'), read('province.json'), read('city.json'))
+
+    @staticmethod
+    def normalize(level, code):
+        """The code as the address files spell it: stripped, and zero-padded if numeric."""
+        code = (code or '').strip()
+        return code.zfill(CODE_WIDTHS[level]) if code.isdigit() else code
+
+    def resolve(self, region, province, city):
+        """Normalized (region, province, city) codes, with blank parents filled in from their children."""
+        region = self.normalize('region', region)
+        province = self.normalize('province', province)
+        city = self.normalize('city', city)
+        if not province:
+            province = self.city_provinces.get(city, '')
+        if not region:
+            region = self.province_regions.get(province, '')
+        return region, province, city
+
+    def name(self, level, code):
+        if not code:
+            return UNSPECIFIED
+        return self.names[level].get(code, code)
+
+
+@lru_cache(maxsize=None)
+def get_gazetteer():
+    return Gazetteer.load()
+
+
+@dataclasses.dataclass(frozen=True)
+class Area:
+    level: str  # 'region', 'province' or 'city'
+    code: str  # normalized code; '' for patients without one at this level
+    name: str
+    revenue: Decimal
+    patients: int
+    children: tuple = ()  # Area one level down, highest revenue first
+
+    @property
+    def specified(self):
+        return bool(self.code)
+
+    def child(self, code):
+        return next((area for area in self.children if area.code == code), None)
+
+    def as_dict(self):
+        return {
+            'level': self.level,
+            'code': self.code,
+            'name': self.name,
+            'revenue': float(self.revenue),
+            'patients': self.patients,
+            'has_children': bool(self.children),
+        }
+
+
+@dataclasses.dataclass(frozen=True)
+class GeographyReport:
+    revenue: Decimal
+    patients: int
+    regions: tuple  # Area, highest revenue first
+
+    def region(self, code):
+        return next((area for area in self.regions if area.code == code), None)
+
+    def cities(self):
+        """Every city across regions, highest revenue first."""
+        cities = [city for region in self.regions for province in region.children for city in province.children]
+        cities.sort(key=lambda area: -area.revenue)
+        return cities
+
+
+def _rollup(groups, gazetteer, depth=0):
+    """Nested Areas from {(region, province, city): [revenue, patients]}, summing each level's children."""
+    level = LEVELS[depth]
+    branches = {}
+    for key, totals in groups.items():
+        branches.setdefault(key[0], {})[key[1:]] = totals
+
+    areas = []
+    for code, rest in branches.items():
+        if depth < len(LEVELS) - 1:
+            children = _rollup(rest, gazetteer, depth + 1)
+            revenue = sum((child.revenue for child in children), Decimal('0'))
+            patients = sum(child.patients for child in children)
+        else:
+            children = ()
+            revenue, patients = rest[()]
+        areas.append(Area(level, code, gazetteer.name(level, code), revenue, patients, children))
+    areas.sort(key=lambda area: (-area.revenue, area.name))
+    return tuple(areas)
+
+
+@use_replica()
+def revenue_by_geography(start_date=None, end_date=None):
+    """GeographyReport of PAID/PARTIAL bills dated start_date..end_date (None leaves that end open)."""
+    from billing.models import Bill
+
+    bills = Bill.objects.filter(status__in=REVENUE_STATUSES)
+    if start_date:
+        bills = bills.filter(bill_date__gte=start_date)
+    if end_date:
+        bills = bills.filter(bill_date__lte=end_date)
+    rows = (
+        bills.values_list('patient__region', 'patient__province', 'patient__city')
+        .annotate(revenue=Sum('total_amount'), patients=Count('patient', distinct=True))
+        .order_by()
+    )
+
+    gazetteer = get_gazetteer()
+    groups = {}
+    for region, province, city, revenue, patients in rows:
+        # Rows spelling the same place differently (padded or not) merge here
+        totals = groups.setdefault(gazetteer.resolve(region, province, city), [Decimal('0'), 0])
+        totals[0] += revenue or Decimal('0')
+        totals[1] += patients
+
+    regions = _rollup(groups, gazetteer)
+    return GeographyReport(
+        revenue=sum((area.revenue for area in regions), Decimal('0')),
+        patients=sum(area.patients for area in regions),
+        regions=regions,
+    )
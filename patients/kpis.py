@@ -0,0 +1,163 @@
+"""
+Headline numbers for the home and admin dashboards.
+
+Each table is read with a single conditional-aggregate query
+(Count/Sum with filter=Q(...)), so a dashboard costs a handful of queries
+instead of one per number. The result is an immutable KPISnapshot, cached
+for settings.KPI_CACHE_SECONDS and shared by both dashboards.
+"""
+import dataclasses
+import datetime
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .analytics import visit_cohort
+from .routers import use_replica
+
+CACHE_KEY = 'dashboard_kpis'
+TREND_MONTHS = 6
+REVENUE_STATUSES = ('PAID', 'PARTIAL')
+
+
+@dataclasses.dataclass(frozen=True)
+class KPISnapshot:
+    as_of: datetime.date
+
+    # Patients ("total" excludes archived patients, "all" includes them)
+    total_patients: int
+    all_patients: int
+    new_patients_month: int
+    all_new_patients_month: int
+
+    # Exams
+    total_procedures: int
+    patients_with_exams: int
+    active_patients_90d: int
+    returning_rate: float  # % of patients seen in the last 6 months with 2+ exams
+
+    # Bills
+    total_revenue: Decimal  # PAID bills
+    weekly_revenue: Decimal  # PAID/PARTIAL bills since Monday
+    pending_bills: int
+    paid_bills: int
+    partial_bills: int
+
+    # Appointments
+    pending_appointments: int
+    today_appointments: int
+
+    # The last TREND_MONTHS calendar months, oldest first
+    trend_months: tuple  # first day of each month
+    monthly_revenue: tuple  # PAID/PARTIAL bills
+    monthly_procedures: tuple
+    monthly_new_patients: tuple  # not archived
+
+    @property
+    def avg_procedures_per_patient(self):
+        return self.total_procedures / self.patients_with_exams if self.patients_with_exams else 0
+
+
+def month_starts(today, count):
+    """First day of the last `count` calendar months (including this one), oldest first."""
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(count):
+        starts.append(datetime.date(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+
+def _month_filters(lookup, months):
+    """One Q per month in `months`, e.g. lookup='exam_date' -> exam_date in [start, next start)."""
+    filters = []
+    for start, end in zip(months, months[1:] + [None]):
+        condition = Q(**{f'{lookup}__gte': start})
+        if end:
+            condition &= Q(**{f'{lookup}__lt': end})
+        filters.append(condition)
+    return filters
+
+
+@use_replica()
+def compute_kpis(today=None):
+    """Build a fresh KPISnapshot (five queries)."""
+    from billing.models import Bill
+    from .models import Appointment, Patient, UltrasoundExam
+
+    today = today or timezone.now().date()
+    month_start = today.replace(day=1)
+    week_start = today - timedelta(days=today.weekday())
+    months = month_starts(today, TREND_MONTHS)
+
+    patients = Patient.objects.aggregate(
+        total=Count('id', filter=Q(is_archived=False)),
+        all=Count('id'),
+        new_month=Count('id', filter=Q(is_archived=False, created_at__date__gte=month_start)),
+        all_new_month=Count('id', filter=Q(created_at__date__gte=month_start)),
+        **{
+            f'month_{i}': Count('id', filter=Q(is_archived=False) & condition)
+            for i, condition in enumerate(_month_filters('created_at__date', months))
+        },
+    )
+    exams = UltrasoundExam.objects.aggregate(
+        total=Count('id'),
+        patients=Count('patient', distinct=True),
+        active_90d=Count('patient', distinct=True, filter=Q(exam_date__gte=today - timedelta(days=90))),
+        **{
+            f'month_{i}': Count('id', filter=condition)
+            for i, condition in enumerate(_month_filters('exam_date', months))
+        },
+    )
+    bills = Bill.objects.aggregate(
+        revenue=Sum('total_amount', filter=Q(status='PAID')),
+        weekly=Sum('total_amount', filter=Q(status__in=REVENUE_STATUSES, bill_date__gte=week_start)),
+        pending=Count('id', filter=Q(status='PENDING')),
+        paid=Count('id', filter=Q(status='PAID')),
+        partial=Count('id', filter=Q(status='PARTIAL')),
+        **{
+            f'month_{i}': Sum('total_amount', filter=Q(status__in=REVENUE_STATUSES) & condition)
+            for i, condition in enumerate(_month_filters('bill_date', months))
+        },
+    )
+    appointments = Appointment.objects.aggregate(
+        pending=Count('id', filter=Q(status='PENDING')),
+        today=Count('id', filter=Q(appointment_date=today)),
+    )
+
+    return KPISnapshot(
+        as_of=today,
+        total_patients=patients['total'],
+        all_patients=patients['all'],
+        new_patients_month=patients['new_month'],
+        all_new_patients_month=patients['all_new_month'],
+        total_procedures=exams['total'],
+        patients_with_exams=exams['patients'],
+        active_patients_90d=exams['active_90d'],
+        returning_rate=visit_cohort(today - timedelta(days=180)).returning_rate,
+        total_revenue=bills['revenue'] or Decimal('0'),
+        weekly_revenue=bills['weekly'] or Decimal('0'),
+        pending_bills=bills['pending'],
+        paid_bills=bills['paid'],
+        partial_bills=bills['partial'],
+        pending_appointments=appointments['pending'],
+        today_appointments=appointments['today'],
+        trend_months=tuple(months),
+        monthly_revenue=tuple(bills[f'month_{i}'] or Decimal('0') for i in range(len(months))),
+        monthly_procedures=tuple(exams[f'month_{i}'] for i in range(len(months))),
+        monthly_new_patients=tuple(patients[f'month_{i}'] for i in range(len(months))),
+    )
+
+
+def get_kpis(refresh=False):
+    """Today's KPISnapshot, from the cache when it is fresh enough."""
+    today = timezone.now().date()
+    snapshot = None if refresh else cache.get(CACHE_KEY)
+    if snapshot is None or snapshot.as_of != today:
+        snapshot = compute_kpis(today)
+        cache.set(CACHE_KEY, snapshot, settings.KPI_CACHE_SECONDS)
+    return snapshot
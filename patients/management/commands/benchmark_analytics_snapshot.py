@@ -0,0 +1,161 @@
+import random
+import time
+from array import array
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from patients.analytics_snapshot import AnalyticsSnapshot
+from patients.kpis import month_starts
+
+SERVICES = {1: 'Abdominal Ultrasound', 2: 'Pelvic Ultrasound', 3: 'Obstetric Ultrasound',
+            4: 'Transvaginal Ultrasound', 5: 'Breast Ultrasound', 6: 'Thyroid Ultrasound'}
+PRICES = [Decimal('800.00'), Decimal('1000.00'), Decimal('1250.50'), Decimal('1500.00')]
+STATUSES = ['PAID'] * 6 + ['PARTIAL', 'PENDING', 'CANCELLED']
+
+
+def column_bytes(value):
+    """Bytes held in the array columns reachable from `value`."""
+    if isinstance(value, array):
+        return value.itemsize * len(value)
+    if isinstance(value, dict):
+        return sum(column_bytes(item) for item in value.values())
+    if hasattr(value, '__dict__'):
+        return sum(column_bytes(item) for item in vars(value).values())
+    return 0
+
+
+class Command(BaseCommand):
+    help = (
+        'Build an analytics snapshot from synthetic in-memory rows (nothing is written to the '
+        'database) and time the date-window queries behind the admin analytics page'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exams', type=int, default=1_000_000, help='Synthetic exams (default: 1,000,000)')
+        parser.add_argument('--patients', type=int, default=200_000, help='Synthetic patients (default: 200,000)')
+        parser.add_argument('--years', type=int, default=5, help='Years of history (default: 5)')
+        parser.add_argument('--changes', type=int, default=200,
+                            help='Rows changed for the incremental refresh timing (default: 200)')
+        parser.add_argument('--from-database', action='store_true',
+                            help='Time loading the snapshot from the configured database instead')
+
+    def synthetic_rows(self, exams, patients, years, today):
+        rng = random.Random(42)
+        now = timezone.now()
+        days = years * 365
+        patient_rows = [
+            (
+                pk,
+                now - timedelta(days=rng.randrange(days), seconds=rng.randrange(86400)),
+                rng.choice('MF'),
+                rng.choice(['REGULAR', 'REGULAR', 'SENIOR', 'PWD']),
+                today - timedelta(days=rng.randrange(365 * 90)) if rng.random() < 0.9 else None,
+                f'First{pk}',
+                f'Last{pk}',
+            )
+            for pk in range(1, patients + 1)
+        ]
+        patient_types = {row[0]: row[3] for row in patient_rows}
+
+        exam_rows, bill_rows, item_rows, payment_rows = [], [], [], []
+        dates = sorted(today - timedelta(days=rng.randrange(days)) for _ in range(exams))
+        for pk, exam_date in enumerate(dates, 1):
+            patient_id = rng.randrange(1, patients + 1)
+            service_id = rng.choice(list(SERVICES))
+            exam_rows.append((pk, exam_date, patient_id, service_id, rng.choice(['FI', 'FU', 'RS', 'BI', 'NF'])))
+            # One bill per exam, numbered like the exams so both arrive in (date, id) order
+            status, amount = rng.choice(STATUSES), rng.choice(PRICES)
+            bill_rows.append((pk, exam_date, patient_id, status, amount, patient_types[patient_id]))
+            if status in ('PAID', 'PARTIAL'):
+                item_rows.append((pk, exam_date, service_id, amount))
+                payment_rows.append((pk, exam_date, amount, rng.choice(['CASH', 'GCASH', 'BANK'])))
+        return patient_rows, exam_rows, bill_rows, item_rows, payment_rows
+
+    def page_queries(self, snapshot, start, end, today):
+        """The snapshot calls get_analytics_context makes for one date filter."""
+        snapshot.revenue(today - timedelta(days=today.weekday()))
+        snapshot.patients_seen(start or today - timedelta(days=90), end)
+        snapshot.new_patients(start or today.replace(day=1), end)
+        snapshot.patients_seen(start, end)
+        snapshot.exam_count(start, end)
+        snapshot.visit_cohort(start or today - timedelta(days=180), end)
+        snapshot.exams_by_procedure(start, end)
+        snapshot.exams_by_finding(start, end)
+        snapshot.daily_revenue(today - timedelta(days=364), today)
+        snapshot.daily_exams_by_procedure(today - timedelta(days=89), today)
+        snapshot.patients_by_sex()
+        snapshot.patients_by_type()
+        snapshot.age_buckets(today)
+        snapshot.top_patients(start, end)
+        snapshot.revenue_by_service(start, end)
+        snapshot.revenue_by_payment_method(start, end)
+        snapshot.revenue_by_patient_type(start, end)
+        months = month_starts(today, 12)
+        for month_start, next_month in zip(months, months[1:] + [None]):
+            month_end = next_month - timedelta(days=1) if next_month else None
+            snapshot.revenue(month_start, month_end)
+            snapshot.expenses(month_start, month_end)
+        snapshot.revenue(start, end)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        if options['from_database']:
+            started = time.perf_counter()
+            snapshot = AnalyticsSnapshot.load()
+            self.stdout.write(f"Loaded {len(snapshot.exams):,} exams and {len(snapshot.bills):,} bills "
+                              f"from the database in {time.perf_counter() - started:.2f}s")
+        else:
+            started = time.perf_counter()
+            patients, exams, bills, items, payments = self.synthetic_rows(
+                options['exams'], options['patients'], options['years'], today
+            )
+            self.stdout.write(f"Generated {len(exams):,} exams, {len(bills):,} bills and {len(patients):,} "
+                              f"patients in {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            snapshot = AnalyticsSnapshot()
+            snapshot.service_names = dict(SERVICES)
+            snapshot.add_patients(patients)
+            snapshot.add_exams(exams)
+            snapshot.add_bills(bills, items, payments)
+            snapshot._mark_refreshed(timezone.now())
+            self.stdout.write(f"Built the snapshot in {time.perf_counter() - started:.2f}s "
+                              f"({column_bytes(snapshot) / 1e6:.0f} MB of columns)")
+
+        windows = [
+            ('all time', None, None),
+            ('last 7 days', today - timedelta(days=7), today),
+            ('last 30 days', today - timedelta(days=30), today),
+            ('this month', today.replace(day=1), today),
+            ('this year', today.replace(month=1, day=1), today),
+        ]
+        for label, start, end in windows:
+            self.page_queries(snapshot, start, end, today)  # warm up
+            started = time.perf_counter()
+            self.page_queries(snapshot, start, end, today)
+            self.stdout.write(f"  {label:<14} {(time.perf_counter() - started) * 1000:8.1f} ms per page")
+
+        if not options['from_database']:
+            # New exams and bills today, plus re-dated older ones, applied incrementally
+            changes = options['changes']
+            rng = random.Random(7)
+            next_id = len(snapshot.exams) + 1
+            redated = iter(rng.sample(range(1, next_id), changes // 2))
+            exam_rows, bill_rows, item_rows, payment_rows = [], [], [], []
+            for offset in range(changes):
+                new = offset % 2 == 0
+                pk = next_id + offset if new else next(redated)
+                day = today if new else today - timedelta(days=rng.randrange(365))
+                patient_id = rng.randrange(1, options['patients'] + 1)
+                exam_rows.append((pk, day, patient_id, 1, 'FU'))
+                bill_rows.append((pk, day, patient_id, 'PAID', PRICES[0], 'REGULAR'))
+                item_rows.append((pk, day, 1, PRICES[0]))
+                payment_rows.append((pk, day, PRICES[0], 'CASH'))
+            started = time.perf_counter()
+            snapshot.apply_exams(exam_rows)
+            snapshot.apply_bills(bill_rows, item_rows, payment_rows)
+            self.stdout.write(f"Applied {changes} changed exams and bills in "
+                              f"{(time.perf_counter() - started) * 1000:.1f} ms")
@@ -0,0 +1,118 @@
+import re
+import time
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.shortcuts import redirect
+from django.test import RequestFactory
+
+from patients.middleware import NavigationControlMiddleware
+from patients import route_policy
+
+
+def legacy_process_request(request):
+    """
+    The per-request evaluation NavigationControlMiddleware used before the
+    policy was precompiled: fresh lists every call and one re.match/re.search
+    per pattern. Kept here only as the benchmark baseline.
+    """
+    for skip_path in ['/forbidden/', '/admin/', '/static/', '/media/', '/favicon.ico', '/robots.txt']:
+        if request.path.startswith(skip_path):
+            return None
+
+    if request.user.is_authenticated:
+        if not request.user.is_staff:
+            allowed_paths = [
+                '/patient-portal/', '/patient-login/', '/patient-logout/', '/patient-exam/',
+                '/patient-settings/', '/patient-appointments/', '/patient-bills/', '/',
+            ]
+            if not any(request.path.startswith(path) for path in allowed_paths):
+                return redirect('patient-portal')
+    else:
+        allowed_paths = ['/', '/staff-login/', '/patient-login/', '/static/', '/media/']
+        if not any(request.path.startswith(path) for path in allowed_paths):
+            return redirect('landing')
+
+    for pattern in list(route_policy.GUARDED_PATTERNS):
+        if re.match(pattern, request.path):
+            if request.method == 'POST':
+                continue
+            referer = request.META.get('HTTP_REFERER', '')
+            if not referer:
+                return redirect('forbidden')
+            if not referer.startswith(request.build_absolute_uri('/')):
+                return redirect('forbidden')
+            if not any(re.search(ref, referer) for ref in list(route_policy.REFERRER_PATTERNS)):
+                return redirect('forbidden')
+    return None
+
+
+SAMPLE_PATHS = [
+    '/', '/patients/', '/patient/12/', '/patient/12/update/', '/patient/12/exam/new/',
+    '/exam/40/update/', '/image/7/annotate/', '/staff/appointments/', '/staff/appointments/9/',
+    '/custom-admin/users/3/edit/', '/patient-portal/', '/patient-appointments/5/cancel/',
+    '/billing/bills/', '/api/appointments/availability/', '/static/css/app.css', '/admin/',
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare the precompiled navigation policy with the previous per-request pattern loops'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000,
+                            help='Passes over the sample requests (default: 2000)')
+
+    def build_requests(self):
+        factory = RequestFactory()
+        users = [
+            AnonymousUser(),
+            SimpleNamespace(is_authenticated=True, is_staff=True),
+            SimpleNamespace(is_authenticated=True, is_staff=False),
+        ]
+        requests = []
+        for path in SAMPLE_PATHS:
+            for user in users:
+                for referer in ('', 'http://testserver/patients/', 'http://elsewhere.example/'):
+                    request = factory.get(path, HTTP_REFERER=referer) if referer else factory.get(path)
+                    request.user = user
+                    requests.append(request)
+        return requests
+
+    def time_it(self, evaluate, requests, iterations):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            for request in requests:
+                evaluate(request)
+        elapsed = time.perf_counter() - started
+        return elapsed / (iterations * len(requests)) * 1e6
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        requests = self.build_requests()
+        middleware = NavigationControlMiddleware(lambda request: None)
+
+        def outcome(response):
+            return getattr(response, 'url', None)
+
+        mismatches = [
+            request.path for request in requests
+            if outcome(legacy_process_request(request)) != outcome(middleware.process_request(request))
+        ]
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"Decisions differ for: {', '.join(sorted(set(mismatches)))}"))
+            return
+
+        def uncached(request):
+            route_policy.classify.cache_clear()
+            return middleware.process_request(request)
+
+        legacy = self.time_it(legacy_process_request, requests, iterations)
+        compiled = self.time_it(middleware.process_request, requests, iterations)
+        cold = self.time_it(uncached, requests, iterations)
+
+        self.stdout.write(f"{len(requests)} sample requests x {iterations} passes; decisions identical.")
+        self.stdout.write(f"  legacy loops:           {legacy:8.2f} us/request")
+        self.stdout.write(f"  compiled, cache cold:   {cold:8.2f} us/request")
+        self.stdout.write(f"  compiled, cached:       {compiled:8.2f} us/request")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up (cached): {legacy / compiled:.1f}x"))
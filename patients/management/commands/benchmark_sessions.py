@@ -0,0 +1,90 @@
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from patients.sessions import CACHE_ONLY_KEY
+
+ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'tiered': 'patients.sessions',
+}
+
+
+class SessionQueryCounter:
+    """execute_wrapper that counts statements against the session table."""
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if 'django_session' in sql:
+            if sql.lstrip().upper().startswith('SELECT'):
+                self.reads += 1
+            else:
+                self.writes += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay simulated portal traffic through each session engine and report '
+        'how many session-table reads and writes (SQLite write locks) it costs'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50, help='Simulated portal users (default: 50)')
+        parser.add_argument('--requests', type=int, default=40, help='Requests per user (default: 40)')
+        parser.add_argument('--write-every', type=int, default=4,
+                            help='Every Nth request modifies the session (default: 4)')
+
+    def replay(self, engine, cache_only, users, requests, write_every):
+        SessionStore = import_module(engine).SessionStore
+        keys = []
+        for user in range(users):
+            # Login: a fresh session holding the auth keys
+            session = SessionStore()
+            if cache_only:
+                session[CACHE_ONLY_KEY] = True
+            session['_auth_user_id'] = str(user)
+            session.save(must_create=True)
+            keys.append(session.session_key)
+
+        for request in range(requests):
+            for user, key in enumerate(keys):
+                # What SessionMiddleware does: load lazily, save only if modified
+                session = SessionStore(key)
+                session.get('_auth_user_id')
+                if request % write_every == 0:
+                    session['last_seen'] = request
+                if session.modified:
+                    session.save()
+
+        for key in keys:
+            SessionStore(key).flush()
+
+    def handle(self, *args, **options):
+        users, requests, write_every = options['users'], options['requests'], options['write_every']
+        self.stdout.write(f"{users} users x {requests} requests, every {write_every}th request modifies the session")
+
+        scenarios = [
+            ('db', ENGINES['db'], False),
+            ('cached_db', ENGINES['cached_db'], False),
+            ('tiered (staff)', ENGINES['tiered'], False),
+            ('tiered (patient)', ENGINES['tiered'], True),
+        ]
+        for label, engine, cache_only in scenarios:
+            counter = SessionQueryCounter()
+            started = time.perf_counter()
+            # Roll back so the benchmark leaves no session rows behind
+            with transaction.atomic(), connection.execute_wrapper(counter):
+                self.replay(engine, cache_only, users, requests, write_every)
+                transaction.set_rollback(True)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  {label:<17} reads {counter.reads:6}  writes {counter.writes:6}  {elapsed:6.2f}s"
+            )
+        self.stdout.write(self.style.SUCCESS("Done. Every session write takes SQLite's database-wide write lock."))
@@ -3,6 +3,7 @@ from django.db import transaction
 from django.utils import timezone
 
 from patients.models import Patient, UltrasoundExam, Appointment
+from patients.visit_stats import refresh_visit_stats
 from billing.models import Bill
 
 
@@ -87,6 +88,7 @@ class Command(BaseCommand):
                     UltrasoundExam.objects.filter(patient=dup).update(patient=canonical)
                     Appointment.objects.filter(patient=dup).update(patient=canonical)
                     Bill.objects.filter(patient=dup).update(patient=canonical)
+                    refresh_visit_stats([dup.id, canonical.id])
 
                     if hard_delete:
                         # Permanently remove the duplicate record
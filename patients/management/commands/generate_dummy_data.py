@@ -6,6 +6,7 @@ from decimal import Decimal
 
 from patients.models import Patient, UltrasoundExam, Appointment
 from billing.models import ServiceType, Bill, BillItem, Payment
+from billing.services import create_bill_for_exams
 
 class Command(BaseCommand):
     help = 'Generate comprehensive dummy data for the ultrasound clinic system'
@@ -205,42 +206,40 @@ class Command(BaseCommand):
                 patient_exam_groups[key] = []
             patient_exam_groups[key].append(exam)
         
-        for (patient, exam_date), exam_list in patient_exam_groups.items():
-            # Only create bills for 80% of exam groups
-            if random.random() < 0.8:
-                # Calculate total amount
-                total_amount = sum(exam.procedure_type.base_price for exam in exam_list)
-                
-                # Create bill
-                discount_amount = Decimal(random.randint(0, int(total_amount * Decimal('0.1'))))  # 0-10% discount
-                bill = Bill.objects.create(
-                    patient=patient,
-                    bill_date=exam_date,
-                    subtotal=total_amount,
-                    discount=discount_amount,
-                    tax=Decimal(0),  # No tax for simplicity
-                    total_amount=total_amount - discount_amount,
-                    status=random.choice(['PENDING', 'PARTIAL', 'PAID', 'CANCELLED']),
-                    notes=f"Bill for {len(exam_list)} procedures on {exam_date}",
-                    created_at=timezone.now() - timedelta(days=random.randint(1, 365))
-                )
-                
-                # Create bill items
-                for exam in exam_list:
-                    BillItem.objects.create(
-                        bill=bill,
-                        exam=exam,
-                        service=exam.procedure_type,
-                        amount=exam.procedure_type.base_price,
-                        notes=f"Bill item for {exam.procedure_type.name}"
-                    )
-                
-                # Create payments for PAID and PARTIAL bills
-                if bill.status in ['PAID', 'PARTIAL']:
-                    self.create_payments_for_bill(bill)
-                
-                bills.append(bill)
-                
+        # Only create bills for 80% of exam groups
+        billed_groups = [
+            (key, exam_list) for key, exam_list in patient_exam_groups.items()
+            if random.random() < 0.8
+        ]
+
+        # Reserve all bill numbers in one round trip instead of one per bill
+        bill_numbers = iter(Bill.allocate_bill_numbers(len(billed_groups))) if billed_groups else iter(())
+        
+        for (patient, exam_date), exam_list in billed_groups:
+            # Calculate total amount
+            total_amount = sum(exam.procedure_type.base_price for exam in exam_list)
+            
+            # Create bill
+            discount_amount = Decimal(random.randint(0, int(total_amount * Decimal('0.1'))))  # 0-10% discount
+            bill = create_bill_for_exams(
+                patient,
+                exam_list,
+                bill_number=next(bill_numbers),
+                bill_date=exam_date,
+                discount=discount_amount,
+                tax=Decimal(0),  # No tax for simplicity
+                status=random.choice(['PENDING', 'PARTIAL', 'PAID', 'CANCELLED']),
+                notes=f"Bill for {len(exam_list)} procedures on {exam_date}",
+                created_at=timezone.now() - timedelta(days=random.randint(1, 365)),
+                item_notes=lambda exam: f"Bill item for {exam.procedure_type.name}",
+            )
+            
+            # Create payments for PAID and PARTIAL bills
+            if bill.status in ['PAID', 'PARTIAL']:
+                self.create_payments_for_bill(bill)
+            
+            bills.append(bill)
+            
         return bills
 
     def create_payments_for_bill(self, bill):
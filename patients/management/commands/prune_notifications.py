@@ -0,0 +1,77 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from patients.notification_retention import FROM_SETTINGS, prune_notifications
+
+
+class Command(BaseCommand):
+    help = 'Compact expired notifications into per-user daily digests and delete them in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--read-days',
+            type=int,
+            default=None,
+            help=f'Delete read notifications older than this many days (default: {settings.NOTIFICATION_READ_TTL_DAYS})'
+        )
+        parser.add_argument(
+            '--unread-days',
+            type=int,
+            default=None,
+            help=f'Delete unread notifications older than this many days (default: {settings.NOTIFICATION_UNREAD_TTL_DAYS})'
+        )
+        parser.add_argument(
+            '--keep-unread',
+            action='store_true',
+            help='Never delete unread notifications, whatever their age'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help=f'Rows deleted per transaction (default: {settings.NOTIFICATION_PRUNE_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=None,
+            help=f'Seconds to sleep between batches (default: {settings.NOTIFICATION_PRUNE_BATCH_PAUSE})'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the notifications that would be removed'
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_unread']:
+            unread_ttl_days = None
+        elif options['unread_days'] is not None:
+            unread_ttl_days = options['unread_days']
+        else:
+            unread_ttl_days = FROM_SETTINGS
+
+        stats = prune_notifications(
+            read_ttl_days=options['read_days'],
+            unread_ttl_days=unread_ttl_days,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            dry_run=options['dry_run'],
+        )
+
+        if options['dry_run']:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"DRY RUN: Would compact and delete {stats['rows_matched']} notification(s)."
+                )
+            )
+            return
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Deleted {stats['rows_deleted']} notification(s) in {stats['batches']} batch(es) "
+                f"({stats['elapsed_seconds']}s)."
+            )
+        )
+        self.stdout.write(
+            f"Digests created: {stats['digests_created']}, digests updated: {stats['digests_updated']}"
+        )
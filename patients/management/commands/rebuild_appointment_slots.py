@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+from patients.availability import rebuild_slot_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the appointment slot counters used for availability from the appointments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            type=parse_date,
+            default=None,
+            help='First day to rebuild, YYYY-MM-DD (default: today)'
+        )
+
+    def handle(self, *args, **options):
+        rows = rebuild_slot_counts(since=options['since'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} appointment slot counter(s)."))
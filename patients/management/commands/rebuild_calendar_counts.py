@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from patients.calendar_counts import rebuild_day_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the per-day appointment counters behind the staff calendar'
+
+    def handle(self, *args, **options):
+        rows = rebuild_day_counts()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} day/status counter(s)."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from patients.visit_stats import find_drift, rebuild_visit_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute patients' last visit date and exam count from their exams"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='Only report patients whose stored stats are out of date')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drifted = find_drift()
+            if drifted:
+                self.stdout.write(self.style.WARNING(
+                    f"{len(drifted)} patient(s) out of date: {', '.join(map(str, drifted[:20]))}"
+                    + (' ...' if len(drifted) > 20 else '')
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS("All patient visit stats are up to date."))
+            return
+        updated = rebuild_visit_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt visit stats for {updated} patient(s)."))
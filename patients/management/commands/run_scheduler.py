@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from patients import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run periodic maintenance jobs (overdue cancellation, reminders, email, retention)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due once and exit'
+        )
+        parser.add_argument(
+            '--job',
+            choices=sorted(scheduler.JOBS),
+            help='Run a single job immediately, regardless of its interval, and exit'
+        )
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=settings.SCHEDULER_TICK_SECONDS,
+            help=f'Seconds between checks for due jobs (default: {settings.SCHEDULER_TICK_SECONDS})'
+        )
+
+    def handle(self, *args, **options):
+        if options['job']:
+            owner = scheduler.make_owner_id()
+            if not scheduler.acquire_lease(owner):
+                raise CommandError('Another scheduler is running; not starting the job.')
+            try:
+                with scheduler.LeaseHeartbeat(owner):
+                    succeeded = scheduler.run_job(options['job'])
+            finally:
+                scheduler.release_lease(owner)
+            if not succeeded:
+                raise CommandError(f"Job {options['job']} failed; see the log for details.")
+            self.stdout.write(self.style.SUCCESS(f"Job {options['job']} finished."))
+            return
+
+        intervals = scheduler.get_job_intervals()
+        self.stdout.write(
+            'Scheduled jobs: ' + ', '.join(f'{name} (every {int(interval.total_seconds())}s)' for name, interval in intervals.items())
+        )
+        try:
+            ran = scheduler.run_scheduler(tick=options['tick'], once=options['once'], stdout=self.stdout)
+        except KeyboardInterrupt:
+            self.stdout.write('Scheduler stopped.')
+            return
+        if options['once'] and not ran:
+            raise CommandError('Another scheduler is running.')
@@ -8,6 +8,7 @@ from django.utils import timezone
 
 from patients.models import Patient, Appointment, UltrasoundExam
 from billing.models import ServiceType, Bill, BillItem, Payment, Expense
+from billing.services import create_bill_for_exams
 
 
 class Command(BaseCommand):
@@ -79,10 +80,10 @@ class Command(BaseCommand):
             )
 
             # 2 exams
-            bill = None
+            exams = []
             for _ in range(2):
                 service = random.choice(services)
-                exam = UltrasoundExam.objects.create(
+                exams.append(UltrasoundExam.objects.create(
                     patient=patient,
                     status='COMPLETED' if appointment.status == 'COMPLETED' else 'PENDING',
                     referring_physician=random.choice(["Dr. Smith", "Dr. Johnson", "Dr. Lee", "Dr. Garcia", "Dr. Reyes"]),
@@ -92,26 +93,10 @@ class Command(BaseCommand):
                     findings="Normal findings." if random.random() > 0.4 else "Some abnormalities noted.",
                     impression="No significant abnormality." if random.random() > 0.5 else "Requires further evaluation.",
                     recommendations=random.choice(['NF', 'FU', 'RS', 'BI', 'FI']),
-                )
-
-                # Create or reuse bill
-                if not bill:
-                    bill, _ = Bill.objects.get_or_create(
-                        patient=patient,
-                        bill_date=app_date,
-                        defaults={'subtotal': 0, 'discount': 0, 'tax': 0, 'total_amount': 0, 'status': 'PENDING'}
-                    )
-
-                # BillItem
-                BillItem.objects.create(
-                    bill=bill,
-                    exam=exam,
-                    service=service,
-                    amount=service.base_price
-                )
+                ))
 
-                # Recalculate totals
-                bill.calculate_totals()
+            # One bill for both exams, totals computed once
+            bill = create_bill_for_exams(patient, exams, bill_date=app_date, status='PENDING')
 
             # MODIFICATION 3: Always full payment (100%)
             if bill:
@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from patients.email_outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued outbound emails over a single reused connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help=f'Messages sent per connection (default: {settings.EMAIL_OUTBOX_BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll the outbox every --interval seconds'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds between polls when running with --loop (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            totals = {'sent': 0, 'retried': 0, 'failed': 0}
+            while True:
+                stats = send_queued_emails(batch_size=options['batch_size'])
+                for key in totals:
+                    totals[key] += stats[key]
+                if stats['claimed'] < options['batch_size']:
+                    break
+
+            if totals['sent'] or totals['retried'] or totals['failed'] or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"Sent {totals['sent']} email(s), {totals['retried']} scheduled for retry, "
+                        f"{totals['failed']} failed permanently."
+                    )
+                )
+
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from patients.db import apply_sqlite_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        'Concurrency stress test on a scratch SQLite file: writer and reader threads '
+        'with default settings vs. the tuned pragmas in settings.SQLITE_PRAGMAS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads (default: 4)')
+        parser.add_argument('--readers', type=int, default=4, help='Reader threads (default: 4)')
+        parser.add_argument('--seconds', type=float, default=5, help='Duration of each run (default: 5)')
+
+    def connect(self, path, timeout, pragmas):
+        db = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        apply_sqlite_pragmas(db.cursor(), pragmas)
+        return db
+
+    def run_scenario(self, timeout, pragmas, writers, readers, seconds):
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        setup = self.connect(path, timeout, pragmas)
+        setup.executescript(
+            "CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT INTO counter (id, value) VALUES (1, 0);"
+            "CREATE TABLE event (id INTEGER PRIMARY KEY, note TEXT, created REAL);"
+        )
+        stats = {'writes': 0, 'reads': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + seconds
+
+        def bump(key):
+            with lock:
+                stats[key] += 1
+
+        def writer(number):
+            db = self.connect(path, timeout, pragmas)
+            while time.monotonic() < deadline:
+                try:
+                    # Write-first transaction, as the app's atomic blocks do
+                    db.execute("BEGIN")
+                    db.execute("UPDATE counter SET value = value + 1 WHERE id = 1")
+                    db.execute("INSERT INTO event (note, created) VALUES (?, ?)", (f"writer {number}", time.time()))
+                    db.execute("COMMIT")
+                    bump('writes')
+                except sqlite3.OperationalError:
+                    if db.in_transaction:
+                        db.execute("ROLLBACK")
+                    bump('locked')
+            db.close()
+
+        def reader():
+            db = self.connect(path, timeout, pragmas)
+            while time.monotonic() < deadline:
+                try:
+                    db.execute("SELECT COUNT(*), MAX(created) FROM event").fetchone()
+                    bump('reads')
+                except sqlite3.OperationalError:
+                    bump('locked')
+            db.close()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+        threads += [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        setup.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        return stats
+
+    def handle(self, *args, **options):
+        writers, readers, seconds = options['writers'], options['readers'], options['seconds']
+        self.stdout.write(f"{writers} writer + {readers} reader threads, {seconds:g}s per run")
+        scenarios = [
+            # sqlite3's defaults: rollback journal, synchronous=FULL, 5s lock wait
+            ('default', 5.0, {}),
+            ('tuned', settings.DATABASES['default'].get('OPTIONS', {}).get('timeout', 5.0), settings.SQLITE_PRAGMAS),
+        ]
+        for label, timeout, pragmas in scenarios:
+            stats = self.run_scenario(timeout, pragmas, writers, readers, seconds)
+            self.stdout.write(
+                f"  {label:<8} writes/s {stats['writes'] / seconds:9.0f}  reads/s {stats['reads'] / seconds:9.0f}"
+                f"  locked errors {stats['locked']}"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:32
+
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def slot_index(day, at_time):
+    """Index of the slot containing `at_time` on `day`, or None outside opening hours (closing time included)."""
+    hours = settings.CLINIC_OPENING_HOURS.get(day.weekday())
+    if not hours:
+        return None
+    opening = datetime.combine(day, time.fromisoformat(hours[0]))
+    closing = datetime.combine(day, time.fromisoformat(hours[1]))
+    step = timedelta(minutes=settings.APPOINTMENT_SLOT_MINUTES)
+    moment = datetime.combine(day, at_time)
+    if moment < opening or moment > closing:
+        return None
+    return (moment - opening) // step
+
+
+def fill_slot_counters(apps, schema_editor):
+    """Count today's and future active appointments into their slots."""
+    Appointment = apps.get_model('patients', 'Appointment')
+    AppointmentSlot = apps.get_model('patients', 'AppointmentSlot')
+    counts = Counter()
+    appointments = Appointment.objects.filter(
+        appointment_date__gte=timezone.localdate(),
+        status__in=['PENDING', 'CONFIRMED', 'COMPLETED'],
+    ).values_list('procedure_type', 'appointment_date', 'appointment_time')
+    for procedure, day, at_time in appointments:
+        index = slot_index(day, at_time)
+        if index is not None:
+            counts[((procedure or '').strip().lower(), day, index)] += 1
+    AppointmentSlot.objects.bulk_create(
+        [
+            AppointmentSlot(procedure=procedure, slot_date=day, slot_index=index, booked=booked)
+            for (procedure, day, index), booked in counts.items()
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0036_scheduler'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('procedure', models.CharField(help_text='Normalized (lowercase) procedure name', max_length=100)),
+                ('slot_date', models.DateField()),
+                ('slot_index', models.PositiveSmallIntegerField(help_text='Slot number from opening time')),
+                ('booked', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['slot_date', 'slot_index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentslot',
+            constraint=models.UniqueConstraint(fields=('procedure', 'slot_date', 'slot_index'), name='unique_appointment_slot'),
+        ),
+        migrations.RunPython(fill_slot_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:34
+
+from django.db import migrations, models
+import django.utils.timezone
+from django.db.models import Count
+
+
+def fill_day_counts(apps, schema_editor):
+    """Count the existing appointments per day and status."""
+    Appointment = apps.get_model('patients', 'Appointment')
+    AppointmentDayCount = apps.get_model('patients', 'AppointmentDayCount')
+    rows = Appointment.objects.values('appointment_date', 'status').annotate(total=Count('id')).order_by()
+    AppointmentDayCount.objects.bulk_create(
+        [AppointmentDayCount(day=row['appointment_date'], status=row['status'], count=row['total']) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0037_appointment_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentDayCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CONFIRMED', 'Confirmed'), ('CANCELLED', 'Cancelled'), ('COMPLETED', 'Completed')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['day', 'status'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentdaycount',
+            constraint=models.UniqueConstraint(fields=('day', 'status'), name='unique_appointment_day_count'),
+        ),
+        migrations.RunPython(fill_day_counts, migrations.RunPython.noop),
+    ]
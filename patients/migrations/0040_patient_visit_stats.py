@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:46
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_visit_stats(apps, schema_editor):
+    """Compute last visit date and exam count for existing patients."""
+    Patient = apps.get_model('patients', 'Patient')
+    UltrasoundExam = apps.get_model('patients', 'UltrasoundExam')
+    exams = UltrasoundExam.objects.filter(patient=OuterRef('pk')).order_by().values('patient')
+    Patient.objects.update(
+        last_visit_date=Subquery(exams.annotate(last=Max('exam_date')).values('last')[:1]),
+        exam_count=Coalesce(
+            Subquery(exams.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()), 0
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0039_appointment_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='exam_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='last_visit_date',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_visit_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 23:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0040_patient_visit_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['is_archived', 'created_at', 'id'], name='patient_archived_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['is_archived', 'archived_at', 'id'], name='patient_archived_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ultrasoundexam',
+            index=models.Index(fields=['exam_date', 'id'], name='exam_date_id_idx'),
+        ),
+    ]
@@ -5,6 +5,7 @@ import json
 import os
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from .tracking import FieldTrackingMixin
 
 class FamilyGroup(models.Model):
     name = models.CharField(max_length=100)
@@ -65,10 +66,25 @@ class Patient(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
     archived_at = models.DateTimeField(null=True, blank=True)
+    # Maintained from UltrasoundExam saves/deletes (patients/visit_stats.py)
+    last_visit_date = models.DateField(null=True, blank=True, db_index=True)
+    exam_count = models.PositiveIntegerField(default=0)
+
+    VISIT_STAT_FIELDS = ('last_visit_date', 'exam_count')
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.contact_number}"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None:
+            # A full save (e.g. the edit form) must not overwrite visit stats
+            # that exam changes updated since this instance was loaded
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VISIT_STAT_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def delete(self, using=None, keep_parents=False):
         """Soft-delete: archive instead of removing from the database.
         If already archived, perform a hard delete via hard_delete().
@@ -139,6 +155,11 @@ class Patient(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the patient lists (patients/pagination.py)
+            models.Index(fields=['is_archived', 'created_at', 'id'], name='patient_archived_created_idx'),
+            models.Index(fields=['is_archived', 'archived_at', 'id'], name='patient_archived_at_idx'),
+        ]
 
 class UltrasoundImage(models.Model):
     exam = models.ForeignKey('UltrasoundExam', on_delete=models.CASCADE, related_name='images')
@@ -200,7 +221,7 @@ class UltrasoundImage(models.Model):
 #     def __str__(self):
 #         return f"Thyroid Measurements for {self.ultrasound_image}"
 
-class UltrasoundExam(models.Model):
+class UltrasoundExam(FieldTrackingMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('COMPLETED', 'Completed'),
@@ -244,10 +265,15 @@ class UltrasoundExam(models.Model):
     def __str__(self):
         return f"{self.patient.first_name} {self.patient.last_name} - {self.exam_date}"
 
+    tracked_fields = ('status', 'patient_id', 'exam_date')
+
     class Meta:
-        ordering = ['-exam_date', '-exam_time'] 
+        ordering = ['-exam_date', '-exam_time']
+        indexes = [
+            models.Index(fields=['exam_date', 'id'], name='exam_date_id_idx'),
+        ]
 
-class Appointment(models.Model):
+class Appointment(FieldTrackingMixin, models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending'),
         ('CONFIRMED', 'Confirmed'),
@@ -283,8 +309,15 @@ class Appointment(models.Model):
         null=True, 
         blank=True)  
     
+    tracked_fields = ('status', 'procedure_type', 'appointment_date', 'appointment_time')
+
     class Meta:
         ordering = ['-appointment_date', '-appointment_time']
+        indexes = [
+            # Keyset pagination of the staff list (newest booked first)
+            models.Index(fields=['created_at', 'id'], name='appt_created_id_idx'),
+            models.Index(fields=['appointment_date', 'status'], name='appt_date_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.patient.first_name} {self.patient.last_name} - {self.procedure_type} on {self.appointment_date}"
@@ -319,36 +352,84 @@ class Appointment(models.Model):
         return False
     
     @classmethod
-    def cancel_overdue_appointments(cls, days_overdue=3):
-        """Cancel all appointments that are overdue by the specified number of days."""
+    def get_overdue_appointments(cls, days_overdue=3):
+        """Open appointments whose date is more than `days_overdue` days in the past."""
         from django.utils import timezone
         from datetime import timedelta
-        
-        today = timezone.now().date()
-        cutoff_date = today - timedelta(days=days_overdue)
-        
-        overdue_appointments = cls.objects.filter(
+
+        cutoff_date = timezone.now().date() - timedelta(days=days_overdue)
+        return cls.objects.filter(
             appointment_date__lt=cutoff_date,
             status__in=['PENDING', 'CONFIRMED']
         )
-        
-        count = overdue_appointments.update(status='CANCELLED')
-        return count
+
+    @classmethod
+    def cancel_overdue_appointments(cls, days_overdue=3, notify=False):
+        """
+        Cancel all appointments that are overdue by the specified number of days.
+
+        The overdue rows are read once (for logging and notifications) and
+        cancelled with a single UPDATE, in one transaction with the slot and
+        day-counter bookkeeping for the rows it changed. With `notify`, patients
+        with portal accounts get their cancellation notifications from one bulk
+        insert. Returns the number of appointments cancelled.
+        """
+        from django.utils import timezone
+        import logging
+
+        from django.db import transaction
+        from .availability import release_appointment_slots
+        from .calendar_counts import update_loaded_status
+
+        open_statuses = ['PENDING', 'CONFIRMED']
+        with transaction.atomic():
+            overdue = list(
+                cls.get_overdue_appointments(days_overdue).select_for_update(of=('self',))
+                .select_related('patient').order_by('id')
+            )
+            if not overdue:
+                return 0
+            # Rows completed or cancelled since they were read keep their slot and counts
+            overdue = update_loaded_status(overdue, 'CANCELLED', open_statuses, completed_on=None)
+            release_appointment_slots(overdue)
+
+        logger = logging.getLogger(__name__)
+        today = timezone.now().date()
+        for appointment in overdue:
+            logger.info(
+                f"Cancelled overdue appointment {appointment.id} "
+                f"(Patient: {appointment.patient}, Date: {appointment.appointment_date}, "
+                f"{(today - appointment.appointment_date).days} days overdue, Previous status: {appointment.status})"
+            )
+
+        if notify:
+            from .notification_utils import notify_patients_appointments_cancelled
+            notify_patients_appointments_cancelled(overdue)
+        return len(overdue)
 
     def save(self, *args, **kwargs):
+        """
+        Pass enforce_capacity=True when a patient books or reschedules: the slot
+        counter is then only taken if the slot still has room, otherwise
+        availability.SlotUnavailable is raised and nothing is saved.
+        """
+        from django.db import transaction
         from django.utils import timezone
-        try:
-            old_instance = type(self).objects.get(pk=self.pk)
-            old_status = old_instance.status
-        except type(self).DoesNotExist:
-            old_status = None
+        from .availability import apply_slot_change, get_slot_change
+
+        enforce_capacity = kwargs.pop('enforce_capacity', False)
+        old_status = None if self._state.adding else self.get_original_value('status')
 
         if self.status == 'COMPLETED' and (old_status != 'COMPLETED' or self.completed_on is None):
             self.completed_on = timezone.now()
         elif self.status != 'COMPLETED':
             self.completed_on = None
 
-        super().save(*args, **kwargs)
+        slot_change = get_slot_change(self, enforce=enforce_capacity)
+        with transaction.atomic():
+            apply_slot_change(slot_change)
+            super().save(*args, **kwargs)
+
 
 class Notification(models.Model):
     NOTIFICATION_TYPES = [
@@ -372,6 +453,130 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_read', 'created_at'], name='notif_read_created_idx'),
+        ]
     
     def __str__(self):
-        return f"{self.title} - {self.user.username}" 
\ No newline at end of file
+        return f"{self.title} - {self.user.username}"
+
+
+class NotificationDigest(models.Model):
+    """Per-user daily rollup of notifications removed by the retention job."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_digests')
+    digest_date = models.DateField()
+    notification_count = models.PositiveIntegerField(default=0)
+    unread_count = models.PositiveIntegerField(default=0)
+    type_counts = models.JSONField(default=dict, help_text="Number of compacted notifications per notification type")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-digest_date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'digest_date'], name='unique_notification_digest_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.digest_date} ({self.notification_count} notifications)"
+
+
+class OutboundEmail(models.Model):
+    """Email queued for delivery by the outbox worker (see patients/email_outbox.py)."""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=254, blank=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=32, blank=True, default='')
+    sent_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class ScheduledJob(models.Model):
+    """Run history of a periodic maintenance job (see patients/scheduler.py)."""
+    name = models.CharField(max_length=100, unique=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+    last_duration = models.FloatField(null=True, blank=True, help_text="Seconds taken by the last run")
+    last_succeeded = models.BooleanField(null=True)
+    last_error = models.TextField(blank=True, null=True)
+    run_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class SchedulerLease(models.Model):
+    """Lock row held by the running scheduler; it expires unless renewed."""
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.owner} until {self.expires_at}"
+
+
+class AppointmentSlot(models.Model):
+    """
+    Number of active appointments booked into one time slot for one procedure.
+    Bookings take a unit with a conditional UPDATE (see patients/availability.py),
+    so concurrent requests can't push a slot past its capacity.
+    """
+    procedure = models.CharField(max_length=100, help_text="Normalized (lowercase) procedure name")
+    slot_date = models.DateField()
+    slot_index = models.PositiveSmallIntegerField(help_text="Slot number from opening time")
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['slot_date', 'slot_index']
+        constraints = [
+            models.UniqueConstraint(fields=['procedure', 'slot_date', 'slot_index'], name='unique_appointment_slot'),
+        ]
+
+    def __str__(self):
+        return f"{self.procedure} {self.slot_date} #{self.slot_index}: {self.booked} booked"
+
+
+class AppointmentDayCount(models.Model):
+    """
+    Number of appointments per day and status, kept up to date by the
+    Appointment signals in patients/signals.py and by the bulk status updates
+    (see patients/calendar_counts.py). Backs the staff calendar counts API.
+    """
+    day = models.DateField()
+    status = models.CharField(max_length=10, choices=Appointment.STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['day', 'status']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='unique_appointment_day_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.status}: {self.count}"
@@ -0,0 +1,155 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Notification, NotificationDigest
+
+logger = logging.getLogger(__name__)
+
+# Default for unread_ttl_days: use NOTIFICATION_UNREAD_TTL_DAYS (None there keeps unread forever)
+FROM_SETTINGS = object()
+
+
+def get_expired_notifications(read_ttl_days=None, unread_ttl_days=FROM_SETTINGS, now=None):
+    """
+    Return the queryset of notifications that are past their retention period.
+    Read notifications expire after `read_ttl_days` (default
+    NOTIFICATION_READ_TTL_DAYS); unread ones after `unread_ttl_days`, which
+    defaults to NOTIFICATION_UNREAD_TTL_DAYS. Passing None keeps unread
+    notifications forever.
+    """
+    now = now or timezone.now()
+    if read_ttl_days is None:
+        read_ttl_days = settings.NOTIFICATION_READ_TTL_DAYS
+    if unread_ttl_days is FROM_SETTINGS:
+        unread_ttl_days = getattr(settings, 'NOTIFICATION_UNREAD_TTL_DAYS', None)
+
+    expired = Q(is_read=True, created_at__lt=now - timedelta(days=read_ttl_days))
+    if unread_ttl_days is not None:
+        expired |= Q(is_read=False, created_at__lt=now - timedelta(days=unread_ttl_days))
+    return Notification.objects.filter(expired)
+
+
+def _compact_into_digests(batch):
+    """
+    Fold a batch of notifications into per-user daily digests.
+    Returns (digests_created, digests_updated).
+    """
+    rows = (
+        batch.annotate(day=TruncDate('created_at'))
+        .values('user_id', 'day', 'notification_type')
+        .annotate(total=Count('id'), unread=Count('id', filter=Q(is_read=False)))
+        .order_by()
+    )
+
+    totals = defaultdict(lambda: {'total': 0, 'unread': 0, 'types': defaultdict(int)})
+    for row in rows:
+        entry = totals[(row['user_id'], row['day'])]
+        entry['total'] += row['total']
+        entry['unread'] += row['unread']
+        entry['types'][row['notification_type']] += row['total']
+
+    if not totals:
+        return 0, 0
+
+    existing = {
+        (digest.user_id, digest.digest_date): digest
+        for digest in NotificationDigest.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in totals},
+            digest_date__in={day for _, day in totals},
+        )
+    }
+
+    to_create = []
+    to_update = []
+    for (user_id, day), entry in totals.items():
+        digest = existing.get((user_id, day))
+        if digest is None:
+            to_create.append(NotificationDigest(
+                user_id=user_id,
+                digest_date=day,
+                notification_count=entry['total'],
+                unread_count=entry['unread'],
+                type_counts=dict(entry['types']),
+            ))
+            continue
+        digest.notification_count += entry['total']
+        digest.unread_count += entry['unread']
+        type_counts = dict(digest.type_counts or {})
+        for notification_type, count in entry['types'].items():
+            type_counts[notification_type] = type_counts.get(notification_type, 0) + count
+        digest.type_counts = type_counts
+        digest.updated_at = timezone.now()
+        to_update.append(digest)
+
+    NotificationDigest.objects.bulk_create(to_create)
+    NotificationDigest.objects.bulk_update(
+        to_update, ['notification_count', 'unread_count', 'type_counts', 'updated_at']
+    )
+    return len(to_create), len(to_update)
+
+
+def prune_notifications(read_ttl_days=None, unread_ttl_days=FROM_SETTINGS, batch_size=None,
+                        pause=None, dry_run=False, now=None):
+    """
+    Compact expired notifications into daily digests and delete them.
+
+    Work is done in batches of `batch_size` rows, each in its own short
+    transaction, sleeping `pause` seconds in between so the SQLite write
+    lock is never held for long. Returns a dict of metrics.
+    """
+    if batch_size is None:
+        batch_size = settings.NOTIFICATION_PRUNE_BATCH_SIZE
+    if pause is None:
+        pause = settings.NOTIFICATION_PRUNE_BATCH_PAUSE
+
+    expired = get_expired_notifications(read_ttl_days, unread_ttl_days, now=now)
+    stats = {
+        'rows_matched': 0,
+        'rows_deleted': 0,
+        'digests_created': 0,
+        'digests_updated': 0,
+        'batches': 0,
+        'elapsed_seconds': 0.0,
+    }
+    started = time.monotonic()
+
+    if dry_run:
+        stats['rows_matched'] = expired.count()
+        stats['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        return stats
+
+    while True:
+        with transaction.atomic():
+            ids = list(expired.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            batch = Notification.objects.filter(id__in=ids)
+            created, updated = _compact_into_digests(batch)
+            deleted, _ = batch.delete()
+
+        stats['rows_matched'] += len(ids)
+        stats['rows_deleted'] += deleted
+        stats['digests_created'] += created
+        stats['digests_updated'] += updated
+        stats['batches'] += 1
+
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    stats['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    logger.info(
+        f"Notification retention: deleted {stats['rows_deleted']} row(s) in {stats['batches']} batch(es), "
+        f"{stats['digests_created']} digest(s) created, {stats['digests_updated']} updated "
+        f"({stats['elapsed_seconds']}s)"
+    )
+    return stats
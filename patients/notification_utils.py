@@ -38,6 +38,35 @@ def send_notification_sync(user_id, notification_type, title, message, appointme
     
     return notification
 
+def send_notifications_bulk(notifications):
+    """
+    Bulk counterpart of send_notification_sync: insert unsaved Notification
+    objects with one query and push them all from a single WebSocket thread.
+    """
+    notifications = Notification.objects.bulk_create(notifications)
+    if not notifications:
+        return notifications
+
+    def run_async_notifications():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            for notification in notifications:
+                loop.run_until_complete(send_notification_to_user(
+                    user_id=notification.user_id,
+                    notification_type=notification.notification_type,
+                    title=notification.title,
+                    message=notification.message,
+                    appointment_id=notification.appointment_id
+                ))
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run_async_notifications)
+    thread.start()
+
+    return notifications
+
 def notify_staff_new_appointment(appointment):
     """
     Send notification to all staff members about a new appointment.
@@ -76,6 +105,23 @@ def notify_patient_appointment_update(appointment, action):
         appointment_id=appointment.id
     )
 
+def notify_patients_appointments_cancelled(appointments):
+    """
+    Notify every patient (with a portal account) whose appointment was cancelled.
+    Expects appointments with `patient` selected.
+    """
+    return send_notifications_bulk([
+        Notification(
+            user_id=appointment.patient.user_id,
+            notification_type='APPOINTMENT_CANCELLED',
+            title='Appointment Cancelled',
+            message=f'Your {appointment.procedure_type} appointment on {appointment.appointment_date} at {appointment.appointment_time} has been cancelled.',
+            appointment_id=appointment.id
+        )
+        for appointment in appointments
+        if appointment.patient.user_id
+    ])
+
 def notify_staff_new_exam(exam):
     """
     Send notification to all staff members about a new exam.
@@ -0,0 +1,287 @@
+import base64
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _json_default(value):
+    # Full precision: DjangoJSONEncoder would truncate microseconds, which
+    # breaks the seek on auto_now_add timestamps
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__} in a cursor")
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset (iterable like a Paginator page)."""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, params,
+                 number=None, count=None, count_is_exact=True):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # Page number, when known (kept in the query string alongside the cursor)
+        self.number = number
+        # Row count, capped at the paginator's count_limit; None if not counted
+        self.count = count
+        self.count_is_exact = count_is_exact
+        self._params = params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def _querystring(self, key=None, cursor=None, number=None):
+        params = self._params.copy()
+        for name in (KeysetPaginator.after_param, KeysetPaginator.before_param, KeysetPaginator.page_param):
+            params.pop(name, None)
+        if key:
+            params[key] = cursor
+        if number:
+            params[KeysetPaginator.page_param] = number
+        return params.urlencode()
+
+    @property
+    def first_querystring(self):
+        return self._querystring()
+
+    @property
+    def next_querystring(self):
+        if not self.has_next:
+            return ''
+        return self._querystring(KeysetPaginator.after_param, self.next_cursor,
+                                 self.number + 1 if self.number else None)
+
+    @property
+    def previous_querystring(self):
+        if not self.has_previous:
+            return ''
+        if self.number == 2:
+            return self.first_querystring
+        return self._querystring(KeysetPaginator.before_param, self.previous_cursor,
+                                 self.number - 1 if self.number else None)
+
+
+class KeysetPaginator:
+    """
+    Cursor ("seek") pagination over a fixed ordering, e.g. ('-created_at', '-id').
+
+    Instead of OFFSET, each page filters on the ordering values of the last
+    (or first) row of the previous page, so fetching page 500 costs the same
+    as page 1 and rows inserted meanwhile don't shift the pages. Pages are
+    addressed with opaque `after`/`before` cursors in the query string.
+
+    The ordering defaults to the queryset's own and may follow relations
+    ('patient__last_name'); the primary key is appended as a tie-breaker
+    when missing. NULLs sort as the smallest value in both directions.
+    Old `?page=N` links without a cursor are still served, with one OFFSET
+    query, and later pages continue by cursor. Set `count_limit` to show a
+    row count that stops counting after that many rows ("1000+").
+    """
+    after_param = 'after'
+    before_param = 'before'
+    page_param = 'page'
+
+    def __init__(self, queryset, ordering=None, per_page=25, count_limit=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.count_limit = count_limit
+        model = queryset.model
+        if ordering is None:
+            ordering = queryset.query.order_by or (model._meta.ordering if queryset.query.default_ordering else ())
+        pk_name = model._meta.pk.name
+        self.fields, self.descending = [], []
+        for name in ordering:
+            if not isinstance(name, str) or name == '?':
+                raise ValueError(f"Keyset pagination needs field-name ordering, got {name!r}")
+            field = name.lstrip('-')
+            self.fields.append(pk_name if field == 'pk' else field)
+            self.descending.append(name.startswith('-'))
+        if pk_name not in self.fields:
+            self.fields.append(pk_name)
+            self.descending.append(self.descending[-1] if self.descending else False)
+        self.model_fields = [self._resolve(model, field) for field in self.fields]
+        self.ordering = tuple(f"{'-' if desc else ''}{field}" for field, desc in zip(self.fields, self.descending))
+
+    @staticmethod
+    def _resolve(model, path):
+        """(model field, nullable) for an ordering path, following relations."""
+        nullable = False
+        parts = path.split('__')
+        for part in parts[:-1]:
+            relation = model._meta.get_field(part)
+            nullable = nullable or relation.null
+            model = relation.related_model
+        field = model._meta.get_field(parts[-1])
+        if field.is_relation:
+            raise ValueError(f"Order by the column ({field.attname}), not the relation ({path})")
+        return field, nullable or field.null
+
+    def _order_by(self, reverse=False):
+        expressions = []
+        for field, descending, (_, nullable) in zip(self.fields, self.descending, self.model_fields):
+            descending = descending != reverse
+            if nullable:
+                expression = F(field)
+                expressions.append(expression.desc(nulls_last=True) if descending else expression.asc(nulls_first=True))
+            else:
+                expressions.append(f"{'-' if descending else ''}{field}")
+        return expressions
+
+    def _value(self, obj, field):
+        for part in field.split('__'):
+            if obj is None:
+                return None
+            obj = getattr(obj, part)
+        return obj
+
+    def encode_cursor(self, obj):
+        values = [self._value(obj, field) for field in self.fields]
+        raw = json.dumps(values, default=_json_default)
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            decoded = []
+            for (field, nullable), value in zip(self.model_fields, values):
+                if value is None and not nullable:
+                    raise ValueError
+                decoded.append(None if value is None else field.to_python(value))
+            return decoded
+        except (ValueError, TypeError, ValidationError, UnicodeDecodeError) as e:
+            raise InvalidCursor(str(e))
+
+    def _seek(self, values, forward):
+        """Rows strictly after (forward) or before the row with these ordering values."""
+        condition = Q()
+        for position, (field, descending) in enumerate(zip(self.fields, self.descending)):
+            value = values[position]
+            nullable = self.model_fields[position][1]
+            if descending == forward:
+                # Smaller values; nothing sorts below NULL
+                if value is None:
+                    continue
+                step = Q(**{f'{field}__lt': value})
+                if nullable:
+                    step |= Q(**{f'{field}__isnull': True})
+            else:
+                step = Q(**{f'{field}__isnull': False}) if value is None else Q(**{f'{field}__gt': value})
+            for previous_field, previous_value in zip(self.fields[:position], values[:position]):
+                if previous_value is None:
+                    step &= Q(**{f'{previous_field}__isnull': True})
+                else:
+                    step &= Q(**{previous_field: previous_value})
+            condition |= step
+        return condition if condition else Q(pk__in=[])
+
+    def _page_number(self, params):
+        try:
+            number = int(params.get(self.page_param) or 1)
+        except (TypeError, ValueError):
+            return 1
+        return max(number, 1)
+
+    def count(self):
+        """(count, exact): counts at most count_limit + 1 rows."""
+        if self.count_limit is None:
+            return None, True
+        count = self.queryset.order_by()[:self.count_limit + 1].count()
+        return min(count, self.count_limit), count <= self.count_limit
+
+    def get_page(self, params):
+        """
+        Page for the request's query parameters (a QueryDict). An invalid
+        cursor, a cursor with nothing beyond it, or an out-of-range page
+        number falls back to the first page.
+        """
+        after = params.get(self.after_param)
+        before = params.get(self.before_param)
+        number = self._page_number(params)
+        queryset = self.queryset.order_by(*self._order_by())
+        forward = True
+        offset = 0
+        try:
+            if before:
+                forward = False
+                queryset = self.queryset.filter(self._seek(self.decode_cursor(before), False)).order_by(
+                    *self._order_by(reverse=True))
+            elif after:
+                queryset = queryset.filter(self._seek(self.decode_cursor(after), True))
+            elif number > 1:
+                # Old ?page=N link: one OFFSET query, then cursors from here on
+                offset = (number - 1) * self.per_page
+        except InvalidCursor:
+            forward, after, before, number = True, None, None, 1
+            queryset = self.queryset.order_by(*self._order_by())
+        if (after or before) and self.page_param not in params:
+            number = None
+
+        rows = list(queryset[offset:offset + self.per_page + 1])
+        if not rows and (offset or after or before):
+            # Past the end, or every row of the cursor's page was deleted
+            forward, after, before, offset, number = True, None, None, 0, 1
+            queryset = self.queryset.order_by(*self._order_by())
+            rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward:
+            has_next, has_previous = has_more, bool(after) or bool(offset)
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        if not has_previous:
+            number = 1
+
+        count, count_is_exact = self.count()
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self.encode_cursor(rows[-1]) if rows else None,
+            previous_cursor=self.encode_cursor(rows[0]) if rows else None,
+            params=params,
+            number=number,
+            count=count,
+            count_is_exact=count_is_exact,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin: serve `paginate_by` pages with KeysetPaginator, ordered
+    by the view's queryset ordering. The context keeps `page_obj` and
+    `is_paginated`; templates render the pager with keyset_pagination.html.
+    """
+
+    def get_count_limit(self):
+        return settings.PAGINATION_COUNT_LIMIT
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, per_page=page_size, count_limit=self.get_count_limit())
+        page = paginator.get_page(self.request.GET)
+        return paginator, page, page.object_list, page.has_other_pages()
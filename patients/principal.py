@@ -0,0 +1,58 @@
+"""
+Request-scoped principal: who is making the request, resolved once.
+
+PrincipalMiddleware attaches `request.principal`, built lazily from
+request.user (which PrincipalBackend loads with its patient in the same
+query). Views read the role, patient and elevation state from it instead
+of probing `request.user.patient` themselves.
+"""
+from django.core.exceptions import ObjectDoesNotExist
+
+ROLE_ANONYMOUS = 'anonymous'
+ROLE_PATIENT = 'patient'
+ROLE_STAFF = 'staff'
+ROLE_ADMIN = 'admin'
+
+
+class Principal:
+    def __init__(self, user, patient=None, elevated=False):
+        self.user = user
+        self.patient = patient
+        self.elevated = elevated
+        if not user.is_authenticated:
+            self.role = ROLE_ANONYMOUS
+        elif user.is_superuser:
+            self.role = ROLE_ADMIN
+        elif user.is_staff:
+            self.role = ROLE_STAFF
+        elif patient is not None:
+            self.role = ROLE_PATIENT
+        else:
+            self.role = ROLE_ANONYMOUS
+
+    @property
+    def patient_id(self):
+        return self.patient.id if self.patient is not None else None
+
+    @property
+    def is_patient(self):
+        return self.patient is not None
+
+    @property
+    def is_staff(self):
+        return self.role in (ROLE_STAFF, ROLE_ADMIN)
+
+    def __repr__(self):
+        return f"<Principal {self.role} user={getattr(self.user, 'pk', None)} patient={self.patient_id}>"
+
+
+def resolve_principal(request):
+    user = request.user
+    patient = None
+    if user.is_authenticated:
+        try:
+            patient = user.patient
+        except ObjectDoesNotExist:
+            patient = None
+    elevated = bool(user.is_authenticated and request.session.get('elevated_admin', False))
+    return Principal(user, patient=patient, elevated=elevated)
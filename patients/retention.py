@@ -0,0 +1,244 @@
+"""
+Cohort and retention analytics over the exam history.
+
+The whole history is loaded in one query and packed into compact
+per-patient columns (ExamHistory): exam dates as day ordinals and calendar
+month numbers in `array` buffers, with each patient's exams stored as one
+sorted slice. The metrics are single passes over those arrays:
+
+- cohorts: patients grouped by the month of their first exam, with the
+  share who came back N months later
+- average days between repeat exams of the same procedure type
+- follow-up compliance: whether exams recommending a follow-up ultrasound
+  ('FU') were followed by another exam in time
+
+The report is cached until the end of the day.
+"""
+import dataclasses
+import datetime
+import re
+from array import array
+from bisect import bisect_right
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .routers import use_replica
+
+CACHE_KEY = 'retention_report:{date}'
+
+DURATION_UNITS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+DURATION_PATTERN = re.compile(r'(\d+)\s*(d|w|m|y)', re.IGNORECASE)
+
+
+@lru_cache(maxsize=256)
+def follow_up_days(duration):
+    """Days until a follow-up is due, from free text like '6 months' or '2 wks'."""
+    match = DURATION_PATTERN.search(duration or '')
+    if not match:
+        return settings.FOLLOW_UP_DEFAULT_DAYS
+    return int(match.group(1)) * DURATION_UNITS[match.group(2).lower()]
+
+
+def month_number(day):
+    return day.year * 12 + day.month - 1
+
+
+class ExamHistory:
+    """
+    Every exam as parallel columns sorted by (patient, date). Patient k's
+    exams are the slice offsets[k]:offsets[k + 1].
+    """
+
+    def __init__(self):
+        self.offsets = array('l', [0])
+        self.days = array('l')  # date.toordinal()
+        self.months = array('l')  # month_number(date)
+        self.procedures = array('h')  # index into procedure_names
+        self.follow_up = array('l')  # days until a follow-up is due, -1 if none was recommended
+        self.procedure_names = []
+
+    @classmethod
+    @use_replica()
+    def load(cls):
+        from .models import UltrasoundExam
+
+        history = cls()
+        procedure_codes = {}
+        rows = (
+            UltrasoundExam.objects.order_by('patient_id', 'exam_date', 'id')
+            .values_list('patient_id', 'exam_date', 'procedure_type__name', 'recommendations', 'followup_duration')
+        )
+        current = None
+        for patient_id, exam_date, procedure, recommendation, duration in rows.iterator(chunk_size=5000):
+            if patient_id != current:
+                if current is not None:
+                    history.offsets.append(len(history.days))
+                current = patient_id
+            code = procedure_codes.get(procedure)
+            if code is None:
+                code = procedure_codes[procedure] = len(history.procedure_names)
+                history.procedure_names.append(procedure or 'Unknown')
+            history.days.append(exam_date.toordinal())
+            history.months.append(month_number(exam_date))
+            history.procedures.append(code)
+            history.follow_up.append(follow_up_days(duration) if recommendation == 'FU' else -1)
+        if current is not None:
+            history.offsets.append(len(history.days))
+        return history
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def slices(self):
+        offsets = self.offsets
+        for k in range(len(offsets) - 1):
+            yield offsets[k], offsets[k + 1]
+
+
+@dataclasses.dataclass(frozen=True)
+class Cohort:
+    month: datetime.date  # first day of the cohort's first-visit month
+    size: int
+    return_rates: tuple  # % back in month 1..N after the first visit; None where that month hasn't ended
+
+
+@dataclasses.dataclass(frozen=True)
+class RepeatInterval:
+    procedure: str
+    repeats: int
+    average_days: float
+
+
+@dataclasses.dataclass(frozen=True)
+class FollowUpCompliance:
+    on_time: int  # returned before the due date plus the grace period
+    late: int  # returned, but after that
+    missed: int  # no later exam and the grace period is over
+    pending: int  # not back yet, still within the grace period
+
+    @property
+    def recommended(self):
+        return self.on_time + self.late + self.missed + self.pending
+
+    @property
+    def rate(self):
+        """% of follow-ups that are due and were kept on time."""
+        due = self.on_time + self.late + self.missed
+        return self.on_time / due * 100 if due else 0
+
+
+@dataclasses.dataclass(frozen=True)
+class RetentionReport:
+    as_of: datetime.date
+    patients: int
+    exams: int
+    cohorts: tuple  # Cohort, newest first
+    intervals: tuple  # RepeatInterval, most repeated procedure first
+    follow_up: FollowUpCompliance
+
+
+def cohort_retention(history, today, cohorts, horizon):
+    """The last `cohorts` first-visit months, with return rates for months 1..horizon."""
+    current = month_number(today)
+    first_cohort = current - cohorts + 1
+    sizes = [0] * cohorts
+    returned = [[0] * (horizon + 1) for _ in range(cohorts)]
+    months = history.months
+    for start, end in history.slices():
+        first = months[start]
+        if first < first_cohort:
+            continue
+        row = returned[first - first_cohort]
+        sizes[first - first_cohort] += 1
+        seen = 0
+        for j in range(start + 1, end):
+            offset = months[j] - first
+            # Visits are sorted, so each month offset is counted once per patient
+            if 0 < offset <= horizon and offset != seen:
+                row[offset] += 1
+                seen = offset
+
+    result = []
+    for index in reversed(range(cohorts)):
+        cohort_month = first_cohort + index
+        rates = []
+        for offset in range(1, horizon + 1):
+            if cohort_month + offset >= current or not sizes[index]:
+                rates.append(None)
+            else:
+                rates.append(returned[index][offset] / sizes[index] * 100)
+        year, month = divmod(cohort_month, 12)
+        result.append(Cohort(datetime.date(year, month + 1, 1), sizes[index], tuple(rates)))
+    return tuple(result)
+
+
+def repeat_intervals(history):
+    """Average days between a patient's consecutive exams of the same procedure type."""
+    totals = [0] * len(history.procedure_names)
+    counts = [0] * len(history.procedure_names)
+    days, procedures = history.days, history.procedures
+    for start, end in history.slices():
+        last_seen = {}
+        for j in range(start, end):
+            code = procedures[j]
+            previous = last_seen.get(code)
+            if previous is not None:
+                totals[code] += days[j] - previous
+                counts[code] += 1
+            last_seen[code] = days[j]
+    intervals = [
+        RepeatInterval(name, counts[code], totals[code] / counts[code])
+        for code, name in enumerate(history.procedure_names) if counts[code]
+    ]
+    intervals.sort(key=lambda interval: -interval.repeats)
+    return tuple(intervals)
+
+
+def follow_up_compliance(history, today, grace_days):
+    today = today.toordinal()
+    on_time = late = missed = pending = 0
+    days, follow_up = history.days, history.follow_up
+    for start, end in history.slices():
+        for j in range(start, end):
+            if follow_up[j] < 0:
+                continue
+            deadline = days[j] + follow_up[j] + grace_days
+            # The next exam on a later day (same-day exams are part of this visit)
+            after = bisect_right(days, days[j], j + 1, end)
+            if after < end:
+                if days[after] <= deadline:
+                    on_time += 1
+                else:
+                    late += 1
+            elif today > deadline:
+                missed += 1
+            else:
+                pending += 1
+    return FollowUpCompliance(on_time, late, missed, pending)
+
+
+def build_retention_report(today=None, history=None):
+    today = today or timezone.now().date()
+    history = history if history is not None else ExamHistory.load()
+    return RetentionReport(
+        as_of=today,
+        patients=len(history),
+        exams=len(history.days),
+        cohorts=cohort_retention(history, today, settings.RETENTION_COHORT_MONTHS, settings.RETENTION_HORIZON_MONTHS),
+        intervals=repeat_intervals(history),
+        follow_up=follow_up_compliance(history, today, settings.FOLLOW_UP_GRACE_DAYS),
+    )
+
+
+def get_retention_report(refresh=False):
+    """Today's RetentionReport, built at most once a day unless `refresh` is set."""
+    today = timezone.now().date()
+    key = CACHE_KEY.format(date=today.isoformat())
+    report = None if refresh else cache.get(key)
+    if report is None:
+        report = build_retention_report(today)
+        cache.set(key, report, 24 * 60 * 60)
+    return report
@@ -0,0 +1,118 @@
+"""
+Navigation access policy used by NavigationControlMiddleware.
+
+The rules are declared as data below and compiled once, at import, into one
+regex per rule set. `classify(path)` evaluates every rule for a path in a
+single pass and memoizes the result, so the middleware does one cached
+lookup per request instead of looping over pattern lists.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Paths the middleware ignores entirely (prefixes)
+SKIP_PREFIXES = (
+    '/forbidden/',
+    '/admin/',
+    '/static/',
+    '/media/',
+    '/favicon.ico',
+    '/robots.txt',
+)
+
+# Prefixes open to authenticated non-staff users (patients)
+PATIENT_PREFIXES = (
+    '/patient-portal/',
+    '/patient-login/',
+    '/patient-logout/',
+    '/patient-exam/',
+    '/patient-settings/',
+    '/patient-appointments/',
+    '/patient-bills/',
+    '/',  # root path (landing page)
+)
+
+# Prefixes open to anonymous users
+ANONYMOUS_PREFIXES = (
+    '/',  # root path (landing page)
+    '/staff-login/',
+    '/patient-login/',
+    '/static/',
+    '/media/',
+)
+
+# Form pages that must be reached by navigating within the app: a GET needs
+# a same-site referrer matching one of REFERRER_PATTERNS
+GUARDED_PATTERNS = (
+    r'^/patient/\d+/update/$',
+    r'^/patient/\d+/delete/$',
+    r'^/patient/\d+/exam/new/$',
+    r'^/exam/\d+/update/$',
+    r'^/patient/\d+/annotate/$',
+    r'^/image/\d+/annotate/$',
+    r'^/patient/\d+/upload-image/$',
+    r'^/ultrasound-image/\d+/delete/$',
+    r'^/patient-appointments/\d+/update/$',
+    r'^/patient-appointments/\d+/cancel/$',
+    r'^/staff/appointments/\d+/',
+    r'^/custom-admin/users/\d+/edit/$',
+    r'^/custom-admin/users/\d+/change-password/$',
+)
+
+# Referrers (searched anywhere in the URL) that count as in-app navigation
+REFERRER_PATTERNS = (
+    r'/patients/',
+    r'/patient/\d+/',
+    r'/exam/\d+/',
+    r'/custom-admin/',
+    r'/patient-portal/',
+    r'/patient-appointments/',
+    r'/staff/appointments/',
+)
+
+# Pages that must not be cached for authenticated users (prefixes)
+NO_CACHE_PREFIXES = (
+    '/patient/',
+    '/exam/',
+    '/custom-admin/',
+    '/patient-portal/',
+    '/patient-appointments/',
+)
+
+# What the policy says about one path
+Route = namedtuple('Route', ['skip', 'patient_allowed', 'anonymous_allowed', 'guarded', 'no_cache'])
+
+
+def compile_prefixes(prefixes):
+    """One anchored alternation for a set of path prefixes (longest first)."""
+    ordered = sorted(prefixes, key=len, reverse=True)
+    return re.compile('|'.join(re.escape(prefix) for prefix in ordered))
+
+
+def compile_patterns(patterns):
+    """One alternation for a set of regexes, each kept in its own group."""
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+
+_SKIP = compile_prefixes(SKIP_PREFIXES)
+_PATIENT = compile_prefixes(PATIENT_PREFIXES)
+_ANONYMOUS = compile_prefixes(ANONYMOUS_PREFIXES)
+_GUARDED = compile_patterns(GUARDED_PATTERNS)
+_NO_CACHE = compile_prefixes(NO_CACHE_PREFIXES)
+_REFERRER = compile_patterns(REFERRER_PATTERNS)
+
+
+@lru_cache(maxsize=2048)
+def classify(path):
+    """Evaluate every rule for `path` (memoized; the rules never change at runtime)."""
+    return Route(
+        skip=bool(_SKIP.match(path)),
+        patient_allowed=bool(_PATIENT.match(path)),
+        anonymous_allowed=bool(_ANONYMOUS.match(path)),
+        guarded=bool(_GUARDED.match(path)),
+        no_cache=bool(_NO_CACHE.match(path)),
+    )
+
+
+def is_valid_referrer(referer):
+    return bool(_REFERRER.search(referer))
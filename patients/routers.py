@@ -0,0 +1,78 @@
+"""
+Read/write routing between the primary database and a read-only replica.
+
+Reads go to the primary unless code opts in with `use_replica()` (a context
+manager and decorator) or the `replica_reads` view decorator. Writes always
+go to the primary, and the first write inside a replica scope pins the rest
+of that scope to the primary so it reads its own writes. `use_primary()`
+forces primary reads for code that must see the latest data.
+"""
+import contextvars
+from contextlib import ContextDecorator
+from functools import wraps
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_ALIAS = 'default'
+
+# Routing state for the current scope: {'replica': bool}, or None outside any scope
+_scope = contextvars.ContextVar('db_read_scope', default=None)
+
+
+class _ReadScope(ContextDecorator):
+    use_replica = True
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent calls don't share tokens
+        return type(self)()
+
+    def __enter__(self):
+        self._token = _scope.set({'replica': self.use_replica})
+        return self
+
+    def __exit__(self, *exc):
+        _scope.reset(self._token)
+        return False
+
+
+class use_replica(_ReadScope):
+    """Send reads in this block (or decorated function) to the replica."""
+    use_replica = True
+
+
+class use_primary(_ReadScope):
+    """Read from the primary in this block, even inside a replica scope."""
+    use_replica = False
+
+
+def replica_reads(view_func):
+    """View decorator: GET/HEAD requests read from the replica."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view_func(request, *args, **kwargs)
+        with use_replica():
+            return view_func(request, *args, **kwargs)
+
+    wrapper.csrf_exempt = getattr(view_func, 'csrf_exempt', False)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope and scope['replica']:
+            return REPLICA_ALIAS
+        return PRIMARY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope:
+            # Read your own writes for the rest of the scope
+            scope['replica'] = False
+        return PRIMARY_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {PRIMARY_ALIAS, REPLICA_ALIAS}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_ALIAS
@@ -0,0 +1,249 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Appointment, ScheduledJob, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = 'scheduler'
+
+
+def cancel_overdue_appointments():
+    cancelled = Appointment.cancel_overdue_appointments(
+        days_overdue=settings.APPOINTMENT_OVERDUE_DAYS,
+        notify=settings.APPOINTMENT_OVERDUE_NOTIFY,
+    )
+    return f"cancelled {cancelled} appointment(s)"
+
+
+def send_payment_reminders():
+    from billing.reminders import run_payment_reminders
+
+    stats = run_payment_reminders()
+    return f"queued {stats['queued']} reminder(s), sent {stats['sent']}"
+
+
+def send_queued_emails():
+    from .email_outbox import send_queued_emails as send_batch
+
+    batch_size = settings.EMAIL_OUTBOX_BATCH_SIZE
+    sent = 0
+    while True:
+        stats = send_batch(batch_size=batch_size)
+        sent += stats['sent']
+        if stats['claimed'] < batch_size:
+            return f"sent {sent} email(s)"
+
+
+def prune_notifications():
+    from .notification_retention import prune_notifications as prune
+
+    stats = prune()
+    return f"deleted {stats['rows_deleted']} notification(s)"
+
+
+def clear_expired_sessions():
+    # Same as `manage.py clearsessions`, for whichever session engine is configured
+    engine = import_module(settings.SESSION_ENGINE)
+    engine.SessionStore.clear_expired()
+    return "expired sessions cleared"
+
+
+def refresh_replica_snapshot():
+    from .db import refresh_replica_snapshot as refresh
+
+    if not refresh():
+        return "no replica snapshot configured"
+    return f"replica snapshot written to {settings.DB_REPLICA_SNAPSHOT}"
+
+
+# Job name -> callable. Intervals come from settings.SCHEDULER_JOB_INTERVALS;
+# a job without an interval there is disabled.
+JOBS = {
+    'cancel_overdue_appointments': cancel_overdue_appointments,
+    'send_payment_reminders': send_payment_reminders,
+    'send_queued_emails': send_queued_emails,
+    'prune_notifications': prune_notifications,
+    'clear_expired_sessions': clear_expired_sessions,
+    'refresh_replica_snapshot': refresh_replica_snapshot,
+}
+
+
+def get_job_intervals():
+    """Enabled jobs mapped to their interval as a timedelta."""
+    intervals = getattr(settings, 'SCHEDULER_JOB_INTERVALS', {})
+    return {
+        name: timedelta(seconds=seconds)
+        for name, seconds in intervals.items()
+        if name in JOBS and seconds
+    }
+
+
+def make_owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(owner, ttl=None, now=None):
+    """
+    Take (or renew) the scheduler lease. Returns False while another live
+    scheduler holds it; a lease that wasn't renewed within `ttl` seconds
+    is considered abandoned and can be taken over.
+    """
+    ttl = ttl or settings.SCHEDULER_LEASE_SECONDS
+    now = now or timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+    with transaction.atomic():
+        taken = SchedulerLease.objects.filter(name=LEASE_NAME).filter(
+            Q(owner=owner) | Q(expires_at__lt=now)
+        ).update(owner=owner, expires_at=expires_at)
+        if taken:
+            return True
+        try:
+            with transaction.atomic():
+                SchedulerLease.objects.create(name=LEASE_NAME, owner=owner, expires_at=expires_at)
+        except IntegrityError:
+            return False
+    return True
+
+
+def release_lease(owner):
+    SchedulerLease.objects.filter(name=LEASE_NAME, owner=owner).delete()
+
+
+class LeaseHeartbeat:
+    """
+    Keeps renewing the scheduler lease from a background thread while a job
+    runs, so a job longer than SCHEDULER_LEASE_SECONDS isn't taken over
+    halfway through. `lost` is set if the lease could not be renewed.
+    """
+
+    def __init__(self, owner, interval=None):
+        self.owner = owner
+        self.interval = interval or settings.SCHEDULER_LEASE_SECONDS / 3
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='scheduler-lease', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(self.interval):
+                try:
+                    renewed = acquire_lease(self.owner)
+                except Exception as e:
+                    # A busy database only skips this beat; the lease outlives several of them
+                    logger.warning(f"Could not renew the scheduler lease: {str(e)}")
+                    continue
+                if not renewed:
+                    self.lost = True
+                    logger.warning(f"Scheduler lease taken over while {self.owner} was running a job")
+                    return
+        finally:
+            connection.close()
+
+
+def get_due_jobs(now=None):
+    """Names of enabled jobs whose interval has elapsed since their last start."""
+    now = now or timezone.now()
+    intervals = get_job_intervals()
+    last_started = dict(
+        ScheduledJob.objects.filter(name__in=intervals).values_list('name', 'last_started_at')
+    )
+    return [
+        name for name, interval in intervals.items()
+        if last_started.get(name) is None or now - last_started[name] >= interval
+    ]
+
+
+def run_job(name):
+    """Run one job now and record the outcome. Returns True if it succeeded."""
+    job = JOBS[name]
+    started_at = timezone.now()
+    started = time.monotonic()
+    ScheduledJob.objects.update_or_create(name=name, defaults={'last_started_at': started_at})
+
+    try:
+        summary = job()
+    except Exception as e:
+        succeeded, error = False, str(e)
+        logger.error(f"Scheduled job {name} failed: {error}", exc_info=True)
+    else:
+        succeeded, error = True, None
+        logger.info(f"Scheduled job {name}: {summary}")
+
+    ScheduledJob.objects.filter(name=name).update(
+        last_finished_at=timezone.now(),
+        last_duration=round(time.monotonic() - started, 3),
+        last_succeeded=succeeded,
+        last_error=error,
+        run_count=F('run_count') + 1,
+    )
+    return succeeded
+
+
+def run_pending(owner):
+    """
+    Run every due job once, renewing the lease before each one and from a
+    heartbeat while it runs. Returns the names of the jobs that ran, or None
+    if the lease was lost.
+    """
+    ran = []
+    for name in get_due_jobs():
+        if not acquire_lease(owner):
+            return None
+        with LeaseHeartbeat(owner) as heartbeat:
+            run_job(name)
+        ran.append(name)
+        if heartbeat.lost:
+            return None
+    return ran
+
+
+def run_scheduler(tick=None, once=False, stdout=None):
+    """
+    Main loop behind `manage.py run_scheduler`. Only the process holding the
+    scheduler lease runs jobs; others wait and take over if it goes away.
+    """
+    tick = tick or settings.SCHEDULER_TICK_SECONDS
+    owner = make_owner_id()
+    waiting = False
+    try:
+        while True:
+            close_old_connections()
+            if acquire_lease(owner):
+                if waiting and stdout:
+                    stdout.write("Scheduler lease acquired; running jobs.")
+                waiting = False
+                if run_pending(owner) is None:
+                    logger.warning("Scheduler lease lost while running jobs")
+            elif not waiting:
+                waiting = True
+                message = "Another scheduler holds the lease; waiting."
+                logger.info(message)
+                if stdout:
+                    stdout.write(message)
+                if once:
+                    return False
+            if once:
+                return True
+            time.sleep(tick)
+    finally:
+        release_lease(owner)
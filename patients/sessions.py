@@ -0,0 +1,85 @@
+"""
+Tiered session engine (SESSION_STRATEGY = 'tiered').
+
+Behaves like Django's cached_db engine, except that sessions flagged
+cache-only at login (patient portal users) are kept in the cache alone, so
+routine portal traffic never writes the session table. Staff sessions stay
+cache + database backed and survive a cache restart; a patient whose cached
+session is evicted simply logs in again.
+"""
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.core import checks
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+CACHE_ONLY_KEY = '_cache_only'
+LOCMEM_BACKEND = 'django.core.cache.backends.locmem.LocMemCache'
+CACHE_ONLY_ENGINES = ('django.contrib.sessions.backends.cache', __name__)
+
+
+def check_session_cache(app_configs=None, **kwargs):
+    """
+    Refuse cache-only session storage on the per-process local-memory cache:
+    entries are culled past MAX_ENTRIES and a logout only reaches one worker.
+    """
+    backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND')
+    if backend != LOCMEM_BACKEND:
+        return []
+    if settings.SESSION_ENGINE in CACHE_ONLY_ENGINES:
+        return [checks.Error(
+            f"SESSION_STRATEGY {settings.SESSION_STRATEGY!r} keeps sessions in a per-process local-memory cache.",
+            hint="Set SESSION_CACHE_BACKEND/SESSION_CACHE_LOCATION to a shared cache (redis, memcached), "
+                 "or use SESSION_STRATEGY=db.",
+            id='patients.E001',
+        )]
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db':
+        return [checks.Warning(
+            "Cached sessions in a per-process local-memory cache go stale when several workers run.",
+            hint="Set SESSION_CACHE_BACKEND/SESSION_CACHE_LOCATION to a shared cache, or use SESSION_STRATEGY=db.",
+            id='patients.W001',
+        )]
+    return []
+
+
+def use_cache_only_session(request):
+    """
+    Keep this request's session in the cache only (call before login(), which
+    moves the data to a fresh session key). No-op for other strategies.
+    """
+    if settings.SESSION_ENGINE == __name__:
+        request.session[CACHE_ONLY_KEY] = True
+
+
+class SessionStore(CachedDBStore):
+
+    def save(self, must_create=False):
+        data = self._get_session(no_load=must_create)
+        if not data.get(CACHE_ONLY_KEY):
+            return super().save(must_create)
+        if self.session_key is None:
+            return self.create()
+        if must_create:
+            if not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+
+    def _is_cache_only(self):
+        return bool(getattr(self, '_session_cache', {}).get(CACHE_ONLY_KEY))
+
+    def delete(self, session_key=None):
+        if not self._is_cache_only():
+            return super().delete(session_key)
+        # Never written to the database, so only the cache entry goes
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            self._cache.delete(self.cache_key_prefix + session_key)
+
+    def flush(self):
+        if not self._is_cache_only():
+            return super().flush()
+        session_key = self.session_key
+        self.clear()
+        if session_key is not None:
+            self._cache.delete(self.cache_key_prefix + session_key)
+        self._session_key = None
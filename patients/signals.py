@@ -0,0 +1,62 @@
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from billing.models import Bill, BillItem, Expense, Payment, ServiceType
+
+from .analytics_snapshot import mark_changed
+from .availability import release_appointment_slots
+from .calendar_counts import apply_deltas
+from .models import Appointment, Patient, UltrasoundExam
+from .visit_stats import refresh_visit_stats
+
+
+@receiver(post_save, sender=Appointment)
+def update_day_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    """Move the appointment between day/status counters when its date or status changes."""
+    if raw:
+        return
+    deltas = Counter()
+    deltas[(instance.appointment_date, instance.status)] += 1
+    if not created:
+        # Values as loaded; the tracking snapshot is refreshed only after post_save
+        old_day = instance.get_original_value('appointment_date')
+        old_status = instance.get_original_value('status')
+        if old_day is None or old_status is None:
+            # Not loaded from the database: we can't tell what it replaced
+            return
+        deltas[(old_day, old_status)] -= 1
+    apply_deltas(deltas)
+
+
+@receiver(post_delete, sender=Appointment)
+def update_day_counts_on_delete(sender, instance, **kwargs):
+    apply_deltas({(instance.appointment_date, instance.status): -1})
+
+
+@receiver(post_delete, sender=Appointment)
+def release_slot_on_delete(sender, instance, **kwargs):
+    """Free the deleted appointment's slot; also runs for queryset deletes and cascades from Patient."""
+    release_appointment_slots([instance])
+
+
+@receiver(post_save, sender=UltrasoundExam)
+def update_visit_stats_on_save(sender, instance, created, raw=False, **kwargs):
+    """Refresh the patient's last visit/exam count when an exam is added, moved or re-dated."""
+    if raw:
+        return
+    if not created and not instance.has_field_changed('patient_id') and not instance.has_field_changed('exam_date'):
+        return
+    refresh_visit_stats({instance.patient_id, instance.get_original_value('patient_id')})
+
+
+@receiver(post_delete, sender=UltrasoundExam)
+def update_visit_stats_on_delete(sender, instance, **kwargs):
+    refresh_visit_stats([instance.patient_id])
+
+
+# Tables behind the analytics snapshot: a save in this process refreshes it on next use
+for model in (Patient, UltrasoundExam, Bill, BillItem, Payment, Expense, ServiceType):
+    post_save.connect(mark_changed, sender=model, dispatch_uid=f'analytics_snapshot_save_{model.__name__}')
+    post_delete.connect(mark_changed, sender=model, dispatch_uid=f'analytics_snapshot_delete_{model.__name__}')
@@ -0,0 +1,636 @@
+import datetime
+import time
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.db.models import Count
+from django.urls import reverse
+from django.utils import timezone
+
+from billing.models import Bill, BillItem, Payment, ServiceType
+
+from . import analytics_snapshot, email_outbox, scheduler
+from .analytics_snapshot import AnalyticsSnapshot
+from .availability import SlotUnavailable, get_day_slots, get_slot_index, next_free_slots
+from .calendar_counts import get_counts_etag, get_day_counts
+from .geography import UNSPECIFIED, Gazetteer, revenue_by_geography
+from .models import (
+    Appointment, AppointmentSlot, Notification, NotificationDigest, OutboundEmail, Patient, ScheduledJob,
+    SchedulerLease, UltrasoundExam,
+)
+from .notification_retention import prune_notifications
+from .pagination import KeysetPaginator
+
+
+def make_patient(number, **fields):
+    values = {
+        'first_name': f'Patient{number}',
+        'last_name': 'Test',
+        'sex': 'F',
+        'region': '01',
+        'province': '0128',
+        'city': '012801',
+        'barangay': '1',
+        'street_address': 'Street',
+        'contact_number': '09170000000',
+        'email': f'patient{number}@example.com',
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+class StaffAppointmentsQueryTests(TestCase):
+    """The staff appointment list costs the same number of queries on any page."""
+
+    APPOINTMENTS = 10_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        patients = [make_patient(number) for number in range(20)]
+        start = datetime.date(2026, 1, 5)
+        Appointment.objects.bulk_create(
+            [
+                Appointment(
+                    patient=patients[number % len(patients)],
+                    procedure_type='Pelvic Ultrasound',
+                    appointment_date=start + datetime.timedelta(days=number % 200),
+                    appointment_time=datetime.time(9 + number % 8, 0),
+                    reason='Checkup',
+                    status='PENDING',
+                )
+                for number in range(cls.APPOINTMENTS)
+            ],
+            batch_size=1000,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+        self.url = reverse('staff-appointments')
+
+    def deep_cursor(self):
+        """Cursor for the page after the 9,000th appointment in list order."""
+        paginator = KeysetPaginator(Appointment.objects.all(), ordering=('-created_at', '-id'))
+        row = Appointment.objects.order_by(*paginator.ordering)[9000]
+        return paginator.encode_cursor(row)
+
+    def test_first_and_deep_pages_use_the_same_queries(self):
+        self.client.get(self.url, {'status': 'PENDING'})  # warm up per-process caches
+
+        with self.assertNumQueries(4):
+            first = self.client.get(self.url, {'status': 'PENDING'})
+        self.assertEqual(len(first.context['page']), 20)
+        self.assertTrue(first.context['page'].has_next)
+
+        cursor = self.deep_cursor()
+        with self.assertNumQueries(4) as queries:
+            deep = self.client.get(self.url, {'status': 'PENDING', 'after': cursor})
+        # Seeks to the page instead of scanning past the earlier rows
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(len(deep.context['page']), 20)
+        self.assertTrue(deep.context['page'].has_previous)
+        self.assertNotEqual(
+            [appointment.id for appointment in first.context['page']],
+            [appointment.id for appointment in deep.context['page']],
+        )
+
+
+class PatientDetailQueryTests(TestCase):
+    """The patient page loads its exams, bills and images in a fixed number of queries."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        cls.service = ServiceType.objects.create(name='Pelvic Ultrasound', base_price=Decimal('1000.00'))
+        cls.one_exam = cls.make_patient_with_exams(1, 1)
+        cls.many_exams = cls.make_patient_with_exams(2, 40)
+
+    @classmethod
+    def make_patient_with_exams(cls, number, exams):
+        patient = make_patient(number)
+        for day in range(exams):
+            exam = UltrasoundExam.objects.create(
+                patient=patient,
+                procedure_type=cls.service,
+                exam_date=datetime.date(2026, 1, 1) + datetime.timedelta(days=day),
+                exam_time=datetime.time(9, 0),
+                referring_physician='Dr. Test',
+            )
+            bill = Bill.objects.create(patient=patient, bill_date=exam.exam_date, subtotal=Decimal('0'))
+            BillItem.objects.create(bill=bill, exam=exam, service=cls.service, amount=cls.service.base_price)
+            Payment.objects.create(bill=bill, amount=Decimal('500.00'), payment_method='CASH', created_by='staff')
+        return patient
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def test_query_count_does_not_grow_with_exams(self):
+        for patient, exams in ((self.one_exam, 1), (self.many_exams, 40)):
+            with self.subTest(exams=exams), self.assertNumQueries(5):
+                response = self.client.get(reverse('patient-detail', args=[patient.pk]))
+            self.assertEqual(len(response.context['exams']), exams)
+
+
+class SchedulerLeaseTests(TestCase):
+    """Only one scheduler runs jobs; an expired lease is taken over and the old holder stops."""
+
+    def expire_lease(self):
+        SchedulerLease.objects.update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+
+    def test_expired_lease_is_taken_over(self):
+        self.assertTrue(scheduler.acquire_lease('first'))
+        self.assertFalse(scheduler.acquire_lease('second'))
+
+        self.expire_lease()
+        self.assertTrue(scheduler.acquire_lease('second'))
+        self.assertFalse(scheduler.acquire_lease('first'))
+        self.assertEqual(SchedulerLease.objects.get().owner, 'second')
+
+    def test_run_pending_stops_after_losing_the_lease(self):
+        ran = []
+
+        def slow_job():
+            # Runs past its lease, and another scheduler takes over meanwhile
+            ran.append('slow')
+            self.expire_lease()
+            scheduler.acquire_lease('second')
+            return 'done'
+
+        def next_job():
+            ran.append('next')
+            return 'done'
+
+        jobs = {'slow': slow_job, 'next': next_job}
+        with mock.patch.dict(scheduler.JOBS, jobs, clear=True), \
+                override_settings(SCHEDULER_JOB_INTERVALS={'slow': 60, 'next': 60}):
+            self.assertTrue(scheduler.acquire_lease('first'))
+            self.assertIsNone(scheduler.run_pending('first'))
+
+        self.assertEqual(ran, ['slow'])
+        self.assertTrue(ScheduledJob.objects.get(name='slow').last_succeeded)
+        self.assertFalse(ScheduledJob.objects.filter(name='next').exists())
+
+
+class LeaseHeartbeatTests(TransactionTestCase):
+    """A job that outlives the lease keeps it renewed; the heartbeat uses its own connection."""
+
+    def test_long_job_keeps_the_lease(self):
+        with override_settings(SCHEDULER_LEASE_SECONDS=1):
+            self.assertTrue(scheduler.acquire_lease('first'))
+            with scheduler.LeaseHeartbeat('first', interval=0.1) as heartbeat:
+                time.sleep(1.5)
+                self.assertFalse(scheduler.acquire_lease('second'))
+
+        self.assertFalse(heartbeat.lost)
+        self.assertEqual(SchedulerLease.objects.get().owner, 'first')
+
+    def test_heartbeat_reports_a_lost_lease(self):
+        self.assertTrue(scheduler.acquire_lease('first'))
+        with scheduler.LeaseHeartbeat('first', interval=0.1) as heartbeat:
+            SchedulerLease.objects.update(owner='second')
+            time.sleep(0.5)
+
+        self.assertTrue(heartbeat.lost)
+
+
+class AnalyticsSnapshotRefreshTests(TestCase):
+    """An incrementally refreshed snapshot answers like one loaded from scratch."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.service = ServiceType.objects.create(name='Pelvic Ultrasound', base_price=Decimal('1000.00'))
+        cls.patients = [make_patient(number, patient_type=('REGULAR', 'SENIOR')[number % 2]) for number in range(4)]
+        for number, patient in enumerate(cls.patients):
+            cls.add_paid_exam(patient, datetime.date(2026, 1, 1) + datetime.timedelta(days=number))
+
+    @classmethod
+    def add_paid_exam(cls, patient, day, paid=Decimal('1000.00')):
+        exam = UltrasoundExam.objects.create(
+            patient=patient, procedure_type=cls.service, exam_date=day,
+            exam_time=datetime.time(9, 0), referring_physician='Dr. Test',
+        )
+        bill = Bill.objects.create(patient=patient, bill_date=day, subtotal=Decimal('0'))
+        BillItem.objects.create(bill=bill, exam=exam, service=cls.service, amount=cls.service.base_price)
+        Payment.objects.create(bill=bill, amount=paid, payment_method='CASH', created_by='staff')
+        return exam, bill
+
+    def setUp(self):
+        self.snapshot = AnalyticsSnapshot.load()
+
+    def summary(self, snapshot):
+        return {
+            'revenue': snapshot.revenue(),
+            # Sorted by revenue; ties may come out in either order
+            'by_type': sorted(snapshot.revenue_by_patient_type()),
+            'by_service': sorted(snapshot.revenue_by_service()),
+            'by_method': sorted(snapshot.revenue_by_payment_method()),
+            'top_patients': sorted(snapshot.top_patients()),
+            'exams': snapshot.exam_count(),
+            'patients_seen': snapshot.patients_seen(),
+            'by_procedure': snapshot.exams_by_procedure(),
+            'cohort': snapshot.visit_cohort(datetime.date(2026, 1, 2), datetime.date(2026, 2, 1)),
+            'new_patients': snapshot.new_patients(),
+            'by_sex': snapshot.patients_by_sex(),
+            'patient_types': snapshot.patients_by_type(),
+        }
+
+    def assertMatchesLoad(self, snapshot):
+        self.assertEqual(self.summary(snapshot), self.summary(AnalyticsSnapshot.load()))
+
+    def test_refresh_applies_inserts_and_updates(self):
+        newcomer = make_patient(10, sex='M')
+        self.add_paid_exam(newcomer, datetime.date(2026, 1, 20), paid=Decimal('400.00'))
+        self.add_paid_exam(self.patients[0], datetime.date(2026, 1, 21))
+        senior = self.patients[1]
+        senior.patient_type = 'PWD'
+        senior.save()
+        exam = UltrasoundExam.objects.filter(patient=self.patients[2]).get()
+        exam.exam_date = datetime.date(2026, 1, 25)
+        exam.save()
+
+        self.assertTrue(self.snapshot.refresh())
+        self.assertMatchesLoad(self.snapshot)
+        # PAID and PARTIAL bills count with their full total
+        self.assertEqual(self.snapshot.revenue(), Decimal('6000.00'))
+
+    def test_refresh_detects_a_delete(self):
+        Bill.objects.filter(patient=self.patients[3]).delete()
+        self.assertFalse(self.snapshot.refresh())
+
+    def test_refresh_detects_a_delete_offset_by_an_unseen_insert(self):
+        UltrasoundExam.objects.filter(patient=self.patients[3]).delete()
+        exam, _ = self.add_paid_exam(self.patients[0], datetime.date(2026, 1, 30))
+        # Inserted elsewhere with an old timestamp, so the refresh doesn't re-read it
+        UltrasoundExam.objects.filter(pk=exam.pk).update(updated_at=timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(UltrasoundExam.objects.count(), len(self.snapshot.exams))
+
+        self.assertFalse(self.snapshot.refresh())
+
+    def test_delete_in_this_process_reloads_the_snapshot(self):
+        with analytics_snapshot.analytics_snapshot() as snapshot:
+            self.assertEqual(snapshot.exam_count(), 4)
+        UltrasoundExam.objects.filter(patient=self.patients[3]).delete()
+        self.add_paid_exam(self.patients[0], datetime.date(2026, 1, 30))
+
+        with analytics_snapshot.analytics_snapshot() as snapshot:
+            self.assertMatchesLoad(snapshot)
+            self.assertEqual(snapshot.exam_count(), 4)
+
+
+class NotificationRetentionTests(TestCase):
+    """Expired notifications are folded into daily digests and deleted batch by batch."""
+
+    NOW = timezone.make_aware(datetime.datetime(2026, 6, 1, 12, 0))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('patient', password='password')
+        cls.notify(datetime.datetime(2026, 4, 1, 9, 0), is_read=True, count=4)
+        cls.notify(datetime.datetime(2026, 4, 1, 10, 0), is_read=True, notification_type='EXAM_COMPLETED')
+        cls.notify(datetime.datetime(2026, 4, 1, 11, 0), is_read=False)  # unread, not yet expired
+        cls.notify(datetime.datetime(2025, 11, 1, 9, 0), is_read=False)  # unread, past 180 days
+        cls.notify(datetime.datetime(2026, 5, 30, 9, 0), is_read=True)  # recent
+
+    @classmethod
+    def notify(cls, created_at, is_read, notification_type='APPOINTMENT_CONFIRMED', count=1):
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user=cls.user, notification_type=notification_type, title='Title', message='Message', is_read=is_read,
+            )
+            for _ in range(count)
+        ])
+        Notification.objects.filter(pk__in=[n.pk for n in notifications]).update(
+            created_at=timezone.make_aware(created_at)
+        )
+
+    def test_prunes_in_batches_into_digests(self):
+        stats = prune_notifications(batch_size=2, pause=0, now=self.NOW)
+
+        self.assertEqual(stats['rows_deleted'], 6)
+        self.assertEqual(stats['batches'], 3)
+        self.assertEqual(Notification.objects.count(), 2)
+
+        # The April rows span all three batches and end up in one digest
+        april = NotificationDigest.objects.get(user=self.user, digest_date=datetime.date(2026, 4, 1))
+        self.assertEqual(april.notification_count, 5)
+        self.assertEqual(april.unread_count, 0)
+        self.assertEqual(april.type_counts, {'APPOINTMENT_CONFIRMED': 4, 'EXAM_COMPLETED': 1})
+        november = NotificationDigest.objects.get(user=self.user, digest_date=datetime.date(2025, 11, 1))
+        self.assertEqual((november.notification_count, november.unread_count), (1, 1))
+
+    def test_later_runs_add_to_existing_digests(self):
+        prune_notifications(read_ttl_days=90, pause=0, now=self.NOW)
+        self.assertFalse(NotificationDigest.objects.filter(digest_date=datetime.date(2026, 4, 1)).exists())
+
+        prune_notifications(pause=0, now=self.NOW)
+        prune_notifications(unread_ttl_days=30, pause=0, now=self.NOW)
+        april = NotificationDigest.objects.get(user=self.user, digest_date=datetime.date(2026, 4, 1))
+        self.assertEqual((april.notification_count, april.unread_count), (6, 1))
+
+    def test_none_keeps_unread_notifications(self):
+        stats = prune_notifications(unread_ttl_days=None, pause=0, now=self.NOW)
+
+        self.assertEqual(stats['rows_deleted'], 5)
+        self.assertEqual(Notification.objects.filter(is_read=False).count(), 2)
+
+    def test_dry_run_only_counts(self):
+        stats = prune_notifications(dry_run=True, now=self.NOW)
+
+        self.assertEqual(stats['rows_matched'], 6)
+        self.assertEqual(Notification.objects.count(), 8)
+        self.assertFalse(NotificationDigest.objects.exists())
+
+
+@override_settings(EMAIL_OUTBOX_FLUSH_ON_COMMIT=False, EMAIL_OUTBOX_RETRY_BASE_SECONDS=60)
+class EmailOutboxTests(TestCase):
+    """Queued emails are claimed by one worker at a time and retried with backoff."""
+
+    def queue(self, count):
+        return [email_outbox.queue_email(f'Subject {n}', 'Body', [f'to{n}@example.com']) for n in range(count)]
+
+    def test_sends_due_emails_once(self):
+        emails = self.queue(3)
+
+        stats = email_outbox.send_queued_emails()
+        self.assertEqual((stats['claimed'], stats['sent']), (3, 3))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(OutboundEmail.objects.filter(status='SENT', claim_token='').count(), 3)
+
+        self.assertEqual(email_outbox.send_queued_emails()['claimed'], 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual([message.to for message in mail.outbox], [email.recipients for email in emails])
+
+    def test_claimed_batch_is_skipped_by_other_workers(self):
+        self.queue(3)
+        claimed = email_outbox._claim_batch(2, timezone.now())
+
+        stats = email_outbox.send_queued_emails()
+        self.assertEqual((stats['claimed'], stats['sent']), (1, 1))
+        self.assertEqual(OutboundEmail.objects.filter(status='PENDING').count(), 2)
+        # Until the claim runs out: a crashed worker's rows become due again
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in claimed]).update(next_attempt_at=timezone.now())
+        self.assertEqual(email_outbox.send_queued_emails()['sent'], 2)
+
+    def test_only_the_given_ids(self):
+        first, second = self.queue(2)
+
+        stats = email_outbox.send_queued_emails(ids=[second.pk])
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(mail.outbox[0].to, second.recipients)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'PENDING')
+
+    def test_failed_send_is_retried_with_backoff_then_given_up(self):
+        email, = self.queue(1)
+        with mock.patch.object(email_outbox.EmailMultiAlternatives, 'send', side_effect=OSError('refused')):
+            before = timezone.now()
+            stats = email_outbox.send_queued_emails(max_attempts=2)
+            self.assertEqual(stats['retried'], 1)
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts, email.last_error), ('PENDING', 1, 'refused'))
+            self.assertGreaterEqual(email.next_attempt_at, before + datetime.timedelta(seconds=60))
+
+            # Not due yet
+            self.assertEqual(email_outbox.send_queued_emails(max_attempts=2)['claimed'], 0)
+
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+            stats = email_outbox.send_queued_emails(max_attempts=2)
+        self.assertEqual(stats['failed'], 1)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), ('FAILED', 2))
+        self.assertEqual(mail.outbox, [])
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        with override_settings(EMAIL_OUTBOX_RETRY_MAX_SECONDS=200):
+            delays = [email_outbox.get_retry_delay(attempts).total_seconds() for attempts in (1, 2, 3, 4)]
+        self.assertEqual(delays, [60, 120, 200, 200])
+
+
+@override_settings(
+    CLINIC_OPENING_HOURS={weekday: ('08:00', '17:00') for weekday in range(7)},
+    APPOINTMENT_SLOT_MINUTES=30,
+    APPOINTMENT_SLOT_CAPACITY=None,
+)
+class SlotCapacityTests(TestCase):
+    """Bookings take a slot only while it has room, and give it back when cancelled, moved or deleted."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = make_patient(1)
+        cls.day = timezone.localdate() + datetime.timedelta(days=7)
+        ServiceType.objects.create(name='Pelvic Ultrasound', base_price=Decimal('1000.00'), slot_capacity=2)
+
+    def book(self, at_time, procedure='Pelvic Ultrasound', **fields):
+        appointment = Appointment(
+            patient=self.patient, procedure_type=procedure, appointment_date=self.day,
+            appointment_time=at_time, reason='Checkup', **fields,
+        )
+        appointment.save(enforce_capacity=True)
+        return appointment
+
+    def remaining(self, at_time, procedure='Pelvic Ultrasound'):
+        return dict(get_day_slots(procedure, self.day))[at_time]
+
+    def test_opening_hours_include_closing_time(self):
+        self.assertEqual(get_slot_index(self.day, datetime.time(8, 0)), 0)
+        self.assertEqual(get_slot_index(self.day, datetime.time(16, 59)), 17)
+        self.assertEqual(get_slot_index(self.day, datetime.time(17, 0)), 18)
+        self.assertIsNone(get_slot_index(self.day, datetime.time(17, 1)))
+        self.assertIsNone(get_slot_index(self.day, datetime.time(7, 59)))
+        with self.assertRaises(SlotUnavailable):
+            self.book(datetime.time(18, 0))
+
+    def test_full_slot_is_refused(self):
+        self.book(datetime.time(9, 0))
+        self.book(datetime.time(9, 15))  # same slot
+        self.assertEqual(self.remaining(datetime.time(9, 0)), 0)
+
+        with self.assertRaises(SlotUnavailable):
+            self.book(datetime.time(9, 0))
+        self.assertEqual(Appointment.objects.count(), 2)
+        after = timezone.make_aware(datetime.datetime.combine(self.day, datetime.time(8, 45)))
+        self.assertEqual(next_free_slots('Pelvic Ultrasound', count=1, after=after)[0].time(), datetime.time(9, 30))
+
+    def test_procedures_without_a_limit_are_not_capped(self):
+        for _ in range(3):
+            self.book(datetime.time(17, 0), procedure='Transvaginal Ultrasound')
+        self.assertIsNone(self.remaining(datetime.time(17, 0), procedure='Transvaginal Ultrasound'))
+        self.assertEqual(AppointmentSlot.objects.get(procedure='transvaginal ultrasound').booked, 3)
+
+    def test_cancel_reschedule_and_delete_release_the_slot(self):
+        first = self.book(datetime.time(10, 0))
+        second = self.book(datetime.time(10, 0))
+
+        first.status = 'CANCELLED'
+        first.save()
+        self.assertEqual(self.remaining(datetime.time(10, 0)), 1)
+
+        second.appointment_time = datetime.time(11, 0)
+        second.save(enforce_capacity=True)
+        self.assertEqual(self.remaining(datetime.time(10, 0)), 2)
+        self.assertEqual(self.remaining(datetime.time(11, 0)), 1)
+
+        Appointment.objects.filter(pk=second.pk).delete()
+        self.assertEqual(self.remaining(datetime.time(11, 0)), 2)
+
+    def test_overdue_cancellation_releases_slots(self):
+        past = timezone.localdate() - datetime.timedelta(days=10)
+        for status in ('PENDING', 'CONFIRMED', 'COMPLETED'):
+            Appointment.objects.create(
+                patient=self.patient, procedure_type='Pelvic Ultrasound', appointment_date=past,
+                appointment_time=datetime.time(9, 0), reason='Checkup', status=status,
+            )
+        self.assertEqual(AppointmentSlot.objects.get(slot_date=past).booked, 3)
+
+        self.assertEqual(Appointment.cancel_overdue_appointments(days_overdue=3), 2)
+        self.assertEqual(AppointmentSlot.objects.get(slot_date=past).booked, 1)
+        self.assertFalse(Notification.objects.exists())
+
+
+class AppointmentDayCountTests(TestCase):
+    """The per-day counters behind the calendar track every way appointments change, and so does its ETag."""
+
+    JANUARY = (datetime.date(2026, 1, 1), datetime.date(2026, 1, 31))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', password='password', is_staff=True)
+        cls.patient = make_patient(1)
+        cls.service = ServiceType.objects.create(name='Pelvic Ultrasound', base_price=Decimal('1000.00'))
+
+    def book(self, day, at_time=datetime.time(9, 0), **fields):
+        return Appointment.objects.create(
+            patient=self.patient, procedure_type='Pelvic Ultrasound', appointment_date=day,
+            appointment_time=at_time, reason='Checkup', **fields,
+        )
+
+    def assertCountsMatchAppointments(self):
+        expected = {}
+        rows = Appointment.objects.values_list('appointment_date', 'status').annotate(total=Count('id')).order_by()
+        for day, status, total in rows:
+            expected.setdefault(day, {})[status] = total
+        self.assertEqual(dict(get_day_counts(datetime.date(2025, 1, 1), datetime.date(2027, 12, 31))), expected)
+
+    def test_counters_follow_saves_and_deletes(self):
+        first = self.book(datetime.date(2026, 1, 5))
+        second = self.book(datetime.date(2026, 1, 5), datetime.time(10, 0))
+        self.book(datetime.date(2026, 1, 6))
+        self.assertEqual(get_day_counts(*self.JANUARY)[datetime.date(2026, 1, 5)], {'PENDING': 2})
+
+        first.status = 'CONFIRMED'
+        first.save()
+        second.appointment_date = datetime.date(2026, 1, 6)
+        second.save()
+        self.assertCountsMatchAppointments()
+
+        Appointment.objects.filter(pk=first.pk).delete()
+        self.assertCountsMatchAppointments()
+        self.assertNotIn(datetime.date(2026, 1, 5), get_day_counts(*self.JANUARY))
+
+    def test_bulk_status_changes_update_counters(self):
+        appointment = self.book(datetime.date(2026, 1, 5), status='CONFIRMED')
+        exam = UltrasoundExam.objects.create(
+            patient=self.patient, procedure_type=self.service, exam_date=appointment.appointment_date,
+            exam_time=appointment.appointment_time, referring_physician='Dr. Test',
+        )
+        bill = Bill.objects.create(patient=self.patient, bill_date=exam.exam_date, subtotal=Decimal('0'))
+        BillItem.objects.create(bill=bill, exam=exam, service=self.service, amount=self.service.base_price)
+
+        self.assertEqual(bill.complete_appointments(), 1)
+        self.assertEqual(bill.complete_appointments(), 0)
+        self.assertEqual(get_day_counts(*self.JANUARY)[datetime.date(2026, 1, 5)], {'COMPLETED': 1})
+
+        self.book(timezone.localdate() - datetime.timedelta(days=10))
+        Appointment.cancel_overdue_appointments(days_overdue=3)
+        self.assertCountsMatchAppointments()
+
+    def test_etag_changes_only_with_its_range(self):
+        self.book(datetime.date(2026, 1, 5))
+        etag = get_counts_etag(*self.JANUARY)
+
+        self.book(datetime.date(2026, 2, 5))
+        self.assertEqual(get_counts_etag(*self.JANUARY), etag)
+
+        self.book(datetime.date(2026, 1, 20))
+        self.assertNotEqual(get_counts_etag(*self.JANUARY), etag)
+
+    def test_unchanged_range_is_not_modified(self):
+        self.client.force_login(self.staff)
+        url = reverse('appointment-calendar-counts')
+        params = {'start_date': '2026-01-01', 'end_date': '2026-01-31'}
+        self.book(datetime.date(2026, 1, 5))
+
+        response = self.client.get(url, params)
+        self.assertEqual(response.json()['counts'], {'2026-01-05': 1})
+        etag = response['ETag']
+
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.book(datetime.date(2026, 1, 5), datetime.time(11, 0))
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status_counts'], {'2026-01-05': {'PENDING': 2}})
+
+
+# The report reads the replica, which in tests mirrors default through a second connection
+# that can't see the test transaction; without the router every read goes to default.
+@override_settings(DATABASE_ROUTERS=[])
+class RevenueByGeographyTests(TestCase):
+    """Revenue rolls up city > province > region, whichever way the address codes were stored."""
+
+    @classmethod
+    def setUpTestData(cls):
+        adams = make_patient(1, region='01', province='0128', city='012801')
+        cls.bill(adams, '1000.00')
+        cls.bill(adams, '400.00', status='PARTIAL')
+        cls.bill(adams, '999.00', status='PENDING')  # not revenue
+        cls.bill(adams, '5000.00', bill_date=datetime.date(2025, 6, 1))  # outside the range below
+        cls.bill(make_patient(2, region='1', province='128', city='12801'), '500.00')  # saved unpadded
+        cls.bill(make_patient(3, region='', province='', city='012802'), '300.00')  # parents left blank
+        cls.bill(make_patient(4, region='Metro Manila', province='', city='Quezon'), '200.00')  # free text
+        cls.bill(make_patient(5, region='', province='', city=''), '100.00')
+
+    @classmethod
+    def bill(cls, patient, amount, status='PAID', bill_date=datetime.date(2026, 1, 5)):
+        bill = Bill.objects.create(patient=patient, bill_date=bill_date, subtotal=Decimal(amount))
+        Bill.objects.filter(pk=bill.pk).update(status=status)
+
+    def test_codes_are_padded_to_the_file_width(self):
+        self.assertEqual(Gazetteer.normalize('region', '1'), '01')
+        self.assertEqual(Gazetteer.normalize('province', ' 128 '), '0128')
+        self.assertEqual(Gazetteer.normalize('city', '12801'), '012801')
+        self.assertEqual(Gazetteer.normalize('city', 'Quezon'), 'Quezon')
+        self.assertEqual(Gazetteer.normalize('city', None), '')
+
+    def test_rollup(self):
+        report = revenue_by_geography(start_date=datetime.date(2026, 1, 1))
+
+        self.assertEqual((report.revenue, report.patients), (Decimal('2500.00'), 5))
+        self.assertEqual([area.code for area in report.regions], ['01', 'Metro Manila', ''])
+
+        ilocos = report.region('01')
+        self.assertEqual(ilocos.name, 'Region I (Ilocos Region)')
+        self.assertEqual((ilocos.revenue, ilocos.patients), (Decimal('2200.00'), 3))
+        ilocos_norte, = ilocos.children
+        self.assertEqual(ilocos_norte.name, 'Ilocos Norte')
+        # Padded and unpadded codes for the same city are one area
+        adams = ilocos_norte.child('012801')
+        self.assertEqual((adams.name, adams.revenue, adams.patients), ('Adams', Decimal('1900.00'), 2))
+        bacarra = ilocos_norte.child('012802')
+        self.assertEqual((bacarra.name, bacarra.revenue), ('Bacarra', Decimal('300.00')))
+
+        free_text = report.region('Metro Manila')
+        self.assertEqual(free_text.name, 'Metro Manila')
+        self.assertEqual(free_text.children[0].name, UNSPECIFIED)
+        self.assertEqual(free_text.children[0].children[0].name, 'Quezon')
+        self.assertEqual(report.region('').name, UNSPECIFIED)
+
+        self.assertEqual([city.code for city in report.cities()][:2], ['012801', '012802'])
+
+    def test_date_range(self):
+        self.assertEqual(revenue_by_geography().revenue, Decimal('7500.00'))
+        report = revenue_by_geography(end_date=datetime.date(2025, 12, 31))
+        self.assertEqual((report.revenue, report.patients), (Decimal('5000.00'), 1))
@@ -0,0 +1,50 @@
+class FieldTrackingMixin:
+    """
+    Remember the values of `tracked_fields` as they were loaded from the
+    database, so save() and views can detect transitions (e.g. a status
+    change) without re-reading the row first.
+
+    The snapshot is taken in from_db() and refreshed after save() and
+    refresh_from_db(). Instances that were never loaded have no originals.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values) if name in cls.tracked_fields
+        }
+        return instance
+
+    def _snapshot_tracked_fields(self, fields=None):
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            loaded = self._loaded_values = {}
+        deferred = self.get_deferred_fields()
+        for name in fields if fields is not None else self.tracked_fields:
+            if name in self.tracked_fields and name not in deferred:
+                loaded[name] = getattr(self, name)
+
+    def get_original_value(self, field, default=None):
+        """Value of a tracked field when the instance was loaded or last saved."""
+        return getattr(self, '_loaded_values', {}).get(field, default)
+
+    def has_field_changed(self, field):
+        """True for unsaved instances and for tracked fields whose value changed (or is unknown)."""
+        loaded = getattr(self, '_loaded_values', {})
+        if self._state.adding or field not in loaded:
+            return True
+        return loaded[field] != getattr(self, field)
+
+    def get_changed_fields(self):
+        return [field for field in self.tracked_fields if self.has_field_changed(field)]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        self._snapshot_tracked_fields(update_fields)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_tracked_fields(fields)
@@ -60,12 +60,15 @@ urlpatterns = [
     path('api/exams/<int:exam_id>/annotations/', api.exam_annotations, name='exam-annotations'),
     path('api/exams/<int:exam_id>/save-preview/', api.save_annotation_preview, name='save-annotation-preview'),
     path('api/appointments/calendar-counts/', api.appointment_calendar_counts, name='appointment-calendar-counts'),
+    path('api/appointments/availability/', api.appointment_availability, name='appointment-availability'),
     path('patient/<int:patient_id>/upload-image/', views.exam_image_upload, name='exam-image-upload'),
     
     # Custom admin interface
     path('custom-admin/login/', views.admin_login, name='admin_login'),
     path('custom-admin/dashboard/', admin_views.admin_dashboard, name='admin_dashboard'),
     path('custom-admin/analytics/', admin_views.admin_analytics, name='admin_analytics'),
+    path('custom-admin/analytics/geography/', admin_views.admin_analytics_geography, name='admin_analytics_geography'),
+    path('custom-admin/analytics/retention/', admin_views.admin_retention, name='admin_retention'),
     path('custom-admin/patients/', admin_views.admin_patient_list, name='admin_patient_list'),
     path('custom-admin/billing-report/', admin_views.admin_billing_report, name='admin_billing_report'),
     path('custom-admin/billing-export/', admin_views.admin_billing_export, name='admin_billing_export'),
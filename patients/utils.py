@@ -1,9 +1,8 @@
 import random
 import string
 from django.contrib.auth.models import User
-from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
-from django.conf import settings
+from .email_outbox import queue_email
 
 def send_appointment_accepted_email(appointment):
     """Send an email notification to the patient when appointment is accepted (confirmed)."""
@@ -26,14 +25,8 @@ def send_appointment_accepted_email(appointment):
         "Thank you for booking with us."
     )
     try:
-        msg = EmailMultiAlternatives(
-            subject,
-            text_content,
-            settings.DEFAULT_FROM_EMAIL,
-            [patient.email],
-        )
-        msg.attach_alternative(html_content, "text/html")
-        msg.send(fail_silently=True)
+        # Queued rather than sent inline so a slow SMTP handshake never blocks the staff request
+        queue_email(subject, text_content, [patient.email], html_body=html_content)
     except Exception:
         # Fail quietly; optionally log error
         pass
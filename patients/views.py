@@ -28,6 +28,10 @@ import logging
 from django.conf import settings
 from functools import wraps
 from .utils import send_appointment_accepted_email
+from .availability import SlotUnavailable
+from .pagination import KeysetPaginator, KeysetPaginationMixin
+from .sessions import use_cache_only_session
+from .routers import replica_reads
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 
 logger = logging.getLogger(__name__)
@@ -264,6 +268,27 @@ class CustomAdminRequiredMixin(AccessMixin):
             return redirect('forbidden')
         return super().dispatch(request, *args, **kwargs)
 
+def patient_required(view_func):
+    """
+    Decorator for patient portal views: requires a logged-in user with a patient
+    record (request.principal.patient). Staff/admin users are sent to their home
+    dashboard, anyone else to the landing page.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not request.principal.is_patient:
+            messages.error(request, 'Access denied. This portal is for patients only.')
+            # Redirect staff/admin users to their home dashboard
+            if request.user.is_staff or request.user.is_superuser:
+                return redirect('home-dashboard')
+            return redirect('landing')
+        return view_func(request, *args, **kwargs)
+
+    wrapper = login_required(wrapper)
+    # Support for method_decorator usage
+    wrapper.csrf_exempt = getattr(view_func, 'csrf_exempt', False)
+    return wrapper
+
 def require_valid_navigation(view_func):
     """
     Decorator to ensure views are accessed through proper navigation flow.
@@ -308,7 +333,7 @@ def require_valid_navigation(view_func):
     
     return wrapper
 
-class PatientListView(CustomStaffRequiredMixin, ListView):
+class PatientListView(CustomStaffRequiredMixin, KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patients/patient_list.html'
     context_object_name = 'patients'
@@ -393,23 +418,22 @@ class PatientListView(CustomStaffRequiredMixin, ListView):
                 except Exception:
                     pass
 
-        # Last visit date range and has_visits
-        queryset = queryset.annotate(last_visit=models.Max('ultrasound_exams__exam_date'))
+        # Last visit date range and has_visits (stored on the patient)
         last_visit_start = self.request.GET.get('last_visit_start')
         last_visit_end = self.request.GET.get('last_visit_end')
         has_visits = self.request.GET.get('has_visits')  # 'yes' | 'no'
         if last_visit_start:
             start_lv = parse_date(last_visit_start)
             if start_lv:
-                queryset = queryset.filter(last_visit__gte=start_lv)
+                queryset = queryset.filter(last_visit_date__gte=start_lv)
         if last_visit_end:
             end_lv = parse_date(last_visit_end)
             if end_lv:
-                queryset = queryset.filter(last_visit__lte=end_lv)
+                queryset = queryset.filter(last_visit_date__lte=end_lv)
         if has_visits == 'yes':
-            queryset = queryset.filter(last_visit__isnull=False)
+            queryset = queryset.filter(last_visit_date__isnull=False)
         elif has_visits == 'no':
-            queryset = queryset.filter(last_visit__isnull=True)
+            queryset = queryset.filter(last_visit_date__isnull=True)
         
         # Handle sorting
         sort = self.request.GET.get('sort')
@@ -419,9 +443,9 @@ class PatientListView(CustomStaffRequiredMixin, ListView):
             elif sort == 'age_desc':
                 queryset = queryset.order_by('birthday')
             elif sort == 'visit_asc':
-                queryset = queryset.order_by('last_visit')
+                queryset = queryset.order_by('last_visit_date')
             elif sort == 'visit_desc':
-                queryset = queryset.order_by('-last_visit')
+                queryset = queryset.order_by('-last_visit_date')
         
         return queryset
 
@@ -455,10 +479,26 @@ class PatientDetailView(CustomStaffRequiredMixin, DetailView):
     template_name = 'patients/patient_detail.html'
     context_object_name = 'patient'
 
+    def get_queryset(self):
+        return Patient.objects.select_related('family_group')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get all ultrasound exams for this patient
-        context['exams'] = self.object.ultrasound_exams.all().order_by('-exam_date', '-exam_time')
+        patient = self.object
+        # Get all ultrasound exams for this patient, with everything the page
+        # shows per exam loaded up front (a fixed number of queries however
+        # many exams there are)
+        exams = list(
+            patient.ultrasound_exams.select_related('procedure_type', 'bill_item__bill')
+            .prefetch_related(models.Prefetch('images'))
+            .order_by('-exam_date', '-exam_time')
+        )
+        context['exams'] = exams
+        context['exams_with_images'] = [exam for exam in exams if exam.images.all()]
+        context['family_members'] = (
+            list(patient.family_group.family_members.exclude(pk=patient.pk))
+            if patient.family_group_id else []
+        )
         return context
 
 class PatientCreateView(CustomStaffRequiredMixin, CreateView):
@@ -509,7 +549,7 @@ class PatientDeleteView(LoginRequiredMixin, DeleteView):
         return super().delete(request, *args, **kwargs)
 
 @method_decorator(staff_member_required, name='dispatch')
-class ArchivedPatientListView(ListView):
+class ArchivedPatientListView(KeysetPaginationMixin, ListView):
     model = Patient
     template_name = 'patients/archived_patient_list.html'
     context_object_name = 'patients'
@@ -603,8 +643,8 @@ class UltrasoundExamUpdateView(CustomStaffRequiredMixin, UpdateView):
     def form_valid(self, form):
         try:
             with transaction.atomic():
-                # Get the old exam instance to check for status changes
-                old_exam = UltrasoundExam.objects.get(pk=self.object.pk)
+                # Status as loaded, before the form applied its changes
+                old_status = self.object.get_original_value('status')
 
                 # Save the exam first
                 self.object = form.save()
@@ -618,7 +658,7 @@ class UltrasoundExamUpdateView(CustomStaffRequiredMixin, UpdateView):
                     )
 
                 # Check if status changed to completed and send notification
-                if old_exam.status != 'COMPLETED' and self.object.status == 'COMPLETED':
+                if old_status != 'COMPLETED' and self.object.status == 'COMPLETED':
                     from .notification_utils import notify_patient_exam_completed
                     notify_patient_exam_completed(self.object)
 
@@ -719,13 +759,11 @@ def dashboard(request):
     return redirect('admin_dashboard')
 
 @custom_staff_member_required
+@replica_reads
 def home_dashboard(request):
-    from django.db.models import Sum, Count
-    from datetime import timedelta
-    from billing.models import Bill
-    from .models import Appointment
+    from django.db.models import Count
+    from .kpis import get_kpis
     import json
-    from collections import defaultdict
     
     # Get search parameter
     patient_search = request.GET.get('patient_search', '')
@@ -741,70 +779,13 @@ def home_dashboard(request):
     else:
         searched_patients = None
 
-    # Calculate KPIs
-    today = timezone.now().date()
-    
-    # Basic counts
-    total_patients = Patient.objects.filter(is_archived=False).count()
-    total_procedures = UltrasoundExam.objects.count()
-    
-    # Revenue calculations
-    total_revenue = Bill.objects.filter(status='PAID').aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    pending_bills = Bill.objects.filter(status='PENDING').count()
-    
-    # Appointment counts
-    pending_appointments = Appointment.objects.filter(status='PENDING').count()
-    today_appointments = Appointment.objects.filter(appointment_date=today).count()
-    
-    # Advanced KPIs
-    ninety_days_ago = today - timedelta(days=90)
-    six_months_ago = today - timedelta(days=180)
-    month_start = today.replace(day=1)
-
-    # Active patients in last 90 days
-    active_patients_qs = UltrasoundExam.objects.filter(
-        exam_date__gte=ninety_days_ago
-    ).values('patient').distinct()
-    active_patients_90d = active_patients_qs.count()
-
-    # New patients this month
-    new_patients_month = Patient.objects.filter(
-        is_archived=False,
-        created_at__date__gte=month_start
-    ).count()
-
-    # Average procedures per patient (lifetime)
-    distinct_patients_with_exam = UltrasoundExam.objects.values('patient').distinct().count()
-    avg_procs = (total_procedures / distinct_patients_with_exam) if distinct_patients_with_exam else 0
-    avg_procedures_per_patient = f"{avg_procs:.2f}"
-
-    # Returning patient rate (last 6 months)
-    recent_exam_counts = (
-        UltrasoundExam.objects.filter(exam_date__gte=six_months_ago)
-        .values('patient')
-        .annotate(num_exams=Count('id'))
-    )
-    num_recent_unique = recent_exam_counts.count()
-    num_returning = sum(1 for r in recent_exam_counts if r['num_exams'] >= 2)
-    returning_rate = (num_returning / num_recent_unique * 100) if num_recent_unique else 0
-    returning_rate_percent = f"{returning_rate:.1f}"
+    # Calculate KPIs (one query per table, cached briefly; see patients/kpis.py)
+    kpis = get_kpis()
 
     # Chart Data
     # Monthly Revenue Data (Last 6 months)
-    monthly_revenue_data = []
-    monthly_revenue_labels = []
-    for i in range(6):
-        month_date = today.replace(day=1) - timedelta(days=30*i)
-        month_revenue = Bill.objects.filter(
-            bill_date__year=month_date.year,
-            bill_date__month=month_date.month,
-            status__in=['PAID', 'PARTIAL']
-        ).aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-        monthly_revenue_data.append(float(month_revenue))
-        monthly_revenue_labels.append(month_date.strftime('%b %Y'))
-    
-    monthly_revenue_data.reverse()
-    monthly_revenue_labels.reverse()
+    monthly_revenue_labels = [month.strftime('%b %Y') for month in kpis.trend_months]
+    monthly_revenue_data = [float(revenue) for revenue in kpis.monthly_revenue]
 
     # Procedure Distribution Data
     procedure_data = []
@@ -815,43 +796,23 @@ def home_dashboard(request):
         procedure_labels.append(proc['procedure_type__name'] or 'Unknown')
 
     # Monthly Activity Data (Last 6 months)
-    activity_labels = []
-    activity_procedures = []
-    activity_patients = []
-    
-    for i in range(6):
-        month_date = today.replace(day=1) - timedelta(days=30*i)
-        month_procedures = UltrasoundExam.objects.filter(
-            exam_date__year=month_date.year,
-            exam_date__month=month_date.month
-        ).count()
-        month_patients = Patient.objects.filter(
-            is_archived=False,
-            created_at__year=month_date.year,
-            created_at__month=month_date.month
-        ).count()
-        
-        activity_labels.append(month_date.strftime('%b'))
-        activity_procedures.append(month_procedures)
-        activity_patients.append(month_patients)
-    
-    activity_labels.reverse()
-    activity_procedures.reverse()
-    activity_patients.reverse()
+    activity_labels = [month.strftime('%b') for month in kpis.trend_months]
+    activity_procedures = list(kpis.monthly_procedures)
+    activity_patients = list(kpis.monthly_new_patients)
     
     context = {
         'searched_patients': searched_patients,
         'search_term': patient_search,
-        'total_patients': total_patients,
-        'total_procedures': total_procedures,
-        'total_revenue': f"{total_revenue:,.2f}",
-        'pending_bills': pending_bills,
-        'active_patients_90d': active_patients_90d,
-        'new_patients_month': new_patients_month,
-        'avg_procedures_per_patient': avg_procedures_per_patient,
-        'returning_rate_percent': returning_rate_percent,
-        'pending_appointments': pending_appointments,
-        'today_appointments': today_appointments,
+        'total_patients': kpis.total_patients,
+        'total_procedures': kpis.total_procedures,
+        'total_revenue': f"{kpis.total_revenue:,.2f}",
+        'pending_bills': kpis.pending_bills,
+        'active_patients_90d': kpis.active_patients_90d,
+        'new_patients_month': kpis.new_patients_month,
+        'avg_procedures_per_patient': f"{kpis.avg_procedures_per_patient:.2f}",
+        'returning_rate_percent': f"{kpis.returning_rate:.1f}",
+        'pending_appointments': kpis.pending_appointments,
+        'today_appointments': kpis.today_appointments,
         # Chart data
         'monthly_revenue_labels': json.dumps(monthly_revenue_labels),
         'monthly_revenue_data': json.dumps(monthly_revenue_data),
@@ -1034,6 +995,7 @@ def patient_login(request):
         user = authenticate(request, username=username, password=password)
         
         if user is not None and hasattr(user, 'patient'):
+            use_cache_only_session(request)
             login(request, user)
             messages.success(request, f'Welcome back, {user.username}! You have been successfully logged in.')
             return redirect('patient-portal')
@@ -1043,16 +1005,9 @@ def patient_login(request):
     
     return render(request, 'patient_login.html')
 
-@login_required
+@patient_required
 def patient_portal(request):
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
-    patient = request.user.patient
+    patient = request.principal.patient
 
     # Get all exams for this patient
     all_exams = UltrasoundExam.objects.filter(
@@ -1113,19 +1068,12 @@ def staff_login(request):
 
     return render(request, 'staff_login.html')
 
-@login_required
+@patient_required
 def patient_view_exam(request, exam_id):
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-
     exam = get_object_or_404(UltrasoundExam, id=exam_id)
 
     # Security check: ensure the patient can only view their own exams
-    if exam.patient != request.user.patient:
+    if exam.patient_id != request.principal.patient_id:
         messages.error(request, 'Access denied. You can only view your own examinations.')
         return redirect('patient-portal')
 
@@ -1135,7 +1083,7 @@ def patient_view_exam(request, exam_id):
 
     context = {
         'exam': exam,
-        'patient': request.user.patient,
+        'patient': request.principal.patient,
         'bill': bill
     }
     return render(request, 'patients/patient_exam_detail.html', context)
@@ -1318,32 +1266,18 @@ def download_ultrasound_docx(request, pk):
     response['Content-Disposition'] = f'attachment; filename={patient_name}-{procedure}.docx'
     doc.save(response)
     return response
-@login_required
+@patient_required
 def patient_settings(request):
     """Patient settings page."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
-    patient = request.user.patient
+    patient = request.principal.patient
     context = {
         'patient': patient,
     }
     return render(request, 'patients/patient_settings.html', context)
 
-@login_required
+@patient_required
 def patient_change_password(request):
     """Allow patients to change their password."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
     if request.method == 'POST':
         form = PatientPasswordChangeForm(request.user, request.POST)
         if form.is_valid():
@@ -1358,21 +1292,14 @@ def patient_change_password(request):
     
     context = {
         'form': form,
-        'patient': request.user.patient,
+        'patient': request.principal.patient,
     }
     return render(request, 'patients/patient_change_password.html', context)
 
-@login_required
+@patient_required
 def patient_update_profile(request):
     """Allow patients to update their profile information."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
-    patient = request.user.patient
+    patient = request.principal.patient
     user = request.user
     
     if request.method == 'POST':
@@ -1397,20 +1324,13 @@ def patient_update_profile(request):
     }
     return render(request, 'patients/patient_update_profile.html', context)
 
-@login_required
+@patient_required
 def patient_download_exam(request, exam_id):
     """Allow patients to download their examination report."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
     exam = get_object_or_404(UltrasoundExam, id=exam_id)
     
     # Security check: ensure the patient can only download their own exams
-    if exam.patient != request.user.patient:
+    if exam.patient_id != request.principal.patient_id:
         messages.error(request, 'Access denied. You can only download your own examinations.')
         return redirect('patient-portal')
     
@@ -1590,17 +1510,10 @@ def patient_download_exam(request, exam_id):
     
     return response 
 
-@login_required
+@patient_required
 def patient_appointments(request):
     """Patient appointments page."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
-    patient = request.user.patient
+    patient = request.principal.patient
     appointments = patient.appointments.all().order_by('appointment_date', 'appointment_time')
     
     context = {
@@ -1609,17 +1522,10 @@ def patient_appointments(request):
     }
     return render(request, 'patients/patient_appointments.html', context)
 
-@login_required
+@patient_required
 def patient_bills(request):
     """Patient bills page: list bills and statuses for the logged-in patient."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-
-    patient = request.user.patient
+    patient = request.principal.patient
     bills = (
         Bill.objects.filter(patient=patient)
         .order_by('-bill_date')
@@ -1631,26 +1537,17 @@ def patient_bills(request):
     }
     return render(request, 'patients/patient_bills.html', context)
 
-@login_required
+@patient_required
 def patient_bill_detail(request, bill_number):
     """Patient bill detail: show items, related exam info, and payment history."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-
-    patient = request.user.patient
+    patient = request.principal.patient
     bill = get_object_or_404(Bill, bill_number=bill_number, patient=patient)
 
     bill_items = bill.items.all().select_related('exam', 'service')
     payments = bill.payments.all().order_by('-payment_date')
 
-    total_paid = sum(payment.amount for payment in payments)
-    remaining_balance = float(bill.total_amount) - float(total_paid)
-    if remaining_balance < 0:
-        remaining_balance = 0
+    total_paid = bill.amount_paid
+    remaining_balance = bill.balance_due
 
     context = {
         'patient': patient,
@@ -1662,18 +1559,11 @@ def patient_bill_detail(request, bill_number):
     }
     return render(request, 'patients/patient_bill_detail.html', context)
 
-@login_required
+@patient_required
 def patient_book_appointment(request):
     """Allow patients to book new appointments."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
     # Prevent booking if the patient already has a pending appointment
-    patient = request.user.patient
+    patient = request.principal.patient
     has_pending = Appointment.objects.filter(patient=patient, status='PENDING').exists()
     if has_pending and request.method == 'GET':
         messages.warning(request, 'You already have a pending appointment. Please complete or cancel it before booking a new one.')
@@ -1689,7 +1579,13 @@ def patient_book_appointment(request):
 
             appointment = form.save(commit=False)
             appointment.patient = patient
-            appointment.save()
+            try:
+                # Takes the slot atomically; fails if someone booked the last place meanwhile
+                appointment.save(enforce_capacity=True)
+            except SlotUnavailable as e:
+                form.add_error('appointment_time', str(e))
+                messages.error(request, 'Please correct the errors below.')
+                return render(request, 'patients/patient_book_appointment.html', {'form': form, 'patient': patient})
             
             # Send real-time notification to all staff members
             from .notification_utils import notify_staff_new_appointment
@@ -1708,29 +1604,27 @@ def patient_book_appointment(request):
     }
     return render(request, 'patients/patient_book_appointment.html', context)
 
-@login_required
+@patient_required
 def patient_update_appointment(request, appointment_id):
     """Allow patients to update their appointments."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
     appointment = get_object_or_404(Appointment, id=appointment_id)
     
     # Security check: ensure the patient can only update their own appointments
-    if appointment.patient != request.user.patient:
+    if appointment.patient_id != request.principal.patient_id:
         messages.error(request, 'Access denied. You can only update your own appointments.')
         return redirect('patient-appointments')
     
     if request.method == 'POST':
         form = AppointmentUpdateForm(request.POST, instance=appointment)
         if form.is_valid():
-            form.save()
-            messages.success(request, 'Appointment updated successfully!')
-            return redirect('patient-appointments')
+            try:
+                form.instance.save(enforce_capacity=True)
+            except SlotUnavailable as e:
+                form.add_error('appointment_time', str(e))
+                messages.error(request, 'Please correct the errors below.')
+            else:
+                messages.success(request, 'Appointment updated successfully!')
+                return redirect('patient-appointments')
         else:
             messages.error(request, 'Please correct the errors below.')
     else:
@@ -1739,24 +1633,17 @@ def patient_update_appointment(request, appointment_id):
     context = {
         'form': form,
         'appointment': appointment,
-        'patient': request.user.patient,
+        'patient': request.principal.patient,
     }
     return render(request, 'patients/patient_update_appointment.html', context)
 
-@login_required
+@patient_required
 def patient_cancel_appointment(request, appointment_id):
     """Allow patients to cancel their appointments."""
-    if not hasattr(request.user, 'patient'):
-        messages.error(request, 'Access denied. This portal is for patients only.')
-        # Redirect staff/admin users to their home dashboard
-        if request.user.is_staff or request.user.is_superuser:
-            return redirect('home-dashboard')
-        return redirect('landing')
-    
     appointment = get_object_or_404(Appointment, id=appointment_id)
     
     # Security check: ensure the patient can only cancel their own appointments
-    if appointment.patient != request.user.patient:
+    if appointment.patient_id != request.principal.patient_id:
         messages.error(request, 'Access denied. You can only cancel your own appointments.')
         return redirect('patient-appointments')
     
@@ -1768,11 +1655,12 @@ def patient_cancel_appointment(request, appointment_id):
     
     context = {
         'appointment': appointment,
-        'patient': request.user.patient,
+        'patient': request.principal.patient,
     }
     return render(request, 'patients/patient_cancel_appointment.html', context)
 
 @custom_staff_member_required
+@replica_reads
 def patient_list_export_excel(request):
     """Export patient list to Excel format."""
     from openpyxl import Workbook
@@ -1861,19 +1749,18 @@ def patient_list_export_excel(request):
                 pass
 
     # Last visit date range and has_visits
-    queryset = queryset.annotate(last_visit=models.Max('ultrasound_exams__exam_date'))
     if last_visit_start:
         start_lv = parse_date(last_visit_start)
         if start_lv:
-            queryset = queryset.filter(last_visit__gte=start_lv)
+            queryset = queryset.filter(last_visit_date__gte=start_lv)
     if last_visit_end:
         end_lv = parse_date(last_visit_end)
         if end_lv:
-            queryset = queryset.filter(last_visit__lte=end_lv)
+            queryset = queryset.filter(last_visit_date__lte=end_lv)
     if has_visits == 'yes':
-        queryset = queryset.filter(last_visit__isnull=False)
+        queryset = queryset.filter(last_visit_date__isnull=False)
     elif has_visits == 'no':
-        queryset = queryset.filter(last_visit__isnull=True)
+        queryset = queryset.filter(last_visit_date__isnull=True)
 
     # Apply sorting
     if sort:
@@ -1882,9 +1769,9 @@ def patient_list_export_excel(request):
         elif sort == 'age_desc':
             queryset = queryset.order_by('-birthday')
         elif sort == 'visit_asc':
-            queryset = queryset.order_by('last_visit')
+            queryset = queryset.order_by('last_visit_date')
         elif sort == 'visit_desc':
-            queryset = queryset.order_by('-last_visit')
+            queryset = queryset.order_by('-last_visit_date')
     else:
         queryset = queryset.order_by('-created_at')
 
@@ -1929,7 +1816,7 @@ def patient_list_export_excel(request):
         ws.cell(row=row_num, column=13, value=patient.barangay_name)
         ws.cell(row=row_num, column=14, value=patient.street_address)
         ws.cell(row=row_num, column=15, value=patient.id_number or '')
-        ws.cell(row=row_num, column=16, value=patient.last_visit.strftime('%Y-%m-%d') if patient.last_visit else '')
+        ws.cell(row=row_num, column=16, value=patient.last_visit_date.strftime('%Y-%m-%d') if patient.last_visit_date else '')
         ws.cell(row=row_num, column=17, value=patient.created_at.strftime('%Y-%m-%d %H:%M'))
 
     # Auto-adjust column widths
@@ -1959,14 +1846,8 @@ def patient_list_export_excel(request):
 
 @custom_staff_member_required
 def staff_appointments(request):
-    # Automatically cancel appointments that are 3+ days overdue
-    try:
-        cancelled_count = Appointment.cancel_overdue_appointments(days_overdue=3)
-        if cancelled_count > 0:
-            logger.info(f"Automatically cancelled {cancelled_count} overdue appointment(s)")
-            messages.info(request, f'Automatically cancelled {cancelled_count} overdue overdue.')
-    except Exception as e:
-        logger.error(f"Error cancelling overdue appointments: {str(e)}", exc_info=True)
+    # Overdue appointments are cancelled by the cancel_overdue_appointments job
+    # (manage.py run_scheduler), not on every page view
 
     # Get filter parameters
     status_filter = request.GET.get('status', '')
@@ -1976,10 +1857,10 @@ def staff_appointments(request):
     if not status_filter and not date_filter:
         date_filter = timezone.now().date().isoformat()
 
-    # Base queryset - newest booked first
-    appointments = (
-        Appointment.objects.select_related('patient')
-        .order_by('-created_at', '-appointment_date', '-appointment_time')
+    # Base queryset - only the columns the table renders
+    appointments = Appointment.objects.select_related('patient').only(
+        'id', 'appointment_date', 'appointment_time', 'procedure_type', 'status', 'created_at',
+        'patient__id', 'patient__first_name', 'patient__last_name', 'patient__contact_number',
     )
 
     # Apply filters
@@ -1989,18 +1870,26 @@ def staff_appointments(request):
     if date_filter:
         appointments = appointments.filter(appointment_date=date_filter)
 
-    # Get statistics
-    total_appointments = Appointment.objects.count()
-    pending_appointments = Appointment.objects.filter(status='PENDING').count()
-    confirmed_appointments = Appointment.objects.filter(status='CONFIRMED').count()
-    today_appointments = Appointment.objects.filter(appointment_date=timezone.now().date()).count()
+    # Newest booked first, one page at a time (keyset, so deep pages stay cheap)
+    paginator = KeysetPaginator(appointments, ordering=('-created_at', '-id'), per_page=20)
+    page = paginator.get_page(request.GET)
+
+    # Get statistics in a single query
+    today = timezone.now().date()
+    stats = Appointment.objects.aggregate(
+        total=Count('id'),
+        pending=Count('id', filter=models.Q(status='PENDING')),
+        confirmed=Count('id', filter=models.Q(status='CONFIRMED')),
+        today=Count('id', filter=models.Q(appointment_date=today)),
+    )
 
     context = {
-        'appointments': appointments,
-        'total_appointments': total_appointments,
-        'pending_appointments': pending_appointments,
-        'confirmed_appointments': confirmed_appointments,
-        'today_appointments': today_appointments,
+        'appointments': page,
+        'page': page,
+        'total_appointments': stats['total'],
+        'pending_appointments': stats['pending'],
+        'confirmed_appointments': stats['confirmed'],
+        'today_appointments': stats['today'],
         'status_filter': status_filter,
         'date_filter': date_filter,
     }
@@ -2219,7 +2108,7 @@ def revert_from_admin(request):
                 # Log out the current admin user
                 logout(request)
                 # Log in the original staff user
-                login(request, original_user)
+                login(request, original_user, backend='patients.backends.PrincipalBackend')
                 
                 # Restore original staff/superuser status (though login should handle this)
                 # request.user.is_staff = request.session.get('_original_is_staff', False)
@@ -2266,7 +2155,7 @@ def admin_logout(request):
 def patient_register(request):
     """Patient registration view."""
     # Check if user is already logged in and has a patient account
-    if request.user.is_authenticated and hasattr(request.user, 'patient'):
+    if request.principal.is_patient:
         messages.info(request, 'You already have a patient account. You are already logged in.')
         return redirect('patient-portal')
 
@@ -2303,7 +2192,8 @@ def patient_register(request):
                 )
 
                 # Log the user in
-                login(request, user)
+                use_cache_only_session(request)
+                login(request, user, backend='patients.backends.PrincipalBackend')
                 messages.success(request, f'Welcome {user.first_name}! Your patient account has been created successfully.')
                 return redirect('patient-portal')
 
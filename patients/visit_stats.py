@@ -0,0 +1,46 @@
+"""
+Denormalized per-patient visit stats: Patient.last_visit_date and
+Patient.exam_count. They are recomputed from the exams table with one
+UPDATE whenever an exam is added, deleted, moved to another patient or
+re-dated (see patients/signals.py), so patient lists can filter and sort on
+them without joining and grouping every exam.
+"""
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Patient, UltrasoundExam
+
+
+def _stat_subqueries():
+    exams = UltrasoundExam.objects.filter(patient=OuterRef('pk')).order_by().values('patient')
+    return {
+        'last_visit_date': Subquery(exams.annotate(last=Max('exam_date')).values('last')[:1]),
+        'exam_count': Coalesce(
+            Subquery(exams.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()), 0
+        ),
+    }
+
+
+def refresh_visit_stats(patient_ids):
+    """Recompute the stats of the given patients. Returns the number of rows updated."""
+    patient_ids = {patient_id for patient_id in patient_ids if patient_id is not None}
+    if not patient_ids:
+        return 0
+    return Patient.objects.filter(pk__in=patient_ids).update(**_stat_subqueries())
+
+
+def rebuild_visit_stats():
+    """Recompute every patient's stats (initial fill / drift repair)."""
+    return Patient.objects.update(**_stat_subqueries())
+
+
+def find_drift():
+    """Ids of patients whose stored stats disagree with their exams."""
+    stats = _stat_subqueries()
+    drifted = Patient.objects.annotate(
+        actual_last_visit=stats['last_visit_date'], actual_exam_count=stats['exam_count']
+    ).values_list('id', 'last_visit_date', 'exam_count', 'actual_last_visit', 'actual_exam_count')
+    return [
+        patient_id for patient_id, last_visit, count, actual_last, actual_count in drifted
+        if last_visit != actual_last or count != actual_count
+    ]
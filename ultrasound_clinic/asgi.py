@@ -13,4 +13,8 @@ application = ProtocolTypeRouter({
             websocket_urlpatterns
         )
     ),
-})
\ No newline at end of file
+})
+
+from patients.db import enable_journal_mode_switch  # noqa: E402
+
+enable_journal_mode_switch()
@@ -34,7 +34,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'patients.middleware.PrivilegeElevationMiddleware', # Add this middleware
+    'patients.middleware.PrincipalMiddleware',  # request.principal + admin elevation
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'patients.middleware.NavigationControlMiddleware',
@@ -65,9 +65,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of reopening the file (and
+        # re-applying the pragmas below) every time
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,  # seconds a writer waits for the lock
+        },
     }
 }
 
+# Read-only replica for analytics and report reads (patients/routers.py;
+# views opt in with use_replica / replica_reads). By default it is a read-only
+# connection to the same file, which with WAL doesn't block or get blocked by
+# writers. Set DB_REPLICA_SNAPSHOT to a path to read from a copy refreshed by
+# the refresh_replica_snapshot job instead. In production this entry can point
+# at a PostgreSQL replica.
+DB_REPLICA_SNAPSHOT = os.environ.get('DB_REPLICA_SNAPSHOT', '')
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': Path(DB_REPLICA_SNAPSHOT or DATABASES['default']['NAME']).resolve().as_uri() + '?mode=ro',
+    # Snapshots are swapped in by rename; short-lived connections pick up the new file
+    'CONN_MAX_AGE': 0 if DB_REPLICA_SNAPSHOT else DATABASES['default']['CONN_MAX_AGE'],
+    'CONN_HEALTH_CHECKS': True,
+    'OPTIONS': {
+        'timeout': 20,
+    },
+    'TEST': {
+        'MIRROR': 'default',
+    },
+}
+DATABASE_ROUTERS = ['patients.routers.ReplicaRouter']
+
+# Applied to every new SQLite connection (patients/db.py)
+SQLITE_PRAGMAS = {
+    # WAL lets readers run alongside the writer; set SQLITE_JOURNAL_MODE=DELETE
+    # where WAL isn't supported (e.g. network filesystems). Stored in the
+    # database file, so only server processes (wsgi.py/asgi.py) switch it,
+    # never read-only connections or management commands.
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': 'NORMAL',  # durable with WAL, fsync only at checkpoints
+    'busy_timeout': 20000,  # ms, matches OPTIONS['timeout']
+    'cache_size': -20000,  # page cache in KiB (about 20 MB) per connection
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -105,8 +148,56 @@ CRISPY_TEMPLATE_PACK = 'bootstrap4'
 LOGIN_URL = 'admin_login'
 LOGIN_REDIRECT_URL = 'home-dashboard'
 
+# PrincipalBackend loads the session user with its patient record in one
+# query. ModelBackend stays listed so sessions created before it was added
+# (which store ModelBackend's path) remain valid until their next login.
+AUTHENTICATION_BACKENDS = [
+    'patients.backends.PrincipalBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Session storage (SESSION_STRATEGY in the environment):
+#   db        - every read and write goes to SQLite (Django's default)
+#   cached_db - reads served from the cache, writes still go to the database
+#   cache     - cache only; sessions are lost when the cache is cleared
+#   tiered    - cached_db for staff, cache-only for patient portal sessions
+# The cached strategies need a cache every worker process shares
+# (SESSION_CACHE_BACKEND/SESSION_CACHE_LOCATION, e.g. redis or memcached):
+# with the per-process local-memory cache a logout in one worker leaves the
+# session valid in the others. So the default is 'db' unless a shared cache
+# is configured, and the system check (patients.sessions.check_session_cache)
+# refuses the cache-only strategies on local memory.
+SESSION_CACHE_BACKEND = os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+SESSION_CACHE_SHARED = SESSION_CACHE_BACKEND != 'django.core.cache.backends.locmem.LocMemCache'
+SESSION_STRATEGY = os.environ.get('SESSION_STRATEGY', 'cached_db' if SESSION_CACHE_SHARED else 'db')
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'tiered': 'patients.sessions',
+}[SESSION_STRATEGY]
+SESSION_CACHE_ALIAS = 'sessions'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': SESSION_CACHE_BACKEND,
+        'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', 'sessions'),
+        'TIMEOUT': None,  # entries expire with the session
+    },
+}
+if SESSION_CACHE_BACKEND.rsplit('.', 1)[-1] in ('LocMemCache', 'FileBasedCache'):
+    # These cull a third of their entries past MAX_ENTRIES (300 by default),
+    # which would log sessions out; redis/memcached take no such option.
+    CACHES['sessions']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', 100_000))}
+
 # Email Configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Set EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend (or .locmem.EmailBackend)
+# in the environment to exercise the outbox locally without talking to SMTP.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 EMAIL_HOST = 'smtp.gmail.com'  # Or your email provider's SMTP server
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -125,11 +216,80 @@ MESSAGE_TAGS = {
     messages.ERROR: 'danger',
 }
 
+# Outbound email queue (patients/email_outbox.py)
+EMAIL_OUTBOX_BATCH_SIZE = 50
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_BASE_SECONDS = 60  # doubled after every failed attempt
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = 3600
+EMAIL_OUTBOX_CLAIM_SECONDS = 300  # how long a worker owns a claimed batch before others may retry it
+# Also deliver from one background thread per process right after queueing, at most
+# EMAIL_OUTBOX_FLUSH_MAX_BATCHES batches per wake-up. Off by default: the scheduler's
+# send_queued_emails job delivers the outbox, and the web workers stay out of SMTP.
+EMAIL_OUTBOX_FLUSH_ON_COMMIT = False
+EMAIL_OUTBOX_FLUSH_MAX_BATCHES = 1
+
 # Clinic Information
 CLINIC_NAME = 'MSRA Services'
 CLINIC_PHONE = '09614764302'  # Replace with your clinic's phone number
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
+# Notification retention
+# Read notifications older than NOTIFICATION_READ_TTL_DAYS (and unread ones older than
+# NOTIFICATION_UNREAD_TTL_DAYS, set to None to keep them forever) are folded into per-user
+# daily digests and deleted by `manage.py prune_notifications`.
+NOTIFICATION_READ_TTL_DAYS = 30
+NOTIFICATION_UNREAD_TTL_DAYS = 180
+NOTIFICATION_PRUNE_BATCH_SIZE = 500
+NOTIFICATION_PRUNE_BATCH_PAUSE = 0.05  # seconds between batches so other writers can take the SQLite lock
+
+# Appointments still PENDING/CONFIRMED this many days after their date are cancelled
+APPOINTMENT_OVERDUE_DAYS = 3
+APPOINTMENT_OVERDUE_NOTIFY = False  # have the scheduler job notify patients of overdue cancellations
+
+# Appointment availability (patients/availability.py)
+# Opening hours per weekday (Monday=0) as (first, last) appointment start time, both
+# bookable; None closes the clinic that day. The day is split into APPOINTMENT_SLOT_MINUTES
+# slots from the opening time and each ServiceType.slot_capacity appointments can be
+# booked per slot (blank: no limit).
+CLINIC_OPENING_HOURS = {weekday: ('08:00', '17:00') for weekday in range(7)}
+APPOINTMENT_SLOT_MINUTES = 30
+APPOINTMENT_SLOT_CAPACITY = None  # per-slot limit for procedures that don't match a ServiceType; None for no limit
+APPOINTMENT_BOOKING_HORIZON_DAYS = 60  # how far ahead "next free slot" searches look
+
+# Periodic maintenance jobs run by `manage.py run_scheduler` (patients/scheduler.py).
+# Intervals are in seconds; remove a job or set it to None to disable it.
+SCHEDULER_JOB_INTERVALS = {
+    'cancel_overdue_appointments': 60 * 60,
+    'send_payment_reminders': 24 * 60 * 60,
+    'send_queued_emails': 60,
+    'prune_notifications': 24 * 60 * 60,
+    'clear_expired_sessions': 24 * 60 * 60,
+    'refresh_replica_snapshot': 15 * 60,  # only does work when DB_REPLICA_SNAPSHOT is set
+}
+SCHEDULER_TICK_SECONDS = 30
+SCHEDULER_LEASE_SECONDS = 300  # a scheduler that stops renewing its lease for this long is taken over
+
+# Staff/admin lists page by cursor (patients/pagination.py); their result counts stop
+# at this many rows and show as "1000+". None hides the counts.
+PAGINATION_COUNT_LIMIT = 1000
+
+# How long the dashboards' KPI snapshot (patients/kpis.py) is cached, in seconds
+KPI_CACHE_SECONDS = 60
+
+# Retention analytics (patients/retention.py): how many first-visit month cohorts to show,
+# how many months after the first visit to track, and when a recommended follow-up
+# ultrasound counts as kept (due date from the exam's follow-up duration, or the default)
+RETENTION_COHORT_MONTHS = 12
+RETENTION_HORIZON_MONTHS = 6
+FOLLOW_UP_DEFAULT_DAYS = 180
+FOLLOW_UP_GRACE_DAYS = 30
+
+# In-memory analytics snapshot (patients/analytics_snapshot.py): how often each process
+# picks up rows changed elsewhere, in seconds, and how many changed rows per table it
+# applies incrementally before reloading everything instead
+ANALYTICS_SNAPSHOT_REFRESH_SECONDS = 30
+ANALYTICS_SNAPSHOT_MAX_CHANGES = 5000
+
 # Channels Configuration
 CHANNEL_LAYERS = {
     'default': {
@@ -13,4 +13,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ultrasound_clinic.settings')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application()
+
+from patients.db import enable_journal_mode_switch  # noqa: E402
+
+enable_journal_mode_switch() 
\ No newline at end of file